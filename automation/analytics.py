@@ -1,11 +1,14 @@
 import os
+import argparse
 import yaml
 import logging
 import utils.user as user
 import time
 from utils.utils import run_command_bash
+from utils.artifacts import ship
+from utils.ssh import sessions
 
-def analytics():
+def analytics(incremental=False):
 
     LOG_PATH = os.path.join("config", "analytics_log.log")
 
@@ -32,9 +35,15 @@ def analytics():
     user.KEY_PAIR = CONFIG["AWS_CREDENTIALS"]["KEY_PAIR"]
     user.KEY_PATH = CONFIG["AWS_CREDENTIALS"]["KEY_PATH"]
 
+    # Only copies the spark jobs if they changed since the last run
+    ship(CONFIG["MASTER"]["IP"], "ubuntu", "spark-jobs", "/home/ubuntu")
+    sessions.close_all()
+
     ANALYTICS_SCRIPT = "scripts/analytics/analytics.sh"
 
     analytics = ['/bin/bash', ANALYTICS_SCRIPT, user.KEY_PATH, CONFIG["MASTER"]["IP"], CONFIG["MONGO"]["IP"], CONFIG["MYSQL"]["IP"]]
+    if incremental:
+        analytics.append("incremental")
     
     run_command_bash(analytics)
     
@@ -47,4 +56,9 @@ def analytics():
 
 
 if __name__ == '__main__':
-    analytics()
\ No newline at end of file
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--incremental", action="store_true", help="Only process reviews added since the last incremental run")
+    args = parser.parse_args()
+
+    analytics(args.incremental)
\ No newline at end of file
@@ -1,9 +1,7 @@
 import yaml
 import logging
 import utils.user as user
-from utils.utils import del_security_group, terminate_instances
-
-# from utils.utils import 
+from utils.teardown import teardown, Progress
 
 def clean():
     # Set up logging
@@ -12,30 +10,42 @@ def clean():
 
     with open('config/config.yml') as file:
         CONFIG = yaml.load(file, Loader=yaml.FullLoader)
-        
+
+    if not CONFIG:
+        logging.info("Nothing to clean up")
+        return
+
     user.init()
     user.ACCESS_KEY = CONFIG["AWS_CREDENTIALS"]["ACCESS_KEY"]
     user.SECRET_KEY = CONFIG["AWS_CREDENTIALS"]["SECRET_KEY"]
     user.KEY_PAIR = CONFIG["AWS_CREDENTIALS"]["KEY_PAIR"]
     user.KEY_PATH = CONFIG["AWS_CREDENTIALS"]["KEY_PATH"]
-
-    # instance_ids = [CONFIG["MASTER"]["ID"], CONFIG["FLASK"]["ID"]]
-    instance_ids = [CONFIG["MASTER"]["ID"], CONFIG["FLASK"]["ID"], CONFIG["MYSQL"]["ID"], CONFIG["MONGO"]["ID"]]
-    for i in CONFIG["SLAVES"]:
+    user.REGION = CONFIG.get("REGION", "ap-southeast-1")
+    user.ENDPOINT_URL = CONFIG.get("ENDPOINT_URL")
+
+    # INSTANCE_IDS is written as soon as instances are launched, the role entries only once
+    # provisioning finished (and by main.py versions before INSTANCE_IDS)
+    instance_ids = list(CONFIG.get("INSTANCE_IDS", []))
+    for name in ["MASTER", "FLASK", "MYSQL", "MONGO"]:
+        if name in CONFIG:
+            instance_ids.append(CONFIG[name]["ID"])
+    for i in CONFIG.get("SLAVES", []) + CONFIG.get("MYSQL_REPLICAS", []) + CONFIG.get("MONGO_REPLICAS", []):
         instance_ids.append(i["ID"])
+    instance_ids = list(dict.fromkeys(instance_ids))
 
-    logging.info("Terminating instances...")
-    
-    terminate_instances(instance_ids)
-
-    logging.info("Deleting security groups...")
+    # Terminations and security group deletions run concurrently. Progress is kept in
+    # config/clean_progress.yml, so running clean.py again after a failure only retries what is left.
+    logging.info("Terminating instances and deleting security groups...")
+    progress = Progress()
 
-    for id in CONFIG["SECURITY_GROUPS"]:
-        del_security_group(id)
+    if not teardown(instance_ids, CONFIG.get("SECURITY_GROUPS", []), progress):
+        logging.error("Some resources could not be removed, run clean.py again to retry them")
+        return
 
     open('config/config.yml', 'w').close()
+    progress.clear()
 
     logging.info("Cleaned up!")
 
 if __name__ == '__main__':
-    clean()
\ No newline at end of file
+    clean()
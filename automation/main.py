@@ -10,12 +10,18 @@
 # OF ANY KIND, either express or implied. See the License for the specific
 # language governing permissions and limitations under the License. 
 
-from utils.utils import create_ec2_instance, create_security_group, execute_cmds_ssh, exists, execute_bg, run_command_bash
+from utils.utils import execute_cmds_ssh, execute_bg, run_command_bash
+from utils.provision import ConfigFile, provision
+from utils.dag import run_dag
+from utils.ssh import sessions
+from utils.readiness import wait_ready, wait_all, boot_marker, backoff, DEFAULT_DEADLINE
+from utils.cluster import configure_cluster
+from utils.artifacts import build_all, ship, ship_all
+from utils.replicas import configure_mysql_replication, configure_mongo_replica_set
 import logging
 import os
 import urllib.request
 import argparse
-import yaml
 import subprocess
 import time
 
@@ -40,16 +46,13 @@ def main():
     HADOOP_INSTANCE_TYPE='t2.medium'
     # @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
 
-    HADOOP_SCRIPT = os.path.join("scripts", "hadoop_script.sh")
-    FLASK_SCRIPT = os.path.join("scripts", "flask_script.sh")
-    SQL_SCRIPT = os.path.join("scripts", "sql_script.sh")
-    MONGO_SCRIPT = os.path.join("scripts", "mongo_script.sh")
-
-    HADOOP_CONFIG_SCRIPT = os.path.join("scripts", "{}nodesetup".format(user.NODES), "initialize_hadoop_setup.sh")
+    APP_DIR = "/50043_isit_database-master"
 
     CONFIG = dict()
     CONFIG["AWS_CREDENTIALS"] = {"ACCESS_KEY": user.ACCESS_KEY,"SECRET_KEY": user.SECRET_KEY, "KEY_PAIR": user.KEY_PAIR, "KEY_PATH": user.KEY_PATH}
     user.REGION = REGION
+    CONFIG["REGION"] = REGION
+    CONFIG["ENDPOINT_URL"] = user.ENDPOINT_URL
     LOG_PATH = os.path.join("config", "logs.log")
 
     # Set up logging
@@ -68,256 +71,157 @@ def main():
     logger.addHandler(ch)
 
     # *=================================================*
-    # *                     FLASK                       *
-    # *=================================================*
-
-    # Create security group for flask
-    flask_permissions = [{'IpProtocol': 'tcp',
-                            'FromPort': 22,
-                            'ToPort': 22,
-                            'IpRanges': [{'CidrIp': LOCAL_IP + '/32'}]},
-                            {'IpProtocol': 'tcp',
-                            'FromPort': 5000,
-                            'ToPort': 5000,
-                            'IpRanges': [{'CidrIp': '0.0.0.0/0'}]}]
-
-    flask_security_group = create_security_group("flask-webapp", flask_permissions)
-    CONFIG["SECURITY_GROUPS"] = [flask_security_group]
-
-    # Provision and launch the EC2 instance for flask
-    logger.info('Starting flask instance...')
-
-    flask_instance_info = create_ec2_instance(1, UBUNTU_AMI, INSTANCE_TYPE, ["flask-webapp"], FLASK_SCRIPT)[0]
-
-    if flask_instance_info is not None:
-        logger.info('Started ec2 instance for flask webapp')
-        logger.info(f'Launched EC2 Instance {flask_instance_info["InstanceId"]}')
-        logger.info(f'    VPC ID: {flask_instance_info["VpcId"]}')
-        logger.info(f'    Private IP Address: {flask_instance_info["PrivateIpAddress"]}')
-        logger.info(f'    Public IP Address: {flask_instance_info["PublicIpAddress"]}')
-        logger.info(f'    Current State: {flask_instance_info["State"]["Name"]}')
-    
-    print("====================================================================================")
-
-    CONFIG["FLASK"] = {"IP": flask_instance_info["PublicIpAddress"], "ID": flask_instance_info["InstanceId"],"DNS": flask_instance_info["PublicDnsName"]}
-
-
-    # *=================================================*
-    # *                     HADOOP                      *
-    # *=================================================*
-
-    # Create security group for hadoop/spark instances
-    hadoop_permissions = [{'IpProtocol': 'tcp',
-                            'FromPort': 0,
-                            'ToPort': 65535,
-                            'IpRanges': [{'CidrIp': '0.0.0.0/0'}]}]
-
-    hadoop_security_group = create_security_group("hadoop", hadoop_permissions)
-
-    CONFIG["SECURITY_GROUPS"].append(hadoop_security_group)
-
-    # Provision and launch the EC2 instances for hadoop/spark
-    logger.info('Starting hadoop namenodes and datanodes...')
-
-    hadoop_instance_info = create_ec2_instance(int(user.NODES), UBUNTU_AMI, HADOOP_INSTANCE_TYPE, ["hadoop"], HADOOP_SCRIPT)
-
-    if hadoop_instance_info is not None:
-        for node in range(int(user.NODES)):
-            logger.info(f'Launched hadoop instance {hadoop_instance_info[node]["InstanceId"]}')
-            logger.info(f'    VPC ID: {hadoop_instance_info[node]["VpcId"]}')
-            logger.info(f'    Private IP Address: {hadoop_instance_info[node]["PrivateIpAddress"]}')
-            logger.info(f'    Public IP Address: {hadoop_instance_info[node]["PublicIpAddress"]}')
-            logger.info(f'    Current State: {hadoop_instance_info[node]["State"]["Name"]}')
-    
-    print("====================================================================================")
-
-    CONFIG["MASTER"] = {"IP": hadoop_instance_info[0]["PublicIpAddress"], 
-                                "ID": hadoop_instance_info[0]["InstanceId"],
-                                "DNS": hadoop_instance_info[0]["PublicDnsName"]}
-    CONFIG["SLAVES"] = [{"IP": hadoop_instance_info[i]["PublicIpAddress"], 
-                                "ID": hadoop_instance_info[i]["InstanceId"],
-                                "DNS": hadoop_instance_info[i]["PublicDnsName"]} for i in range(1, int(user.NODES))]
-    
-    # *=================================================*
-    # *                     MYSQL                       *
+    # *                  PROVISIONING                   *
     # *=================================================*
 
-    # Create security group for mysql
-    sql_permissions = [{'IpProtocol': 'tcp',
-                            'FromPort': 22,
-                            'ToPort': 22,
-                            'IpRanges': [{'CidrIp': LOCAL_IP + '/32'}]}, # temporary, so that can ssh into it and check
-                            {'IpProtocol': 'tcp',
-                            'FromPort': 3306,
-                            'ToPort': 3306,
-                            'IpRanges': [{'CidrIp': CONFIG["FLASK"]["IP"] + '/32'},
-                                        {'CidrIp': LOCAL_IP + '/32'},
-                                        {'CidrIp': CONFIG["MASTER"]["IP"] + '/32'}]}]
-
-    sql_security_group = create_security_group("mysql-server", sql_permissions)
-
-    CONFIG["SECURITY_GROUPS"].append(sql_security_group)
-
-    # Provision and launch the EC2 instance for mysql
-    logger.info('Starting MySQL...')
-
-    sql_instance_info = create_ec2_instance(1,AMAZON_LINUX_AMI, INSTANCE_TYPE, ["mysql-server"], SQL_SCRIPT)[0]
-
-    if sql_instance_info is not None:
-        logger.info('Started ec2 instance for mysql server')
-        logger.info(f'Launched EC2 Instance {sql_instance_info["InstanceId"]}')
-        logger.info(f'    VPC ID: {sql_instance_info["VpcId"]}')
-        logger.info(f'    Private IP Address: {sql_instance_info["PrivateIpAddress"]}')
-        logger.info(f'    Public IP Address: {sql_instance_info["PublicIpAddress"]}')
-        logger.info(f'    Current State: {sql_instance_info["State"]["Name"]}')
-
-    print("====================================================================================")
-
-    CONFIG["MYSQL"] = {"IP": sql_instance_info["PublicIpAddress"], "ID": sql_instance_info["InstanceId"]}
-    
-
-    # *=================================================*
-    # *                     MONGO                       *
-    # *=================================================*
-    
-   # Create security group for mongo
-    mongo_permissions = [{'IpProtocol': 'tcp',
-                            'FromPort': 22,
-                            'ToPort': 22,
-                            'IpRanges': [{'CidrIp': LOCAL_IP + '/32'}]}, # temporary, so that can ssh into it and check
-                            {'IpProtocol': 'tcp',
-                            'FromPort': 27017,
-                            'ToPort': 27017,
-                            'IpRanges': [{'CidrIp': CONFIG["FLASK"]["IP"] + '/32'},
-                                        {'CidrIp': LOCAL_IP + '/32'},
-                                        {'CidrIp': CONFIG["MASTER"]["IP"] + '/32'}]}]
-        
-    mongo_security_group = create_security_group("mongo_db", mongo_permissions)
-
-    CONFIG["SECURITY_GROUPS"].append(mongo_security_group)
-
-    # Provision and launch EC2 instance for mongo
-    logger.info('Starting MongoDB...')
-
-    mongo_instance_info = create_ec2_instance(1, UBUNTU_AMI, INSTANCE_TYPE, ["mongo_db"], MONGO_SCRIPT)[0]
-
-    if mongo_instance_info is not None:
-        logger.info('Started ec2 instance for mongo db')
-        logger.info(f'Launched EC2 Instance {mongo_instance_info["InstanceId"]}')
-        logger.info(f'    VPC ID: {mongo_instance_info["VpcId"]}')
-        logger.info(f'    Private IP Address: {mongo_instance_info["PrivateIpAddress"]}')
-        logger.info(f'    Public IP Address: {mongo_instance_info["PublicIpAddress"]}')
-        logger.info(f'    Current State: {mongo_instance_info["State"]["Name"]}')
+    # The security groups and instances are written to config.yml as they are created (see
+    # utils/provision.py), the artifacts are packaged into the local cache while the instances boot
+    logger.info('Provisioning flask, hadoop, mysql and mongo instances...')
+    config_file = ConfigFile(CONFIG)
+    config_file.set("SECURITY_GROUPS", [])
+    config_file.set("INSTANCE_IDS", [])
+    provision(config_file, LOCAL_IP, UBUNTU_AMI, AMAZON_LINUX_AMI, INSTANCE_TYPE, HADOOP_INSTANCE_TYPE,
+              extra_tasks={"artifacts": (build_all, [])})
 
     print("====================================================================================")
 
-    CONFIG["MONGO"] = {"IP": mongo_instance_info["PublicIpAddress"], "ID": mongo_instance_info["InstanceId"]}
-
-    # Dump info to config.yml
-    with open('config/config.yml', 'w') as file:
-        documents = yaml.dump(CONFIG, file)
-
-
-
 
-    # *=================================================*
-    # *                 FLASK CONFIG                    *
-    # *=================================================*
-
-    logger.info("Setting up the flask webapp...")
-
-    # Check if script is finished
-    logger.info("Checking if flask is ready...")
-    indicator_file_path = "/var/lib/cloud/instances/%s/boot-finished" % (CONFIG["FLASK"]["ID"])
-    while True:
-        test = exists(indicator_file_path, CONFIG["FLASK"]["IP"], "ubuntu")
-        if test == "Failed":
-            print("Connection failed, retrying...")
-            continue
-        else:
-            break
-
-    # Create .env file for flask to connect to mongo/mysql
-    cmds = [
-        "sudo touch /50043_isit_database-master/server/.env && echo Created .env file",
-        """sudo tee -a /50043_isit_database-master/server/.env > /dev/null << EOT
-            SQL_DB=isit_database
-            SQL_USER=root
-            SQL_PW=password
-            SQL_HOST=%s
-            MONGO_DB=isit_database_mongo
-            LOG_DB=log_mongo
-            MONGO_HOST=%s""" % (CONFIG["MYSQL"]["IP"], CONFIG["MONGO"]["IP"])]
-    
-    logger.info("Setting .env for flask...")
-    while True:
-        test = execute_cmds_ssh(CONFIG["FLASK"]["IP"], "ubuntu", cmds)
-        if test == "Failed":
-            print("Connection failed, retrying...")
-            continue
-        else:
-            break
-    
-    # Run flask app in background (no hang up)
-    logger.info("Run flask in background...")
-    while True:
-        test = execute_bg(CONFIG["FLASK"]["IP"], "ubuntu", "sudo nohup python3 /50043_isit_database-master/server/app.py < /dev/null > /50043_isit_database-master/server/log.txt 2>&1 &")
-        if test == "Failed":
-            print("Connection failed, retrying...")
-            continue
-        else:
-            break
-    
-    print("====================================================================================")
 
-    logger.info("Web application is up!")
-    logger.info("MongoDB can be found at %s" % (CONFIG["MONGO"]["IP"]))
-    logger.info("MySQL database can be found at %s" % (CONFIG["MYSQL"]["IP"]))
-    logger.info("Flask server has started, please visit %s:5000/isit" % (CONFIG["FLASK"]["IP"]))
-    
-    print("====================================================================================")
 
     # *=================================================*
-    # *                 HADOOP CONFIG                   *
+    # *                 CONFIGURATION                   *
     # *=================================================*
 
-    # Check if hadoop/spark installed
-    logger.info("Wait for hadoop/spark to be installed...")
-    indicator_file_path = "/var/lib/cloud/instances/%s/boot-finished" % (CONFIG["MASTER"]["ID"])
-    while True:
-        test = exists(indicator_file_path, CONFIG["MASTER"]["IP"], "ubuntu")
-        if test == "Failed":
+    # Every host is polled concurrently (open port -> ssh login -> boot-finished marker) with
+    # exponential backoff, and each step starts as soon as the hosts it needs are ready.
+
+    def until_complete(fn, *args, deadline=DEFAULT_DEADLINE):
+        """Retries fn until it does not return "Failed"
+            Raises TimeoutError once deadline seconds have passed"""
+        start = time.time()
+        attempt = 0
+        while fn(*args) == "Failed":
+            elapsed = time.time() - start
+            if elapsed > deadline:
+                raise TimeoutError("%s still failing after %ds" % (fn.__name__, elapsed))
             print("Connection failed, retrying...")
-            continue
-        else:
-            break
-
-    # Call bash script to do config for hadoop/spark (set up passwordless ssh, start hdfs and spark processes)
-
-    # 2node: keypath, master dns, slave dns, slave ip
-    # 4node: keypath, master dns, slave1 dns, slave2 dns, slave3 dns, slave4 dns, slave1 ip, slave2 ip, slave3 ip, slave4 ip
-    logger.info("Hadoop/spark installed, now configuring namenodes/datanodes...")
-    prefix = ["/bin/bash", HADOOP_CONFIG_SCRIPT, CONFIG["AWS_CREDENTIALS"]["KEY_PATH"], CONFIG["MASTER"]["DNS"]]
-    slave_dns = [i["DNS"] for i in CONFIG["SLAVES"]]
-    slave_ip = [i["IP"] for i in CONFIG["SLAVES"]]
-    process_cmd = prefix + slave_dns + slave_ip
-
-    print(process_cmd)
-    time.sleep(60) # buffer time
-    run_command_bash(process_cmd)
-
-    logger.info("Hadoop/spark has started!")
+            time.sleep(min(backoff(attempt), max(deadline - elapsed, 0)))
+            attempt += 1
+
+    def flask_ready():
+        logger.info("Checking if flask is ready...")
+        return wait_ready(CONFIG["FLASK"]["IP"], "ubuntu", boot_marker(CONFIG["FLASK"]["ID"]))
+
+    def flask_app(waited, mysql_replication, mongo_replication):
+        logger.info("Setting up the flask webapp...")
+        ship(CONFIG["FLASK"]["IP"], "ubuntu", "app", APP_DIR)
+
+        # Install the python dependencies and build the frontend
+        cmds = [
+            "cd %s/server && touch log.txt && chmod a+rwx log.txt && sudo python3 -m pip install -r requirements.txt" % APP_DIR,
+            "cd %s/static && npm install && npx webpack --env.API_URL=http://%s:5000 --progress -p --mode=production --config webpack.config.js" % (APP_DIR, CONFIG["FLASK"]["IP"])]
+        logger.info("Installing flask dependencies and building the frontend...")
+        until_complete(execute_cmds_ssh, CONFIG["FLASK"]["IP"], "ubuntu", cmds)
+
+        # Create .env file for flask to connect to mongo/mysql
+        cmds = [
+            "sudo touch %s/server/.env && echo Created .env file" % APP_DIR,
+            """sudo tee -a %s/server/.env > /dev/null << EOT
+                SQL_DB=isit_database
+                SQL_USER=root
+                SQL_PW=password
+                SQL_HOST=%s
+                MONGO_DB=isit_database_mongo
+                LOG_DB=log_mongo
+                MONGO_HOST=%s
+                SQL_REPLICAS=%s
+                MONGO_REPLICAS=%s
+                MONGO_REPLICA_SET=rs0""" % (APP_DIR, CONFIG["MYSQL"]["IP"], CONFIG["MONGO"]["IP"],
+                                          ",".join(node["PRIVATE_IP"] for node in CONFIG["MYSQL_REPLICAS"]),
+                                          ",".join(node["PRIVATE_IP"] for node in CONFIG["MONGO_REPLICAS"]))]
+
+        logger.info("Setting .env for flask...")
+        until_complete(execute_cmds_ssh, CONFIG["FLASK"]["IP"], "ubuntu", cmds)
+
+        # Run flask app in background (no hang up)
+        logger.info("Run flask in background...")
+        until_complete(execute_bg, CONFIG["FLASK"]["IP"], "ubuntu", "sudo nohup python3 %s/server/app.py < /dev/null > %s/server/log.txt 2>&1 &" % (APP_DIR, APP_DIR))
+
+        logger.info("Web application is up!")
+        logger.info("Flask server has started, please visit %s:5000/isit" % (CONFIG["FLASK"]["IP"]))
+
+    def mysql_ready():
+        logger.info("Waiting for mysql to load the reviews...")
+        nodes = [CONFIG["MYSQL"]] + CONFIG["MYSQL_REPLICAS"]
+        return wait_all([(node["IP"], "ec2-user", boot_marker(node["ID"])) for node in nodes])
+
+    def mysql_replication(waited):
+        configure_mysql_replication(CONFIG["MYSQL"], CONFIG["MYSQL_REPLICAS"])
+
+    def mongo_ready():
+        logger.info("Waiting for mongo to load the metadata...")
+        nodes = [CONFIG["MONGO"]] + CONFIG["MONGO_REPLICAS"]
+        return wait_all([(node["IP"], "ubuntu", boot_marker(node["ID"])) for node in nodes])
+
+    def mongo_replication(waited):
+        configure_mongo_replica_set(CONFIG["MONGO"], CONFIG["MONGO_REPLICAS"])
+
+    def load_data(host, user, target, source, artifacts):
+        # Ship the loader and dataset (unless the instance has them already) and load it in parallel chunks
+        home = "/home/%s" % user
+        ship_all([(host, user, name, home) for name in ["loader"] + artifacts])
+        logger.info("Loading %s into %s..." % (source, target))
+        exit_status, stdout, stderr = sessions.run(host, user, "cd /home/%s && python3 loader.py %s %s" % (user, target, source))
+        print(stdout)
+        if exit_status != 0:
+            raise RuntimeError("Loading %s failed (rerun loader.py on %s to resume): %s" % (source, host, stderr))
+
+    def mysql_data(waited):
+        load_data(CONFIG["MYSQL"]["IP"], "ec2-user", "mysql", "kindle_reviews.csv", ["kindle-reviews"])
+
+    def mongo_data(waited):
+        load_data(CONFIG["MONGO"]["IP"], "ubuntu", "mongo", "meta_Kindle_Store.json", ["kindle-metadata", "categories"])
+        exit_status, stdout, stderr = sessions.run(CONFIG["MONGO"]["IP"], "ubuntu", "mongoimport -d isit_database_mongo -c categories --drop --file /home/ubuntu/categories.json --authenticationDatabase admin --username 'admin' --password 'password'")
+        if exit_status != 0:
+            raise RuntimeError("Importing categories.json failed on %s: %s" % (CONFIG["MONGO"]["IP"], stderr))
+
+    def hadoop_ready():
+        # Check if hadoop/spark installed on every node
+        logger.info("Wait for hadoop/spark to be installed...")
+        nodes = [CONFIG["MASTER"]] + CONFIG["SLAVES"]
+        return wait_all([(node["IP"], "ubuntu", boot_marker(node["ID"])) for node in nodes])
+
+    def hadoop_config(waited):
+        # Render the hadoop/spark config for the namenode and every datanode, push it over ssh
+        # (all datanodes at once), set up passwordless ssh and start hdfs and spark processes
+        logger.info("Hadoop/spark installed, now configuring namenodes/datanodes...")
+        configure_cluster(CONFIG["MASTER"], CONFIG["SLAVES"])
+        logger.info("Hadoop/spark has started!")
+
+    def run_analytics(hadoop, mysql, mongo):
+        logger.info("Running analytics...")
+        ship(CONFIG["MASTER"]["IP"], "ubuntu", "spark-jobs", "/home/ubuntu")
+        ANALYTICS_SCRIPT = "scripts/analytics/analytics.sh"
+        analytics = ['/bin/bash', ANALYTICS_SCRIPT, CONFIG["AWS_CREDENTIALS"]["KEY_PATH"], CONFIG["MASTER"]["IP"], CONFIG["MONGO"]["IP"], CONFIG["MYSQL"]["IP"]]
+        run_command_bash(analytics)
+
+    run_dag({
+        "flask_ready": (flask_ready, []),
+        "flask_app": (flask_app, ["flask_ready", "mysql_replication", "mongo_replication"]),
+        "mysql_ready": (mysql_ready, []),
+        "mongo_ready": (mongo_ready, []),
+        # replication is set up before loading, the replicas receive the data from their primary
+        "mysql_replication": (mysql_replication, ["mysql_ready"]),
+        "mongo_replication": (mongo_replication, ["mongo_ready"]),
+        "hadoop_ready": (hadoop_ready, []),
+        "hadoop_config": (hadoop_config, ["hadoop_ready"]),
+        "mysql_data": (mysql_data, ["mysql_replication"]),
+        "mongo_data": (mongo_data, ["mongo_replication"]),
+        "analytics": (run_analytics, ["hadoop_config", "mysql_data", "mongo_data"]),
+    })
 
     print("====================================================================================")
 
-    logger.info("Running analytics...")
-
-    time.sleep(5) # buffer times
-    ANALYTICS_SCRIPT = "scripts/analytics/analytics.sh"
-    analytics = ['/bin/bash', ANALYTICS_SCRIPT, CONFIG["AWS_CREDENTIALS"]["KEY_PATH"], CONFIG["MASTER"]["IP"], CONFIG["MONGO"]["IP"], CONFIG["MYSQL"]["IP"]]
-
-    run_command_bash(analytics)
-
     logger.info("MongoDB can be found at %s" % (CONFIG["MONGO"]["IP"]))
     logger.info("MySQL database can be found at %s" % (CONFIG["MYSQL"]["IP"]))
     logger.info("Flask server: %s:5000/isit" % (CONFIG["FLASK"]["IP"]))
@@ -328,6 +232,10 @@ def main():
     logger.info("The output of tfidf can be found at /tfidf directory in hdfs")
     logger.info("For more information, visit https://github.com/andrehadianto/50043_isit_database/tree/develop/#2-tf-idf")
 
+    for host, stats in sessions.latency().items():
+        logger.info("ssh %s: %d commands, mean %.2fs, max %.2fs" % (host, stats["count"], stats["mean"], stats["max"]))
+    sessions.close_all()
+
 if __name__ == '__main__':
 
     parser = argparse.ArgumentParser()
@@ -335,8 +243,14 @@ if __name__ == '__main__':
     parser.add_argument("secret", help="Your secret access key")
     parser.add_argument("keypair", help="AWS key pair")
     parser.add_argument("keypath", help="Absolute path of your .pem file")
-    parser.add_argument("nodes", help="Number of datanodes to spin up", type=int, choices=[2,4,8])
+    parser.add_argument("nodes", help="Number of datanodes to spin up", type=int)
+    parser.add_argument("--replicas", help="Number of read replicas per database (MySQL and Mongo)", type=int, default=0)
+    parser.add_argument("--endpoint-url", help="EC2 endpoint, e.g. a local AWS API stand-in such as a moto server")
     args = parser.parse_args()
+    if args.nodes < 2:
+        parser.error("nodes must be at least 2 (the namenode and one datanode)")
+    if args.replicas < 0:
+        parser.error("replicas cannot be negative")
 
     # Set up variables
     user.init()
@@ -345,5 +259,7 @@ if __name__ == '__main__':
     user.KEY_PAIR = args.keypair
     user.KEY_PATH = args.keypath
     user.NODES = args.nodes
+    user.REPLICAS = args.replicas
+    user.ENDPOINT_URL = args.endpoint_url
 
     main()
\ No newline at end of file
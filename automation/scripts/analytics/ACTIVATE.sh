@@ -1,31 +1,28 @@
 #!/usr/bin/env bash
 
-echo "Putting stuff on hdfs..."
-/home/ubuntu/server/hadoop-2.8.5/bin/hadoop fs -mkdir /data
-/home/ubuntu/server/hadoop-2.8.5/bin/hadoop fs -rm /data/kindle.csv
-/home/ubuntu/server/hadoop-2.8.5/bin/hadoop fs -rm /data/meta.json
-/home/ubuntu/server/hadoop-2.8.5/bin/hadoop fs -put /home/ubuntu/meta.json /data/meta.json
-/home/ubuntu/server/hadoop-2.8.5/bin/hadoop fs -put /home/ubuntu/kindle.csv /data/kindle.csv
+# $1 (optional) "incremental": only process the reviews in /data/kindle_delta.parquet
 
-# install the spark scripts
-echo "Getting spark scripts..."
-rm correlation.py tfidf.py
-wget -c https://www.dropbox.com/s/1awdag53ph7uj8s/correlation.py?dl=0 -O correlation.py
-wget -c https://www.dropbox.com/s/ml3k2ytb5dvj44g/tfidf.py?dl=0 -O tfidf.py
+MASTER_IP=$(curl ifconfig.co)
+export MASTER_IP
+echo $MASTER_IP
 
 # run the spark scripts
 echo "Running spark scripts..."
 /home/ubuntu/server/hadoop-2.8.5/bin/hadoop fs -rm -r /corr
-/home/ubuntu/server/hadoop-2.8.5/bin/hadoop fs -rm -r /tfidf
-
-MASTER_IP=$(curl ifconfig.co)
-export MASTER_IP
-echo $MASTER_IP
+if [ "$1" == "incremental" ]; then
+    # /tfidf is appended to, the state under /state is merged with the new reviews
+    CORR_ARGS="--incremental --reviews hdfs://$MASTER_IP:9000/data/kindle_delta.parquet"
+    TFIDF_ARGS="--incremental --input hdfs://$MASTER_IP:9000/data/kindle_delta.parquet"
+else
+    # the incremental tfidf state does not describe the rows written by a full run, the next
+    # incremental run starts over from all the reviews and replaces /tfidf
+    /home/ubuntu/server/hadoop-2.8.5/bin/hadoop fs -rm -r /tfidf /state/tfidf
+fi
 
 echo "===========================GETTING TFIDF====================================="
-/usr/lib/spark/bin/spark-submit --master spark://$MASTER_IP:7077 tfidf.py $MASTER_IP
+/usr/lib/spark/bin/spark-submit --master spark://$MASTER_IP:7077 tfidf.py $MASTER_IP $TFIDF_ARGS
 
 echo "========================GETTING CORRELATION=================================="
-/usr/lib/spark/bin/spark-submit --master spark://$MASTER_IP:7077 correlation.py $MASTER_IP
+/usr/lib/spark/bin/spark-submit --master spark://$MASTER_IP:7077 correlation.py $MASTER_IP $CORR_ARGS
 
-echo "=============================COMPLETE========================================"
\ No newline at end of file
+echo "=============================COMPLETE========================================"
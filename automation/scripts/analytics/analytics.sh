@@ -1,16 +1,17 @@
 #!/usr/bin/env bash
 
-# $1 key path, $2 namenode dns, $3 mongo ip, $4 mysql ip
+# $1 key path, $2 namenode dns, $3 mongo ip, $4 mysql ip, $5 (optional) "incremental"
 
-ssh -o StrictHostKeyChecking=no -i $1 ubuntu@$2 "rm /home/ubuntu/meta.json /home/ubuntu/kindle_reviews.tsv /home/ubuntu/kindle.csv"
-echo "Getting kindle_metadata from mongo..."
+if [ "$5" == "incremental" ]; then
+    EXTRACT_ARGS="--incremental --state hdfs://$2:9000/state"
+fi
 
-ssh -o StrictHostKeyChecking=no -i $1 ubuntu@$2 "mongoexport --uri=mongodb://admin:password@$3:27017/isit_database_mongo?authSource=admin --collection=kindle_metadata --out=/home/ubuntu/meta.json"
+# the in-repo spark jobs and ACTIVATE.sh are shipped to /home/ubuntu beforehand
+# as the spark-jobs artifact (utils/artifacts.py)
 
-echo "Getting kindle_reviews from sql..."
-ssh -o StrictHostKeyChecking=no -i $1 ubuntu@$2 "mysql -u root -ppassword -h $4 --batch --raw -e 'select id, asin, reviewText FROM isit_database.kindle_reviews' > /home/ubuntu/kindle_reviews.tsv"
-ssh -o StrictHostKeyChecking=no -i $1 ubuntu@$2 "tr '\t' ',' < /home/ubuntu/kindle_reviews.tsv > /home/ubuntu/kindle.csv"
+# kindle_reviews and kindle_metadata are read in parallel chunks and streamed into hdfs as parquet
+echo "Extracting kindle_reviews and kindle_metadata into hdfs..."
+ssh -o StrictHostKeyChecking=no -i $1 ubuntu@$2 "/home/ubuntu/server/hadoop-2.8.5/bin/hadoop fs -mkdir -p /data"
+ssh -o StrictHostKeyChecking=no -i $1 ubuntu@$2 "export HADOOP_HOME=/home/ubuntu/server/hadoop-2.8.5 JAVA_HOME=/usr/lib/jvm/java-8-openjdk-amd64 && CLASSPATH=\$(\$HADOOP_HOME/bin/hadoop classpath --glob) python3 /home/ubuntu/extract.py $4 $3 hdfs://$2:9000/data $EXTRACT_ARGS"
 
-scp -o StrictHostKeyChecking=no -i $1 "scripts/analytics/ACTIVATE.sh"  ubuntu@$2:/home/ubuntu/ACTIVATE.sh
-ssh -o StrictHostKeyChecking=no -i $1 ubuntu@$2 "chmod +x /home/ubuntu/ACTIVATE.sh"
-ssh -o StrictHostKeyChecking=no -i $1 ubuntu@$2 "/bin/bash /home/ubuntu/ACTIVATE.sh"
\ No newline at end of file
+ssh -o StrictHostKeyChecking=no -i $1 ubuntu@$2 "/bin/bash /home/ubuntu/ACTIVATE.sh $5"
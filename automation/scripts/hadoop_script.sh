@@ -60,7 +60,9 @@ pip3 install pyspark --no-cache-dir
 sleep 1 
 pip3 install pymongo --no-cache-dir
 sleep 1 
-pip3 install numpy --no-cache-dir
+pip3 install numpy scipy --no-cache-dir
+sleep 1 
+pip3 install pyarrow mysql-connector-python --no-cache-dir
 sleep 1 
 # install sbt
 echo "deb https://dl.bintray.com/sbt/debian /" | sudo tee -a /etc/apt/sources.list.d/sbt.list
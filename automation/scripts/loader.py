@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+# Loads the kindle datasets into the databases in parallel chunks. Copied to the database
+# instances and run there by main.py once the datasets are downloaded.
+#
+# kindle_reviews.csv is split into chunk files that are loaded over several MySQL connections
+# with LOAD DATA; the secondary indexes are only built once all rows are in.
+# meta_Kindle_Store.json is split into line ranges that worker processes parse and insert with
+# unordered insert_many.
+# Finished chunks are recorded in a checkpoint file, so running the same command again after
+# a failure only loads what is missing.
+#
+# to run
+#   python3 loader.py mysql kindle_reviews.csv --workers 8
+#   python3 loader.py mongo meta_Kindle_Store.json --workers 4
+
+import argparse
+import ast
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
+
+csv.field_size_limit(sys.maxsize)
+
+REVIEWS_TABLE = """CREATE TABLE IF NOT EXISTS kindle_reviews(
+`id` INT(11) NOT NULL AUTO_INCREMENT,
+`asin` VARCHAR(255) NOT NULL,
+`helpful` VARCHAR(255) NOT NULL,
+`overall` INT(11) NOT NULL,
+`reviewText` TEXT NOT NULL,
+`reviewTime` VARCHAR(255) NOT NULL,
+`reviewerID` VARCHAR(255) NOT NULL,
+`reviewerName` VARCHAR(255) NOT NULL,
+`summary` VARCHAR(255) NOT NULL,
+`unixReviewTime` INT(11) NOT NULL,
+{},PRIMARY KEY (`id`))"""
+
+# helpful is the string "[yes, total]", these numeric copies are kept up to date by mysql on every write
+HELPFUL_COLUMNS = {
+    "helpful_yes": "INT UNSIGNED AS (CAST(TRIM(SUBSTRING_INDEX(SUBSTRING_INDEX(helpful, ',', 1), '[', -1)) AS UNSIGNED)) STORED",
+    "helpful_total": "INT UNSIGNED AS (CAST(TRIM(SUBSTRING_INDEX(SUBSTRING_INDEX(helpful, ']', 1), ',', -1)) AS UNSIGNED)) STORED",
+}
+REVIEWS_TABLE = REVIEWS_TABLE.format(",\n".join("`%s` %s" % column for column in HELPFUL_COLUMNS.items()))
+
+# built after the load, maintaining them row by row during the load is much slower
+# the (asin, ...) ones serve the sorted review pages of a book straight from the index
+REVIEWS_INDEXES = {"idx_asin_time": "asin, unixReviewTime", "idx_asin_helpful": "asin, helpful_yes",
+                   "idx_asin_overall": "asin, overall",
+                   # reviewer history pages and summaries (overall makes the summary index only)
+                   "idx_reviewer_time": "reviewerID, unixReviewTime, overall"}
+META_INDEXES = ["asin"]
+
+# the chunks are re-serialized with the csv module (quotes doubled, backslashes kept as is)
+LOAD_CHUNK = """LOAD DATA LOCAL INFILE %s REPLACE INTO TABLE kindle_reviews
+FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"' ESCAPED BY ''
+LINES TERMINATED BY '\\n'
+(id, asin, helpful, overall, reviewText, reviewTime, reviewerID, reviewerName, summary, unixReviewTime)"""
+
+
+class Checkpoint:
+    """Chunks already loaded for one source file, kept in a json file next to it"""
+
+    def __init__(self, path, source, chunk_rows):
+        self.path = path
+        self._lock = threading.Lock()
+        self.state = {"source": os.path.abspath(source), "chunk_rows": chunk_rows, "done": {}, "started": []}
+        if os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            if saved["source"] == self.state["source"] and saved["chunk_rows"] == chunk_rows:
+                self.state = saved
+            else:
+                print("Checkpoint %s is for another source or chunk size, starting over" % path)
+
+    def is_done(self, index):
+        return str(index) in self.state["done"]
+
+    def was_started(self, index):
+        return index in self.state["started"]
+
+    def _save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.path)
+
+    def start(self, index):
+        with self._lock:
+            if index not in self.state["started"]:
+                self.state["started"].append(index)
+                self._save()
+
+    def finish(self, index, rows):
+        with self._lock:
+            self.state["done"][str(index)] = rows
+            self._save()
+
+    def rows_done(self):
+        return sum(self.state["done"].values())
+
+
+class Progress:
+    """Prints rows/s as chunks finish"""
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = 0
+        self.start = time.time()
+
+    def add(self, index, rows):
+        self.rows += rows
+        elapsed = time.time() - self.start
+        print("%s: chunk %d loaded %d rows, %d rows in %.1fs (%.0f rows/s)"
+              % (self.name, index, rows, self.rows, elapsed, self.rows / max(elapsed, 1e-9)))
+        sys.stdout.flush()
+
+    def summary(self):
+        elapsed = time.time() - self.start
+        print("%s: loaded %d rows in %.1fs (%.0f rows/s)" % (self.name, self.rows, elapsed, self.rows / max(elapsed, 1e-9)))
+
+
+# ================
+# MySQL
+# ================
+
+def mysql_connect(args, database=None):
+    import mysql.connector
+    return mysql.connector.connect(host=args.host, user=args.user, password=args.password,
+                                   database=database, allow_local_infile=True)
+
+
+def split_csv(path, chunk_rows, chunk_dir, checkpoint):
+    """Yields (index, chunk path, rows) of the chunks not loaded yet, writing each chunk file as it goes
+    The csv module is used to find record boundaries, review texts can span several lines"""
+    os.makedirs(chunk_dir, exist_ok=True)
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        next(reader)
+        index = 0
+        rows = []
+        for row in reader:
+            rows.append(row)
+            if len(rows) == chunk_rows:
+                yield from write_chunk(index, rows, chunk_dir, checkpoint)
+                index += 1
+                rows = []
+        if rows:
+            yield from write_chunk(index, rows, chunk_dir, checkpoint)
+
+
+def write_chunk(index, rows, chunk_dir, checkpoint):
+    if checkpoint.is_done(index):
+        return
+    chunk_path = os.path.join(chunk_dir, "reviews_%05d.csv" % index)
+    with open(chunk_path, "w", newline="", encoding="utf-8") as f:
+        csv.writer(f, lineterminator="\n").writerows(rows)
+    yield index, chunk_path, len(rows)
+
+
+def load_reviews_chunk(args, chunk_path):
+    conn = mysql_connect(args, args.database)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SET unique_checks=0")
+        cursor.execute("SET foreign_key_checks=0")
+        # keeps the review with id 0
+        cursor.execute("SET sql_mode='NO_AUTO_VALUE_ON_ZERO'")
+        # each LOAD DATA is one transaction, and REPLACE makes loading a chunk twice harmless
+        cursor.execute(LOAD_CHUNK, (chunk_path,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def add_helpful_columns(args):
+    """Adds (and backfills) the helpful columns of a table created before they existed"""
+    conn = mysql_connect(args, args.database)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT column_name FROM information_schema.columns "
+                       "WHERE table_schema=%s AND table_name='kindle_reviews'", (args.database,))
+        existing = {row[0] for row in cursor.fetchall()}
+        missing = ["ADD COLUMN `%s` %s" % column for column in HELPFUL_COLUMNS.items() if column[0] not in existing]
+        if missing:
+            start = time.time()
+            cursor.execute("ALTER TABLE kindle_reviews " + ", ".join(missing))
+            print("Added %s in %.1fs" % (", ".join(missing), time.time() - start))
+    finally:
+        conn.close()
+
+
+def add_reviews_indexes(args):
+    conn = mysql_connect(args, args.database)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT DISTINCT index_name FROM information_schema.statistics "
+                       "WHERE table_schema=%s AND table_name='kindle_reviews'", (args.database,))
+        existing = {row[0] for row in cursor.fetchall()}
+        missing = ["ADD INDEX %s (%s)" % (name, column) for name, column in REVIEWS_INDEXES.items() if name not in existing]
+        if missing:
+            start = time.time()
+            cursor.execute("ALTER TABLE kindle_reviews " + ", ".join(missing))
+            print("Built indexes %s in %.1fs" % (", ".join(missing), time.time() - start))
+    finally:
+        conn.close()
+
+
+def load_reviews(args):
+    conn = mysql_connect(args)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("CREATE DATABASE IF NOT EXISTS %s" % args.database)
+        cursor.execute("USE %s" % args.database)
+        cursor.execute(REVIEWS_TABLE)
+    finally:
+        conn.close()
+    add_helpful_columns(args)
+
+    checkpoint = Checkpoint(args.checkpoint or args.source + ".checkpoint", args.source, args.chunk_rows)
+    progress = Progress("kindle_reviews")
+    chunk_dir = args.source + ".chunks"
+
+    def finished(done):
+        for future in done:
+            index, chunk_path, rows = futures.pop(future)
+            future.result()
+            checkpoint.finish(index, rows)
+            os.remove(chunk_path)
+            progress.add(index, rows)
+
+    futures = {}
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        for chunk in split_csv(args.source, args.chunk_rows, chunk_dir, checkpoint):
+            futures[pool.submit(load_reviews_chunk, args, chunk[1])] = chunk
+            # keeps at most two chunk files per connection on disk
+            if len(futures) >= 2 * args.workers:
+                finished(wait(futures, return_when=FIRST_COMPLETED).done)
+        finished(list(futures))
+
+    progress.summary()
+    add_reviews_indexes(args)
+    print("kindle_reviews: %d rows in total" % checkpoint.rows_done())
+
+
+# ================
+# Mongo
+# ================
+
+def mongo_uri(args):
+    if args.user:
+        return "mongodb://%s:%s@%s:27017/?authSource=admin" % (args.user, args.password, args.host)
+    return "mongodb://%s:27017/" % args.host
+
+
+def line_ranges(path, chunk_rows):
+    """Returns [(index, start offset, end offset)] splitting the file every chunk_rows lines"""
+    ranges = []
+    start = 0
+    offset = 0
+    lines = 0
+    with open(path, "rb") as f:
+        for line in f:
+            offset += len(line)
+            lines += 1
+            if lines == chunk_rows:
+                ranges.append((len(ranges), start, offset))
+                start = offset
+                lines = 0
+    if lines:
+        ranges.append((len(ranges), start, offset))
+    return ranges
+
+
+def parse_document(line):
+    # the metadata dump is one python dict literal per line, not strict json
+    try:
+        return json.loads(line)
+    except ValueError:
+        return ast.literal_eval(line)
+
+
+def load_meta_chunk(uri, database, path, start, end, resumed):
+    """Parses and inserts one line range, returns the number of documents inserted"""
+    from pymongo import MongoClient
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start).decode("utf-8")
+    docs = [parse_document(line) for line in data.splitlines() if line.strip()]
+    client = MongoClient(uri)
+    try:
+        collection = client[database].kindle_metadata
+        if resumed:
+            # the chunk may have been partly inserted before the loader stopped
+            collection.delete_many({"asin": {"$in": [doc.get("asin") for doc in docs]}})
+        if docs:
+            collection.insert_many(docs, ordered=False)
+        return len(docs)
+    finally:
+        client.close()
+
+
+def load_metadata(args):
+    from pymongo import MongoClient
+    uri = mongo_uri(args)
+    checkpoint = Checkpoint(args.checkpoint or args.source + ".checkpoint", args.source, args.chunk_rows)
+    progress = Progress("kindle_metadata")
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {}
+        for index, start, end in line_ranges(args.source, args.chunk_rows):
+            if checkpoint.is_done(index):
+                continue
+            resumed = checkpoint.was_started(index)
+            checkpoint.start(index)
+            futures[pool.submit(load_meta_chunk, uri, args.database, args.source, start, end, resumed)] = index
+        for future in as_completed(futures):
+            index = futures[future]
+            rows = future.result()
+            checkpoint.finish(index, rows)
+            progress.add(index, rows)
+
+    progress.summary()
+    client = MongoClient(uri)
+    try:
+        for field in META_INDEXES:
+            client[args.database].kindle_metadata.create_index(field)
+    finally:
+        client.close()
+    print("kindle_metadata: %d documents in total" % checkpoint.rows_done())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="target")
+    subparsers.required = True
+
+    mysql_parser = subparsers.add_parser("mysql", help="Load the reviews csv into MySQL")
+    mysql_parser.add_argument("--database", default="isit_database")
+    mysql_parser.add_argument("--user", default="root")
+    mysql_parser.add_argument("--password", default="password")
+    mysql_parser.add_argument("--chunk-rows", type=int, default=50000, help="Rows per chunk")
+    mysql_parser.set_defaults(load=load_reviews)
+
+    mongo_parser = subparsers.add_parser("mongo", help="Load the metadata json into Mongo")
+    mongo_parser.add_argument("--database", default="isit_database_mongo")
+    mongo_parser.add_argument("--user", default="admin")
+    mongo_parser.add_argument("--password", default="password")
+    mongo_parser.add_argument("--chunk-rows", type=int, default=20000, help="Rows per chunk")
+    mongo_parser.set_defaults(load=load_metadata)
+
+    for sub in (mysql_parser, mongo_parser):
+        sub.add_argument("source", help="Path of the dataset")
+        sub.add_argument("--host", default="localhost")
+        sub.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Parallel connections/processes")
+        sub.add_argument("--checkpoint", help="Checkpoint file, defaults to <source>.checkpoint")
+    args = parser.parse_args()
+
+    args.load(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -13,18 +13,9 @@ echo "=== Running Set Up for Mongo Instance === "
     echo "ERROR: installing mongodb"
 }
 
-# download data
-{
-    wget -c wget -c https://istd50043.s3-ap-southeast-1.amazonaws.com/meta_kindle_store.zip -O meta_kindle_store.zip -O meta_kindle_store.zip
-    sudo apt install unzip
-    unzip meta_kindle_store.zip
-    rm -rf *.zip
-    wget -c https://www.dropbox.com/s/7r3ajphm9vytn2b/categories.json?dl=0 -O categories.json
-    wget -c https://www.dropbox.com/s/5tn7fuh7czfbjya/setupmongo.js?dl=0 -O setupmongo.js
-} || {
-    # catch
-    echo "ERROR: downloading data"
-}
+# python for scripts/loader.py, which main.py runs to load the metadata once this script has finished
+sudo apt-get install -y python3-pip
+pip3 install pymongo
 
 {
     sudo service mongod start
@@ -37,7 +28,7 @@ echo "=== Running Set Up for Mongo Instance === "
 
 while :
 do
-    if mongo localhost:27017/admin --eval 'db.createUser({ user: "admin", pwd: "password", roles: [ { role: "userAdminAnyDatabase", db: "admin" }, "readWriteAnyDatabase" ]})' ; then
+    if mongo localhost:27017/admin --eval 'db.createUser({ user: "admin", pwd: "password", roles: [ { role: "userAdminAnyDatabase", db: "admin" }, "readWriteAnyDatabase", { role: "clusterAdmin", db: "admin" } ]})' ; then
         break
     else
         echo "Command failed, retrying..."
@@ -50,13 +41,7 @@ sudo sed -i "s,\\(^[[:blank:]]*bindIp:\\) .*,\\1 0.0.0.0," /etc/mongod.conf
 sudo sh -c 'echo "security:\n  authorization : enabled" >> /etc/mongod.conf'
 sudo service mongod restart
 
-# import dataset
-{
-    echo "Importing dataset"
-    mongoimport -d isit_database_mongo -c kindle_metadata --file meta_Kindle_Store.json --authenticationDatabase admin --username 'admin' --password 'password' --legacy
-    mongoimport -d isit_database_mongo -c categories --drop --file categories.json --authenticationDatabase admin --username 'admin' --password 'password'
-} || {
-    echo "ERROR: importing data to mongo"
-}
+# meta_Kindle_Store.json and categories.json are shipped from the local artifact cache and
+# imported by main.py (utils/artifacts.py, scripts/loader.py)
 
 echo "=== Finished Set Up for Mongo Instance === "
\ No newline at end of file
@@ -20,27 +20,10 @@ mysql -u root -ppassword -e "FLUSH PRIVILEGES"
 service mysqld restart
 chkconfig mysqld on
 
-# Download dataset
-wget -c wget -c https://istd50043.s3-ap-southeast-1.amazonaws.com/kindle-reviews.zip -O kindle-reviews.zip -O kindle-reviews.zip
-unzip kindle-reviews.zip
-rm -rf kindle_reviews.json
-
-# Load csv into database
-mysql -u root -ppassword <<'EOF'
-CREATE SCHEMA isit_database;
-CREATE TABLE isit_database.kindle_reviews(
-`id` INT(11) NOT NULL AUTO_INCREMENT,
-`asin` VARCHAR(255) NOT NULL,
-`helpful` VARCHAR(255) NOT NULL,
-`overall` INT(11) NOT NULL,
-`reviewText` TEXT NOT NULL,
-`reviewTime` VARCHAR(255) NOT NULL,
-`reviewerID` VARCHAR(255) NOT NULL,
-`reviewerName` VARCHAR(255) NOT NULL,
-`summary` VARCHAR(255) NOT NULL,
-`unixReviewTime` INT(11) NOT NULL,PRIMARY KEY (`id`));
-SET sql_mode='NO_AUTO_VALUE_ON_ZERO';
-LOAD DATA LOCAL INFILE 'kindle_reviews.csv' INTO TABLE isit_database.kindle_reviews FIELDS TERMINATED BY ',' ENCLOSED BY '"' LINES TERMINATED BY '\n' IGNORE 1 ROWS;
-EOF
+# Python for scripts/loader.py, which main.py runs once this script has finished
+yum install -y python36 python36-pip
+pip-3.6 install mysql-connector-python
+
+# kindle_reviews.csv is shipped from the local artifact cache by main.py (utils/artifacts.py)
 
 touch /home/ec2-user/script-finished.txt
\ No newline at end of file
@@ -0,0 +1,263 @@
+import argparse
+import json
+import os
+import time
+import urllib.request
+from datetime import datetime
+from pyspark.sql import SparkSession
+from pyspark.sql import functions as F
+import correlation
+import embedded
+import tfidf
+from sources import read_table, default_input
+
+# Sizes the analytics jobs on a single machine before paying for a cluster.
+# to run
+# scale the sample data 10x:
+#   python bench.py scale --factor 10 --output /tmp/kindle_x10
+# run every job at 1..4 cores on the sample data scaled 1x, 4x and 16x:
+#   python bench.py run --max-cores 4 --sizes 1,4,16 --report bench.json
+# compare Spark local mode with the in-process NumPy engine (embedded.py) at each size:
+#   python bench.py run --engines spark,embedded --sizes 1,4,16,64
+
+JOBS = ["corr", "tfidf"]
+ENGINES = ["spark", "embedded"]
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%f%Z"
+
+
+def session(master, name):
+    return SparkSession.builder.master(master).appName(name) \
+        .config("spark.ui.showConsoleProgress", "false") \
+        .getOrCreate()
+
+
+# ================
+# Data scaler
+# ================
+
+def scale(reviews_df, meta_df, factor):
+    """Returns the datasets grown (factor > 1) or sampled (factor < 1)
+    Every copy gets new review ids and suffixed asins, so the number of books grows with
+    the number of reviews and the group-bys/joins scale like the real data would"""
+    if factor < 1:
+        return reviews_df.sample(fraction=factor, seed=42), meta_df
+    copies = int(factor)
+    spark = reviews_df.sql_ctx.sparkSession
+    reviews_df = reviews_df.withColumn("id", F.col("id").cast("long"))
+    id_span = reviews_df.agg(F.max("id")).first()[0] + 1
+    copy = spark.range(copies).withColumnRenamed("id", "copy")
+
+    def suffixed(asin):
+        return F.when(F.col("copy") == 0, asin).otherwise(F.concat(asin, F.lit("_"), F.col("copy").cast("string")))
+
+    reviews_df = reviews_df.crossJoin(copy) \
+        .withColumn("id", F.col("id") + F.col("copy") * id_span) \
+        .withColumn("asin", suffixed(F.col("asin"))) \
+        .drop("copy")
+    meta_df = meta_df.crossJoin(copy).withColumn("asin", suffixed(F.col("asin"))).drop("copy")
+    return reviews_df, meta_df
+
+
+def write_scaled(spark, reviews, meta, factor, output):
+    """Writes the scaled datasets as parquet under output, returns their paths"""
+    reviews_df, meta_df = scale(read_table(spark, reviews), read_table(spark, meta), factor)
+    reviews_path = output + "/kindle.parquet"
+    meta_path = output + "/meta.parquet"
+    reviews_df.write.mode("overwrite").parquet(reviews_path)
+    meta_df.write.mode("overwrite").parquet(meta_path)
+    return reviews_path, meta_path
+
+
+# ================
+# Stage timings
+# ================
+
+def _get_json(url):
+    with urllib.request.urlopen(url) as response:
+        return json.loads(response.read().decode("utf-8"))
+
+
+def _duration(stage):
+    start = stage.get("submissionTime")
+    end = stage.get("completionTime")
+    if not start or not end:
+        return None
+    return (datetime.strptime(end, TIME_FORMAT) - datetime.strptime(start, TIME_FORMAT)).total_seconds()
+
+
+def stage_timings(spark, group):
+    """Returns [{stage, name, seconds, executor_seconds}] of the jobs run under a job group,
+    read from the Spark UI REST api"""
+    sc = spark.sparkContext
+    if not sc.uiWebUrl:
+        return []
+    api = "{}/api/v1/applications/{}".format(sc.uiWebUrl, sc.applicationId)
+    stage_ids = set()
+    for job in _get_json(api + "/jobs"):
+        if job.get("jobGroup") == group:
+            stage_ids.update(job["stageIds"])
+    timings = []
+    for stage in _get_json(api + "/stages?status=complete"):
+        if stage["stageId"] in stage_ids:
+            timings.append({"stage": stage["stageId"],
+                            "name": stage["name"],
+                            "seconds": _duration(stage),
+                            "executor_seconds": stage.get("executorRunTime", 0) / 1000.0})
+    return sorted(timings, key=lambda t: t["stage"])
+
+
+# ================
+# Benchmark
+# ================
+
+def run_job(spark, job, reviews, meta, output):
+    if job == "corr":
+        correlation.run(spark, reviews, meta, output + "/corr")
+    else:
+        tfidf.run(spark, reviews, output + "/tfidf")
+
+
+def run_embedded(job, reviews, meta, output):
+    if job == "corr":
+        embedded.run_correlation(reviews, meta, output + "/corr.csv")
+    else:
+        embedded.run_tfidf(reviews, output + "/tfidf")
+
+
+def benchmark(reviews, meta, cores_list, sizes, jobs, workdir, engines=("spark",)):
+    """Runs every job for every (size, cores) and returns a list of result dicts
+    Each cores setting gets a fresh local[N] session so that nothing is cached across runs
+    The embedded engine runs once per size, in this process (one core)"""
+    results = []
+    for size in sizes:
+        spark = session("local[*]", "scale-{}".format(size))
+        data_dir = "file://{}/data_x{}".format(workdir, size)
+        scaled_reviews, scaled_meta = write_scaled(spark, reviews, meta, size, data_dir)
+        rows = spark.read.parquet(scaled_reviews).count()
+        spark.stop()
+
+        if "embedded" in engines:
+            for job in jobs:
+                start = time.time()
+                run_embedded(job, scaled_reviews, scaled_meta, "{}/out_{}-x{}-embedded".format(workdir, job, size))
+                seconds = time.time() - start
+                results.append({"job": job, "engine": "embedded", "size": size, "rows": rows, "cores": 1,
+                                "seconds": seconds, "stages": []})
+                print("{:<6} x{:<4} {:>9} rows  embedded  {:8.2f}s".format(job, size, rows, seconds))
+        if "spark" not in engines:
+            continue
+
+        for cores in cores_list:
+            spark = session("local[{}]".format(cores), "bench-x{}-{}cores".format(size, cores))
+            for job in jobs:
+                group = "{}-x{}-{}".format(job, size, cores)
+                spark.sparkContext.setJobGroup(group, group)
+                start = time.time()
+                run_job(spark, job, scaled_reviews, scaled_meta, "file://{}/out_{}".format(workdir, group))
+                seconds = time.time() - start
+                results.append({"job": job, "engine": "spark", "size": size, "rows": rows, "cores": cores,
+                                "seconds": seconds, "stages": stage_timings(spark, group)})
+                print("{:<6} x{:<4} {:>9} rows  {:>2} cores  {:8.2f}s".format(job, size, rows, cores, seconds))
+            spark.stop()
+    add_efficiency(results)
+    return results
+
+
+def add_efficiency(results):
+    """Adds speedup (T1 / Tn) and scaling efficiency (T1 / (n * Tn)) relative to the smallest core count"""
+    for result in results:
+        same = [r for r in results if r["job"] == result["job"] and r["size"] == result["size"]
+                and r["engine"] == result["engine"]]
+        base = min(same, key=lambda r: r["cores"])
+        speedup = base["seconds"] / result["seconds"]
+        result["speedup"] = speedup
+        result["efficiency"] = speedup * base["cores"] / result["cores"]
+
+
+def print_report(results):
+    print()
+    print("{:<6} {:<9} {:>6} {:>10} {:>6} {:>9} {:>8} {:>10}".format(
+        "job", "engine", "size", "rows", "cores", "seconds", "speedup", "efficiency"))
+    for r in results:
+        print("{:<6} {:<9} {:>6} {:>10} {:>6} {:>9.2f} {:>8.2f} {:>9.0f}%".format(
+            r["job"], r["engine"], "x{}".format(r["size"]), r["rows"], r["cores"], r["seconds"], r["speedup"],
+            r["efficiency"] * 100))
+    print_engines(results)
+    print()
+    print("slowest stages:")
+    for r in results:
+        if r["engine"] != "spark":
+            continue
+        stages = sorted([s for s in r["stages"] if s["seconds"]], key=lambda s: -s["seconds"])[:3]
+        summary = ", ".join("{} {:.2f}s".format(s["name"].split(" at ")[0], s["seconds"]) for s in stages)
+        print("  {} x{} {} cores: {}".format(r["job"], r["size"], r["cores"], summary))
+
+
+def print_engines(results):
+    """Embedded time against the fastest Spark run of the same job and size"""
+    pairs = []
+    for r in results:
+        if r["engine"] != "embedded":
+            continue
+        spark_runs = [s for s in results if s["engine"] == "spark" and s["job"] == r["job"] and s["size"] == r["size"]]
+        if spark_runs:
+            pairs.append((r, min(spark_runs, key=lambda s: s["seconds"])))
+    if not pairs:
+        return
+    print()
+    print("embedded vs fastest spark:")
+    for r, s in pairs:
+        print("  {:<6} x{:<6} {:>8.2f}s vs {:>8.2f}s ({} cores)  {:.1f}x".format(
+            r["job"], r["size"], r["seconds"], s["seconds"], s["cores"], s["seconds"] / r["seconds"]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    scale_parser = subparsers.add_parser("scale", help="Grow or sample the datasets and write them as parquet")
+    scale_parser.add_argument("--factor", type=float, required=True, help="Copies (>= 1) or sample fraction (< 1)")
+    scale_parser.add_argument("--output", required=True, help="Output directory")
+
+    run_parser = subparsers.add_parser("run", help="Run the jobs at several core counts and data sizes")
+    run_parser.add_argument("--max-cores", type=int, default=os.cpu_count(), help="Runs at 1, 2, 4, ... up to max cores")
+    run_parser.add_argument("--cores", help="Comma separated core counts, overrides --max-cores")
+    run_parser.add_argument("--sizes", default="1,4,16", help="Comma separated scale factors")
+    run_parser.add_argument("--jobs", default=",".join(JOBS), help="Comma separated jobs: corr,tfidf")
+    run_parser.add_argument("--engines", default="spark", help="Comma separated engines: spark,embedded")
+    run_parser.add_argument("--workdir", default="/tmp/isit_bench", help="Directory for scaled data and outputs")
+    run_parser.add_argument("--report", help="Write the results (including stage timings) to this json file")
+
+    for sub in (scale_parser, run_parser):
+        sub.add_argument("--reviews", default=default_input("local", "kindle.parquet"), help="Reviews dataset")
+        sub.add_argument("--meta", default=default_input("local", "meta.parquet"), help="Metadata dataset")
+    args = parser.parse_args()
+
+    if args.command == "scale":
+        spark = session("local[*]", "scale")
+        write_scaled(spark, args.reviews, args.meta, args.factor, args.output)
+        spark.stop()
+        return
+
+    if args.cores:
+        cores_list = [int(c) for c in args.cores.split(",")]
+    else:
+        cores_list = [1]
+        while cores_list[-1] * 2 <= args.max_cores:
+            cores_list.append(cores_list[-1] * 2)
+        if cores_list[-1] != args.max_cores:
+            cores_list.append(args.max_cores)
+    sizes = [float(s) if "." in s else int(s) for s in args.sizes.split(",")]
+    jobs = [job for job in args.jobs.split(",") if job in JOBS]
+    engines = [engine for engine in args.engines.split(",") if engine in ENGINES]
+
+    results = benchmark(args.reviews, args.meta, cores_list, sizes, jobs, os.path.abspath(args.workdir), engines)
+    print_report(results)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,69 +1,325 @@
+import argparse
 import math
-import sys
+from collections import namedtuple
 import pyspark
-from pyspark.sql.functions import *
-from pyspark.sql.functions import length
 from pyspark.sql import SparkSession
+from pyspark.sql import functions as F
+from sources import read_table, spark_master, default_input, default_output
+from incremental import load_state, commit_state, delta, advance, merge_sums
 
 # to run
 # $SPARK_HOME/bin/spark-submit --master spark://<master-ip>:7077 correlation.py <master-ip>
 # $SPARK_HOME/bin/spark-submit --master spark://ec2-54-169-135-228.ap-southeast-1.compute.amazonaws.com:7077 correlation.py ec2-54-169-135-228.ap-southeast-1.compute.amazonaws.com
+# optional: --pairs price:average_reviewLength,price:review_count --method sums
+# optional: --incremental --reviews hdfs://<master-ip>:9000/data/kindle_delta.parquet
+# locally, on the sample data in spark/data: python correlation.py local[4]
 
+# Column pairs correlated by default. Pairs whose columns are not in the input are skipped.
+DEFAULT_PAIRS = [
+    ("price", "average_reviewLength"),
+    ("price", "average_rating"),
+    ("price", "review_count"),
+    ("price", "helpfulness"),
+]
+
+# Mergeable second-order moments of one (x, y) pair
+Moments = namedtuple("Moments", ["n", "mean_x", "mean_y", "m2_x", "m2_y", "c_xy"])
+EMPTY_MOMENTS = Moments(0, 0.0, 0.0, 0.0, 0.0, 0.0)
+
+
+def parse_pairs(pairs_string):
+    """Parses 'x1:y1,x2:y2' into a list of (x, y) tuples"""
+    pairs = []
+    for pair in pairs_string.split(","):
+        x, y = pair.strip().split(":")
+        pairs.append((x.strip(), y.strip()))
+    return pairs
 
-sc = pyspark.SparkContext("spark://{}:7077".format(sys.argv[1]), "corr")
-spark = SparkSession(sc)
 
 # ================
 # Preprocessing
 # ================
 
-reviews_df = spark.read.csv("hdfs://{}:9000/data/{}".format(sys.argv[1], "kindle.csv"), header=True, sep=",")
-# get id, asin and reviewText columns from reviews dataset
-reviews = reviews_df.select("id", "asin", "reviewText")
-# convert reviewText -> length of review
-reviews = reviews.withColumn("reviewText", length(reviews.reviewText))
-# get average review length (group by asin)
-reviews_avg = reviews.groupBy("asin").agg(mean("reviewText").alias("average_reviewLength"))
+def review_sums(reviews_df):
+    """Returns per-asin sums and counts of the review statistics. These add up across
+    disjoint sets of reviews, which is what incremental runs keep as state
+    Sums that need columns missing from reviews_df (overall, helpful) are left out"""
+    columns = reviews_df.columns
+    review_length = F.length("reviewText")
+    aggs = [F.sum(review_length).alias("length_sum"),
+            F.count(review_length).alias("length_count"),
+            F.count(F.lit(1)).alias("review_count")]
+    if "overall" in columns:
+        rating = F.col("overall").cast("double")
+        aggs += [F.sum(rating).alias("rating_sum"), F.count(rating).alias("rating_count")]
+    if "helpful" in columns:
+        # helpful is stored as the string "[yes, total]"
+        aggs += [F.sum(F.regexp_extract("helpful", r"\[\s*(\d+)", 1).cast("double")).alias("helpful_yes"),
+                 F.sum(F.regexp_extract("helpful", r"(\d+)\s*\]", 1).cast("double")).alias("helpful_total")]
+    return reviews_df.groupBy("asin").agg(*aggs)
+
+
+def prices(meta_df):
+    """Returns the asin and price (as a double) of every book"""
+    return meta_df.select("asin", F.col("price").cast("double").alias("price"))
+
+
+def features(sums, meta_df):
+    """Turns per-asin sums into one row per asin with its price and review statistics
+    meta_df can also be the output of prices"""
+    columns = sums.columns
+    stats = [F.col("asin"),
+             (F.col("length_sum") / F.col("length_count")).alias("average_reviewLength"),
+             F.col("review_count")]
+    if "rating_sum" in columns:
+        stats.append((F.col("rating_sum") / F.col("rating_count")).alias("average_rating"))
+    if "helpful_total" in columns:
+        stats.append((F.col("helpful_yes") / F.col("helpful_total")).alias("helpfulness"))
+
+    # join by asin
+    return sums.select(*stats).join(prices(meta_df), ["asin"])
+
+
+def build_features(reviews_df, meta_df):
+    """Returns one row per asin with its price and review statistics"""
+    return features(review_sums(reviews_df), meta_df)
+
+
+def _masked(x, y):
+    """Returns x and y as columns that are null unless both values are present"""
+    both = F.col(x).isNotNull() & F.col(y).isNotNull()
+    return F.when(both, F.col(x).cast("double")), F.when(both, F.col(y).cast("double"))
+
+
+# ================
+# Sums of products
+# ================
+
+def sum_terms(data, pairs):
+    """Computes n, sum(x), sum(y), sum(x^2), sum(y^2) and sum(xy) of every pair in one aggregation"""
+    exprs = []
+    for i, (x, y) in enumerate(pairs):
+        xs, ys = _masked(x, y)
+        exprs += [F.count(xs).alias("n_%d" % i),
+                  F.sum(xs).alias("x_%d" % i),
+                  F.sum(ys).alias("y_%d" % i),
+                  F.sum(xs * xs).alias("x2_%d" % i),
+                  F.sum(ys * ys).alias("y2_%d" % i),
+                  F.sum(xs * ys).alias("xy_%d" % i)]
+    row = data.agg(*exprs).first()
+    return [(row["n_%d" % i], row["x_%d" % i], row["y_%d" % i],
+             row["x2_%d" % i], row["y2_%d" % i], row["xy_%d" % i]) for i in range(len(pairs))]
+
+
+def sums_correlation(terms):
+    """Pearson correlation from raw sums. Cheap, but loses precision when the means are large"""
+    n, x, y, xx, yy, xy = terms
+    if not n:
+        return None
+    numerator = xy - (x * y) / n
+    denominator = math.sqrt(xx - (x * x) / n) * math.sqrt(yy - (y * y) / n)
+    if denominator == 0:
+        return None
+    return numerator / denominator
+
+
+# ================
+# Central moments
+# ================
+
+def merge_moments(a, b):
+    """Combines the moments of two disjoint sets of rows (Chan et al. parallel update)"""
+    if a.n == 0:
+        return b
+    if b.n == 0:
+        return a
+    n = a.n + b.n
+    dx = b.mean_x - a.mean_x
+    dy = b.mean_y - a.mean_y
+    mean_x = a.mean_x + dx * b.n / n
+    mean_y = a.mean_y + dy * b.n / n
+    m2_x = a.m2_x + b.m2_x + dx * dx * a.n * b.n / n
+    m2_y = a.m2_y + b.m2_y + dy * dy * a.n * b.n / n
+    c_xy = a.c_xy + b.c_xy + dx * dy * a.n * b.n / n
+    return Moments(n, mean_x, mean_y, m2_x, m2_y, c_xy)
+
+
+def subtract_moments(total, part):
+    """Inverse of merge_moments: removes the moments of a subset of rows from the total"""
+    n = total.n - part.n
+    if part.n == 0:
+        return total
+    if n <= 0:
+        return EMPTY_MOMENTS
+    mean_x = (total.n * total.mean_x - part.n * part.mean_x) / n
+    mean_y = (total.n * total.mean_y - part.n * part.mean_y) / n
+    dx = part.mean_x - mean_x
+    dy = part.mean_y - mean_y
+    m2_x = total.m2_x - part.m2_x - dx * dx * n * part.n / total.n
+    m2_y = total.m2_y - part.m2_y - dy * dy * n * part.n / total.n
+    c_xy = total.c_xy - part.c_xy - dx * dy * n * part.n / total.n
+    return Moments(n, mean_x, mean_y, m2_x, m2_y, c_xy)
+
+
+def moments_correlation(m):
+    """Pearson correlation from central moments"""
+    if m.n == 0 or m.m2_x <= 0 or m.m2_y <= 0:
+        return None
+    return m.c_xy / math.sqrt(m.m2_x * m.m2_y)
+
+
+def partition_moments(data, pairs):
+    """Computes the central moments of every pair per partition in one aggregation
+    Spark's avg/var_pop/covar_pop use numerically stable online updates, so only the
+    per-partition results are merged on the driver.
+    Returns a list (one per pair) of lists of partial Moments"""
+    exprs = []
+    for i, (x, y) in enumerate(pairs):
+        xs, ys = _masked(x, y)
+        exprs += [F.count(xs).alias("n_%d" % i),
+                  F.avg(xs).alias("mx_%d" % i),
+                  F.avg(ys).alias("my_%d" % i),
+                  F.var_pop(xs).alias("vx_%d" % i),
+                  F.var_pop(ys).alias("vy_%d" % i),
+                  F.covar_pop(xs, ys).alias("cxy_%d" % i)]
+    rows = data.groupBy(F.spark_partition_id().alias("partition")).agg(*exprs).collect()
+
+    partials = [[] for _ in pairs]
+    for row in rows:
+        for i in range(len(pairs)):
+            n = row["n_%d" % i]
+            if not n:
+                continue
+            partials[i].append(Moments(n, row["mx_%d" % i], row["my_%d" % i],
+                                       row["vx_%d" % i] * n, row["vy_%d" % i] * n, row["cxy_%d" % i] * n))
+    return partials
+
+
+def pair_moments(data, pairs):
+    """Returns the merged Moments of every pair"""
+    merged = []
+    for partials in partition_moments(data, pairs):
+        m = EMPTY_MOMENTS
+        for partial in partials:
+            m = merge_moments(m, partial)
+        merged.append(m)
+    return merged
+
+
+def available(data, pairs):
+    return [(x, y) for x, y in pairs if x in data.columns and y in data.columns]
+
+
+def correlate(data, pairs, method="moments"):
+    """Returns a list of (x, y, n, correlation), computing every pair in a single Spark job"""
+    pairs = available(data, pairs)
+    if method == "sums":
+        terms = sum_terms(data, pairs)
+        return [(x, y, t[0], sums_correlation(t)) for (x, y), t in zip(pairs, terms)]
+    moments = pair_moments(data, pairs)
+    return [(x, y, m.n, moments_correlation(m)) for (x, y), m in zip(pairs, moments)]
+
+
+# ================
+# Incremental runs
+# ================
+
+MOMENTS_SCHEMA = "x string, y string, n long, mean_x double, mean_y double, m2_x double, m2_y double, c_xy double"
+
+
+def correlate_incremental(spark, state_root, reviews_df, meta_df, pairs):
+    """Updates the per-asin sums and pair moments kept under state_root with the reviews
+    added since the last run. Only the books that received reviews are recomputed: their
+    old contribution (with the price stored when it was added) is removed from the moments
+    and the new one (with the current price) merged in.
+    Price changes of books without new reviews are not picked up, run without
+    --incremental to rebuild everything."""
+    watermark, state = load_state(spark, state_root, ["review_sums", "prices", "moments"])
+    new_reviews = delta(reviews_df, watermark)
+
+    if watermark is None:
+        sums = review_sums(new_reviews)
+        used_prices = prices(meta_df).join(sums.select("asin"), ["asin"], "left_semi")
+        data = features(sums, used_prices)
+        pairs = available(data, pairs)
+        moments = dict(zip(pairs, pair_moments(data, pairs)))
+    else:
+        old_sums = state["review_sums"]
+        delta_sums = review_sums(new_reviews).cache()
+        touched = delta_sums.select("asin")
+        sums = merge_sums(old_sums, delta_sums, ["asin"])
+        used_prices = state["prices"].join(touched, ["asin"], "left_anti") \
+            .unionByName(prices(meta_df).join(touched, ["asin"], "left_semi"))
+
+        before = features(old_sums.join(touched, ["asin"], "left_semi"), state["prices"])
+        after = features(sums.join(touched, ["asin"], "left_semi"), meta_df)
+        pairs = available(after, pairs)
+
+        saved = {(row["x"], row["y"]): Moments(*row[2:]) for row in state["moments"].collect()}
+        missing = [pair for pair in pairs if pair not in saved]
+        if missing:
+            raise ValueError("No saved moments for {}, run without --incremental".format(missing))
+
+        moments = {}
+        for pair, old, new in zip(pairs, pair_moments(before, pairs), pair_moments(after, pairs)):
+            moments[pair] = merge_moments(subtract_moments(saved[pair], old), new)
+
+    moments_df = spark.createDataFrame([(x, y) + tuple(moments[(x, y)]) for x, y in pairs], MOMENTS_SCHEMA)
+    commit_state(spark, state_root, advance(new_reviews, watermark),
+                 {"review_sums": sums, "prices": used_prices, "moments": moments_df})
+    return [(x, y, moments[(x, y)].n, moments_correlation(moments[(x, y)])) for x, y in pairs]
 
 
-meta_df = spark.read.json("hdfs://{}:9000/data/{}".format(sys.argv[1], "meta.json"))
-prices = meta_df.select("asin", "price")
-# join by asin
-data = reviews_avg.join(prices, ["asin"])
+def run(spark, reviews, meta, output, pairs=DEFAULT_PAIRS, method="moments", state=None):
+    """Correlates the datasets at reviews/meta and writes the results as csv to output
+    With a state directory, only reviews added since the last run with that state are read"""
+    reviews_df = read_table(spark, reviews)
+    meta_df = read_table(spark, meta)
 
+    if state:
+        results = correlate_incremental(spark, state + "/corr", reviews_df, meta_df, pairs)
+    else:
+        results = correlate(build_features(reviews_df, meta_df), pairs, method)
 
-# ==================
+    # create a dataframe so that we can save
+    output_df = spark.createDataFrame(results, "x string, y string, n long, correlation double")
+    output_df.coalesce(1).write.mode("overwrite").csv(output, header=True)
+    return results
 
-data = data.select("price", "average_reviewLength")
-data = data.filter(col("price").isNotNull() & col("average_reviewLength").isNotNull())		# drop None values
-n = data.count()
 
-data = data.rdd.map(list)
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("master", help="DNS of the spark master / hdfs namenode, or a master url like local[4]")
+    parser.add_argument("--reviews", help="Reviews dataset, defaults to hdfs://<master>:9000/data/kindle.parquet "
+                                          "(the sample csv in spark/data with a master url)")
+    parser.add_argument("--meta", help="Metadata dataset, defaults to hdfs://<master>:9000/data/meta.parquet "
+                                       "(the sample json in spark/data with a master url)")
+    parser.add_argument("--output", help="Output directory, defaults to hdfs://<master>:9000/corr (./output/corr)")
+    parser.add_argument("--pairs", help="Comma separated x:y column pairs to correlate",
+                        default=",".join("%s:%s" % pair for pair in DEFAULT_PAIRS))
+    parser.add_argument("--method", help="sums: one-pass sums of products, moments: stable central moments",
+                        choices=["moments", "sums"], default="moments")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only process reviews added since the last incremental run (always uses moments)")
+    parser.add_argument("--state", help="State directory, defaults to hdfs://<master>:9000/state (./output/state)")
+    args = parser.parse_args()
 
-flatdata = data.flatMap(lambda row: (
-	("x", row[0]),
-	("y", row[1]),
-	("x2", row[0] * row[0]),
-	("y2", row[1] * row[1]),
-	("xy", row[0] * row[1])))
+    sc = pyspark.SparkContext(spark_master(args.master), "corr")
+    spark = SparkSession(sc)
 
-# Sort by key so that we will get an order we can slice from
-reduced_data = flatdata.reduceByKey(lambda x,y: x+y).sortByKey()
+    state = None
+    if args.incremental:
+        state = args.state or default_output(args.master, "state")
+    results = run(spark,
+                  args.reviews or default_input(args.master, "kindle.parquet"),
+                  args.meta or default_input(args.master, "meta.parquet"),
+                  args.output or default_output(args.master, "corr"),
+                  parse_pairs(args.pairs), args.method, state)
 
-# Retrieving our terms required for calculating the correlation
-end_data = reduced_data.take(5)
-x = end_data[0][1]
-xx = end_data[1][1]
-xy = end_data[2][1]
-y = end_data[3][1]
-yy = end_data[4][1]
+    for x, y, n, correlation in results:
+        print("The Pearson Correlation between {} and {} ({} books) is: ".format(y, x, n))
+        print(correlation)
 
-numerator = xy - (x * y)/n
-denominator = math.sqrt(xx - (x * x)/n) * math.sqrt(yy - (y * y)/n)
-correlation = numerator / denominator
-print("The Pearson Correlation between average review length and price is: ")
-print(correlation)
 
-# create a rdd so that we can save
-output = sc.parallelize(['Correlation', correlation])
-output.saveAsTextFile("hdfs://{}:9000/corr".format(sys.argv[1]))
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+import argparse
+import ast
+import csv
+import math
+import os
+import re
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from pyarrow import fs
+from scipy import sparse
+from sources import SAMPLE_DATA, SAMPLES
+
+# Runs the correlation and tfidf jobs in one process with NumPy and scipy.sparse, for datasets
+# that fit in memory (the sample data, or a local extract made by extract.py). The outputs are
+# the same as correlation.py and tfidf.py, without starting Spark or its python workers.
+# to run
+# python embedded.py corr
+# python embedded.py corr --reviews /tmp/data/kindle.parquet --meta /tmp/data/meta.parquet
+# python embedded.py tfidf --input /tmp/data/kindle.parquet --vocab-size 5000
+# bench.py run --engines spark,embedded compares both at several data sizes.
+
+# same defaults as correlation.py and tfidf.py
+DEFAULT_PAIRS = [
+    ("price", "average_reviewLength"),
+    ("price", "average_rating"),
+    ("price", "review_count"),
+    ("price", "helpfulness"),
+]
+DEFAULT_VOCAB_SIZE = 20
+DEFAULT_MIN_DF = 1.0
+DEFAULT_TOP_K = 10
+DEFAULT_BUCKETS = 16
+
+# Spark's Tokenizer lowercases and splits on java's \s
+WHITESPACE = re.compile(r"[ \t\n\x0b\f\r]")
+
+
+def default_path(name):
+    return os.path.join(SAMPLE_DATA, SAMPLES[name])
+
+
+# ================
+# Loading
+# ================
+
+def open_input(path):
+    """Returns (filesystem, path) for a local path, a file:// or an hdfs:// uri"""
+    if path.startswith("file://"):
+        return fs.LocalFileSystem(), path[len("file://"):]
+    if "://" in path:
+        return fs.FileSystem.from_uri(path)
+    return fs.LocalFileSystem(), os.path.abspath(path)
+
+
+def read_table(path, columns=None):
+    """Reads a dataset into a pyarrow Table, picking the format from the path like sources.read_table"""
+    filesystem, path = open_input(path)
+    path_lower = path.rstrip("/").lower()
+    if path_lower.endswith(".csv"):
+        with filesystem.open_input_stream(path) as stream:
+            table = pa_csv.read_csv(stream, parse_options=pa_csv.ParseOptions(newlines_in_values=True))
+        # pandas exports (like the sample data) have an unnamed index column instead of id
+        names = ["id" if name == "" and "id" not in table.column_names else name for name in table.column_names]
+        table = table.rename_columns(names)
+    elif path_lower.endswith(".json"):
+        with filesystem.open_input_stream(path) as stream:
+            lines = stream.read().decode("utf-8").splitlines()
+        # one document per line, the sample data is written with single quotes (python literals)
+        docs = [ast.literal_eval(line) for line in lines if line.strip()]
+        # books miss some of the fields, they are null there
+        names = columns or list(dict.fromkeys(name for doc in docs for name in doc))
+        table = pa.Table.from_pydict({name: [doc.get(name) for doc in docs] for name in names})
+    else:
+        table = pq.read_table(path, filesystem=filesystem, columns=columns)
+    if columns:
+        table = table.select([column for column in columns if column in table.column_names])
+    return table
+
+
+def as_float(array):
+    """pyarrow array as a float64 numpy array, nulls become nan"""
+    return pc.cast(array, pa.float64()).to_numpy(zero_copy_only=False)
+
+
+# ================
+# Correlation
+# ================
+
+def review_sums(reviews):
+    """Per-asin sums and counts of the review statistics, as correlation.review_sums
+    Returns (asins, dict of numpy arrays aligned with asins)"""
+    encoded = pc.dictionary_encode(reviews.column("asin")).combine_chunks()
+    groups = encoded.indices.to_numpy(zero_copy_only=False)
+    asins = encoded.dictionary
+    n_groups = len(asins)
+
+    def group_sum(values):
+        present = ~np.isnan(values)
+        return (np.bincount(groups[present], weights=values[present], minlength=n_groups),
+                np.bincount(groups[present], minlength=n_groups))
+
+    sums = {}
+    sums["length_sum"], sums["length_count"] = group_sum(as_float(pc.utf8_length(reviews.column("reviewText"))))
+    sums["review_count"] = np.bincount(groups, minlength=n_groups)
+    if "overall" in reviews.column_names:
+        sums["rating_sum"], sums["rating_count"] = group_sum(as_float(reviews.column("overall")))
+    if "helpful" in reviews.column_names:
+        # helpful is stored as the string "[yes, total]"
+        helpful = reviews.column("helpful")
+        yes = pc.struct_field(pc.extract_regex(helpful, r"\[\s*(?P<yes>\d+)"), [0])
+        total = pc.struct_field(pc.extract_regex(helpful, r"(?P<total>\d+)\s*\]"), [0])
+        sums["helpful_yes"] = group_sum(as_float(yes))[0]
+        sums["helpful_total"] = group_sum(as_float(total))[0]
+    return asins, sums
+
+
+def divide(numerator, denominator):
+    """numerator / denominator with nan where the denominator is 0, like a null in Spark"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(denominator != 0, numerator / np.where(denominator != 0, denominator, 1), np.nan)
+
+
+def features(asins, sums, meta):
+    """One entry per asin with a book in meta: its price and review statistics (numpy columns)"""
+    data = {"average_reviewLength": divide(sums["length_sum"], sums["length_count"]),
+            "review_count": sums["review_count"].astype(np.float64)}
+    if "rating_sum" in sums:
+        data["average_rating"] = divide(sums["rating_sum"], sums["rating_count"])
+    if "helpful_total" in sums:
+        data["helpfulness"] = divide(sums["helpful_yes"], sums["helpful_total"])
+
+    # join by asin
+    positions = pc.index_in(asins, value_set=meta.column("asin").combine_chunks())
+    matched = pc.is_valid(positions).to_numpy(zero_copy_only=False)
+    rows = positions.drop_null().to_numpy(zero_copy_only=False)
+    data = {name: values[matched] for name, values in data.items()}
+    data["price"] = as_float(meta.column("price").combine_chunks().take(pa.array(rows)))
+    return data
+
+
+def pearson(x, y):
+    """(n, correlation) of the rows where both x and y are present, from central moments"""
+    both = ~np.isnan(x) & ~np.isnan(y)
+    n = int(both.sum())
+    if n == 0:
+        return 0, None
+    dx = x[both] - x[both].mean()
+    dy = y[both] - y[both].mean()
+    m2_x = np.dot(dx, dx)
+    m2_y = np.dot(dy, dy)
+    if m2_x <= 0 or m2_y <= 0:
+        return n, None
+    return n, float(np.dot(dx, dy) / math.sqrt(m2_x * m2_y))
+
+
+def correlate(reviews, meta, pairs=DEFAULT_PAIRS):
+    """Returns a list of (x, y, n, correlation) like correlation.correlate"""
+    asins, sums = review_sums(reviews)
+    data = features(asins, sums, meta)
+    return [(x, y) + pearson(data[x], data[y]) for x, y in pairs if x in data and y in data]
+
+
+def run_correlation(reviews, meta, output, pairs=DEFAULT_PAIRS):
+    """Correlates the datasets at reviews/meta and writes the results as csv to output"""
+    reviews_table = read_table(reviews, ["asin", "reviewText", "overall", "helpful"])
+    meta_table = read_table(meta, ["asin", "price"])
+    results = correlate(reviews_table, meta_table, pairs)
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["x", "y", "n", "correlation"])
+        writer.writerows(results)
+    return results
+
+
+# ================
+# TF-IDF
+# ================
+
+def _rotl(value, bits):
+    return ((value << bits) | (value >> (32 - bits))) & 0xFFFFFFFF
+
+
+def _mix_k1(k1):
+    k1 = (k1 * 0xcc9e2d51) & 0xFFFFFFFF
+    return (_rotl(k1, 15) * 0x1b873593) & 0xFFFFFFFF
+
+
+def _mix_h1(h1, k1):
+    h1 = _rotl(h1 ^ k1, 13)
+    return (h1 * 5 + 0xe6546b64) & 0xFFFFFFFF
+
+
+def spark_hash(string, seed=42):
+    """Spark's hash() of a string (Murmur3_x86_32.hashUnsafeBytes, which mixes the trailing
+    bytes one at a time), as a signed 32 bit int"""
+    data = string.encode("utf-8")
+    h1 = seed
+    aligned = len(data) - len(data) % 4
+    for i in range(0, aligned, 4):
+        h1 = _mix_h1(h1, _mix_k1(int.from_bytes(data[i:i + 4], "little")))
+    for byte in data[aligned:]:
+        # java bytes are signed
+        h1 = _mix_h1(h1, _mix_k1((byte - 256 if byte > 127 else byte) & 0xFFFFFFFF))
+    h1 ^= len(data)
+    h1 ^= h1 >> 16
+    h1 = (h1 * 0x85ebca6b) & 0xFFFFFFFF
+    h1 ^= h1 >> 13
+    h1 = (h1 * 0xc2b2ae35) & 0xFFFFFFFF
+    h1 ^= h1 >> 16
+    return h1 - (1 << 32) if h1 & 0x80000000 else h1
+
+
+def term_matrix(texts):
+    """Tokenizes texts like Spark's Tokenizer, returns (document x word count matrix, words)"""
+    index = {}
+    columns = []
+    indptr = [0]
+    for text in texts:
+        for word in WHITESPACE.split(text.lower()):
+            if word:
+                columns.append(index.setdefault(word, len(index)))
+        indptr.append(len(columns))
+    counts = sparse.csr_matrix((np.ones(len(columns), dtype=np.float64), np.array(columns, dtype=np.int64),
+                                np.array(indptr, dtype=np.int64)), shape=(len(texts), len(index)))
+    # duplicate (document, word) entries are added up
+    counts.sum_duplicates()
+    words = np.empty(len(index), dtype=object)
+    for word, i in index.items():
+        words[i] = word
+    return counts, words
+
+
+def vocabulary(counts, words, vocab_size, min_df):
+    """Indices of the vocab_size most frequent words (as tfidf.vocabulary) and their idf"""
+    n_docs = counts.shape[0]
+    term_count = np.asarray(counts.sum(axis=0)).ravel()
+    df = np.diff(counts.tocsc().indptr)
+    min_count = min_df if min_df >= 1 else min_df * n_docs
+    candidates = np.flatnonzero(df >= min_count)
+    # most frequent first, ties by word
+    order = np.lexsort((words[candidates].astype(str), -term_count[candidates]))
+    vocab = candidates[order[:vocab_size]]
+    idf = np.log((n_docs + 1.0) / (df[vocab] + 1.0))
+    return vocab, idf
+
+
+def tfidf(reviews, vocab_size=DEFAULT_VOCAB_SIZE, min_df=DEFAULT_MIN_DF, top_k=DEFAULT_TOP_K, buckets=DEFAULT_BUCKETS):
+    """Returns a pyarrow Table with the columns of tfidf.native_tfidf: id, asin, tfidf, top_terms, bucket
+    Reviews without any vocabulary word have no row, as with Spark's join"""
+    # drop rows with null values in reviews
+    reviews = reviews.filter(pc.is_valid(reviews.column("reviewText")))
+    counts, words = term_matrix(reviews.column("reviewText").to_pylist())
+    vocab, idf = vocabulary(counts, words, vocab_size, min_df)
+    # tf * idf of the vocabulary words, words in every review keep their 0 like in Spark
+    scores = counts[:, vocab].tocsr()
+    scores.data *= idf[scores.indices]
+    vocab_words = words[vocab]
+
+    ids = reviews.column("id").to_pylist()
+    asins = reviews.column("asin").to_pylist()
+    rows = {"id": [], "asin": [], "tfidf": [], "top_terms": [], "bucket": []}
+    for doc in np.flatnonzero(np.diff(scores.indptr)):
+        start, end = scores.indptr[doc], scores.indptr[doc + 1]
+        terms = list(zip(vocab_words[scores.indices[start:end]], scores.data[start:end].tolist()))
+        # sort_array of struct(tfidf, word) descending
+        ranked = sorted(terms, key=lambda term: (term[1], term[0]), reverse=True)
+        rows["id"].append(ids[doc])
+        rows["asin"].append(asins[doc])
+        rows["tfidf"].append(terms)
+        rows["top_terms"].append([word for word, value in ranked[:top_k]])
+        rows["bucket"].append(spark_hash(asins[doc]) % buckets)
+    schema = pa.schema([("id", reviews.schema.field("id").type), ("asin", pa.string()),
+                        ("tfidf", pa.map_(pa.string(), pa.float64())), ("top_terms", pa.list_(pa.string())),
+                        ("bucket", pa.int32())])
+    return pa.Table.from_pydict(rows, schema=schema)
+
+
+def write_partitioned(table, filesystem, path, column):
+    """Replaces the parquet dataset at path with table, partitioned by column (column=value directories)
+    Written file by file, write_to_dataset only replaces existing data from pyarrow 7 on"""
+    if filesystem.get_file_info(path).type == fs.FileType.NotFound:
+        filesystem.create_dir(path, recursive=True)
+    else:
+        filesystem.delete_dir_contents(path)
+    values = table.column(column)
+    # the partition value is in the directory name, not in the files
+    rest = table.remove_column(table.schema.get_field_index(column))
+    for value in pc.unique(values).to_pylist():
+        directory = "%s/%s=%s" % (path.rstrip("/"), column, value)
+        filesystem.create_dir(directory, recursive=True)
+        part = rest.filter(pc.equal(values, value))
+        pq.write_table(part, directory + "/part-0.parquet", filesystem=filesystem)
+
+
+def run_tfidf(input_path, output, vocab_size=DEFAULT_VOCAB_SIZE, min_df=DEFAULT_MIN_DF,
+              top_k=DEFAULT_TOP_K, buckets=DEFAULT_BUCKETS):
+    """Computes tfidf of the reviews at input_path and writes it as parquet to output, partitioned by bucket"""
+    table = tfidf(read_table(input_path, ["id", "asin", "reviewText"]), vocab_size, min_df, top_k, buckets)
+    filesystem, path = open_input(output)
+    write_partitioned(table, filesystem, path, "bucket")
+    return table.num_rows
+
+
+def parse_pairs(pairs_string):
+    """Parses 'x1:y1,x2:y2' into a list of (x, y) tuples"""
+    return [tuple(part.strip() for part in pair.split(":")) for pair in pairs_string.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="job")
+    subparsers.required = True
+
+    corr_parser = subparsers.add_parser("corr", help="Pearson correlations, as correlation.py")
+    corr_parser.add_argument("--reviews", default=default_path("kindle.parquet"), help="Reviews dataset")
+    corr_parser.add_argument("--meta", default=default_path("meta.parquet"), help="Metadata dataset")
+    corr_parser.add_argument("--output", default=os.path.join("output", "corr_embedded.csv"), help="Output csv")
+    corr_parser.add_argument("--pairs", help="Comma separated x:y column pairs to correlate",
+                             default=",".join("%s:%s" % pair for pair in DEFAULT_PAIRS))
+
+    tfidf_parser = subparsers.add_parser("tfidf", help="tfidf of every review, as tfidf.py")
+    tfidf_parser.add_argument("--input", default=default_path("kindle.parquet"), help="Reviews dataset")
+    tfidf_parser.add_argument("--output", default=os.path.join("output", "tfidf_embedded"), help="Output directory")
+    tfidf_parser.add_argument("--vocab-size", type=int, default=DEFAULT_VOCAB_SIZE)
+    tfidf_parser.add_argument("--min-df", type=float, default=DEFAULT_MIN_DF,
+                              help="Minimum number (>= 1) or fraction (< 1) of reviews a word must appear in")
+    tfidf_parser.add_argument("--top-k", type=int, default=DEFAULT_TOP_K, help="Number of top words kept per review")
+    tfidf_parser.add_argument("--buckets", type=int, default=DEFAULT_BUCKETS, help="Number of output partitions (by asin)")
+    args = parser.parse_args()
+
+    if args.job == "corr":
+        for x, y, n, correlation in run_correlation(args.reviews, args.meta, args.output, parse_pairs(args.pairs)):
+            print("The Pearson Correlation between {} and {} ({} books) is: ".format(y, x, n))
+            print(correlation)
+    else:
+        rows = run_tfidf(args.input, args.output, args.vocab_size, args.min_df, args.top_k, args.buckets)
+        print("{} reviews scored".format(rows))
+
+
+if __name__ == "__main__":
+    main()
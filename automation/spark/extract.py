@@ -0,0 +1,299 @@
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import mysql.connector as db
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pyarrow import fs
+from bson import ObjectId
+from pymongo import MongoClient
+
+# Extracts kindle_reviews (MySQL) and kindle_metadata (Mongo) into Parquet, reading both in
+# parallel chunks. Run it on the namenode so that the files are streamed straight into hdfs.
+# to run
+# CLASSPATH=$(hadoop classpath --glob) python3 extract.py <mysql-ip> <mongo-ip> hdfs://<master-dns>:9000/data
+# python3 extract.py <mysql-ip> <mongo-ip> /tmp/data --workers 8
+# Incremental: only reviews newer than the spark jobs' watermarks go to kindle_delta.parquet,
+# and only books inserted after the last extracted _id are appended to meta.parquet
+# python3 extract.py <mysql-ip> <mongo-ip> hdfs://<master-dns>:9000/data --incremental --state hdfs://<master-dns>:9000/state
+
+SQL_DB = "isit_database"
+SQL_USER = "root"
+SQL_PW = "password"
+MONGO_DB = "isit_database_mongo"
+MONGO_URI = "mongodb://admin:password@{}:27017/{}?authSource=admin"
+
+DEFAULT_WORKERS = 4
+DEFAULT_CHUNK_SIZE = 50000
+BATCH_SIZE = 5000
+# spark jobs that keep a watermark under --state (see incremental.py)
+INCREMENTAL_JOBS = ["corr", "tfidf"]
+
+REVIEWS_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("asin", pa.string()),
+    ("helpful", pa.string()),
+    ("overall", pa.int32()),
+    ("reviewText", pa.string()),
+    ("reviewTime", pa.string()),
+    ("reviewerID", pa.string()),
+    ("reviewerName", pa.string()),
+    ("summary", pa.string()),
+    ("unixReviewTime", pa.int64()),
+])
+
+RELATED_FIELDS = ["also_bought", "also_viewed", "bought_together", "buy_after_viewing"]
+
+META_SCHEMA = pa.schema([
+    ("_id", pa.string()),
+    ("asin", pa.string()),
+    ("title", pa.string()),
+    ("price", pa.float64()),
+    ("imUrl", pa.string()),
+    ("description", pa.string()),
+    ("categories", pa.list_(pa.list_(pa.string()))),
+    ("related", pa.struct([(field, pa.list_(pa.string())) for field in RELATED_FIELDS])),
+])
+
+logger = logging.getLogger("extract")
+
+
+def open_output(output):
+    """Returns (filesystem, base path) for a local directory or an hdfs:// uri"""
+    if "://" in output:
+        filesystem, path = fs.FileSystem.from_uri(output)
+    else:
+        filesystem, path = fs.LocalFileSystem(), os.path.abspath(output)
+    return filesystem, path
+
+
+def write_batches(filesystem, path, schema, batches):
+    """Streams lists of row dicts into one Parquet file, one row group per batch"""
+    rows = 0
+    size = 0
+    with filesystem.open_output_stream(path) as stream:
+        with pq.ParquetWriter(stream, schema) as writer:
+            for batch in batches:
+                # Table.from_pylist needs pyarrow 7, the namenode's python 3.6 gets at most 6.0.1
+                table = pa.Table.from_pydict({name: [row[name] for row in batch] for name in schema.names},
+                                             schema=schema)
+                writer.write_table(table)
+                rows += table.num_rows
+                size += table.nbytes
+    return rows, size
+
+
+# ================
+# MySQL
+# ================
+
+def review_ranges(host, chunk_size, since_id=None):
+    """Splits the id space of kindle_reviews (after since_id) into [start, end) ranges"""
+    con = db.connect(host=host, user=SQL_USER, passwd=SQL_PW, db=SQL_DB)
+    try:
+        cursor = con.cursor()
+        cursor.execute("SELECT MIN(id), MAX(id) FROM kindle_reviews WHERE id > %s", (since_id or -1,))
+        low, high = cursor.fetchone()
+    finally:
+        con.close()
+    if low is None:
+        return []
+    return [(start, min(start + chunk_size, high + 1)) for start in range(low, high + 1, chunk_size)]
+
+
+def review_batches(host, start, end):
+    columns = ", ".join(REVIEWS_SCHEMA.names)
+    con = db.connect(host=host, user=SQL_USER, passwd=SQL_PW, db=SQL_DB)
+    try:
+        cursor = con.cursor()
+        cursor.execute("SELECT {} FROM kindle_reviews WHERE id >= %s AND id < %s".format(columns), (start, end))
+        while True:
+            rows = cursor.fetchmany(BATCH_SIZE)
+            if not rows:
+                break
+            yield [dict(zip(REVIEWS_SCHEMA.names, row)) for row in rows]
+    finally:
+        con.close()
+
+
+def extract_reviews_chunk(host, filesystem, directory, part, start, end):
+    path = "{}/part-{:05d}.parquet".format(directory, part)
+    return write_batches(filesystem, path, REVIEWS_SCHEMA, review_batches(host, start, end))
+
+
+# ================
+# Mongo
+# ================
+
+def meta_ranges(host, chunks, since_id=None):
+    """Splits kindle_metadata (after since_id) into roughly equal _id ranges with $bucketAuto
+    Returns (min, max, inclusive) tuples, only the last range includes its max"""
+    pipeline = [{"$bucketAuto": {"groupBy": "$_id", "buckets": chunks}}]
+    if since_id is not None:
+        pipeline.insert(0, {"$match": {"_id": {"$gt": since_id}}})
+    client = MongoClient(MONGO_URI.format(host, MONGO_DB))
+    try:
+        buckets = list(client[MONGO_DB].kindle_metadata.aggregate(pipeline, allowDiskUse=True))
+    finally:
+        client.close()
+    return [(b["_id"]["min"], b["_id"]["max"], i == len(buckets) - 1) for i, b in enumerate(buckets)]
+
+
+def to_float(value):
+    """value as a float, None when it is missing or not a number"""
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def meta_row(doc):
+    """Coerces a kindle_metadata document into META_SCHEMA"""
+    related = doc.get("related") or {}
+    return {
+        "_id": str(doc.get("_id")),
+        "asin": doc.get("asin"),
+        "title": doc.get("title"),
+        "price": to_float(doc.get("price")),
+        "imUrl": doc.get("imUrl"),
+        "description": doc.get("description"),
+        "categories": doc.get("categories"),
+        "related": {field: related.get(field) for field in RELATED_FIELDS},
+    }
+
+
+def meta_batches(host, low, high, inclusive):
+    client = MongoClient(MONGO_URI.format(host, MONGO_DB))
+    try:
+        query = {"_id": {"$gte": low, "$lte" if inclusive else "$lt": high}}
+        projection = {field: 1 for field in META_SCHEMA.names}
+        cursor = client[MONGO_DB].kindle_metadata.find(query, projection, batch_size=BATCH_SIZE)
+        batch = []
+        for doc in cursor:
+            batch.append(meta_row(doc))
+            if len(batch) == BATCH_SIZE:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    finally:
+        client.close()
+
+
+def extract_meta_chunk(host, filesystem, directory, part, low, high, inclusive):
+    path = "{}/part-{:05d}.parquet".format(directory, part)
+    return write_batches(filesystem, path, META_SCHEMA, meta_batches(host, low, high, inclusive))
+
+
+# ================
+# Driver
+# ================
+
+def run_parallel(name, tasks, workers):
+    """Runs (fn, args) tasks on a thread pool and logs the throughput"""
+    start = time.time()
+    total_rows = 0
+    total_size = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(fn, *args) for fn, args in tasks]
+        for future in as_completed(futures):
+            rows, size = future.result()
+            total_rows += rows
+            total_size += size
+            elapsed = time.time() - start
+            logger.info("%s: %d rows, %.1f rows/s", name, total_rows, total_rows / max(elapsed, 1e-9))
+    elapsed = time.time() - start
+    logger.info("%s done: %d rows, %.1f MB in %.1fs (%.1f rows/s, %.1f MB/s)", name, total_rows,
+                total_size / 1e6, elapsed, total_rows / max(elapsed, 1e-9), total_size / 1e6 / max(elapsed, 1e-9))
+    return total_rows
+
+
+def reset_dir(filesystem, directory):
+    filesystem.delete_dir_contents(directory, missing_dir_ok=True)
+    filesystem.create_dir(directory)
+
+
+def parts(filesystem, directory):
+    """Returns the paths of the parquet part files in directory"""
+    selector = fs.FileSelector(directory, allow_not_found=True)
+    return sorted(info.path for info in filesystem.get_file_info(selector) if info.path.endswith(".parquet"))
+
+
+def review_watermark(filesystem, state_dir):
+    """Returns the smallest review id every incremental spark job has processed,
+    or None if one of them has no state yet"""
+    ids = []
+    for job in INCREMENTAL_JOBS:
+        directory = "{}/{}/current/watermark".format(state_dir, job)
+        files = [info.path for info in filesystem.get_file_info(fs.FileSelector(directory, allow_not_found=True))
+                 if info.path.endswith(".json")]
+        if not files:
+            return None
+        with filesystem.open_input_stream(files[0]) as stream:
+            ids.append(json.loads(stream.read().decode("utf-8").splitlines()[0])["id"])
+    return min(ids)
+
+
+def last_meta_id(filesystem, meta_files):
+    """Returns the largest _id already extracted. ObjectId hex strings sort like the ids"""
+    last = None
+    for path in meta_files:
+        with filesystem.open_input_file(path) as f:
+            ids = pq.read_table(f, columns=["_id"]).column("_id").to_pylist()
+        last = max([last] + ids, key=lambda i: i or "")
+    return ObjectId(last) if last else None
+
+
+def extract(sql_host, mongo_host, output, workers=DEFAULT_WORKERS, chunk_size=DEFAULT_CHUNK_SIZE,
+            incremental=False, state_dir=None):
+    filesystem, base = open_output(output)
+
+    since_id = None
+    reviews_dir = base + "/kindle.parquet"
+    if incremental:
+        since_id = review_watermark(filesystem, open_output(state_dir)[1])
+        reviews_dir = base + "/kindle_delta.parquet"
+        logger.info("kindle_reviews: extracting ids after %s", since_id)
+    reset_dir(filesystem, reviews_dir)
+    tasks = [(extract_reviews_chunk, (sql_host, filesystem, reviews_dir, part, start, end))
+             for part, (start, end) in enumerate(review_ranges(sql_host, chunk_size, since_id))]
+    run_parallel("kindle_reviews", tasks, workers)
+
+    meta_dir = base + "/meta.parquet"
+    since_id = None
+    first_part = 0
+    existing = parts(filesystem, meta_dir)
+    if incremental and existing:
+        since_id = last_meta_id(filesystem, existing)
+        first_part = len(existing)
+        logger.info("kindle_metadata: appending books after %s", since_id)
+    else:
+        reset_dir(filesystem, meta_dir)
+    tasks = [(extract_meta_chunk, (mongo_host, filesystem, meta_dir, first_part + part, low, high, inclusive))
+             for part, (low, high, inclusive) in enumerate(meta_ranges(mongo_host, workers * 4, since_id))]
+    run_parallel("kindle_metadata", tasks, workers)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("sql_host", help="IP of the MySQL server")
+    parser.add_argument("mongo_host", help="IP of the Mongo server")
+    parser.add_argument("output", help="Output directory, local path or hdfs://<namenode>:9000/<dir>")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Number of parallel readers")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Review ids per chunk")
+    parser.add_argument("--incremental", action="store_true", help="Only extract rows added since the last run")
+    parser.add_argument("--state", help="State directory of the spark jobs, required with --incremental")
+    args = parser.parse_args()
+    if args.incremental and not args.state:
+        parser.error("--incremental requires --state")
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(asctime)s: %(message)s')
+    extract(args.sql_host, args.mongo_host, args.output, args.workers, args.chunk_size,
+            args.incremental, args.state)
+
+
+if __name__ == "__main__":
+    main()
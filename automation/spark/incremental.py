@@ -0,0 +1,130 @@
+# State kept between incremental runs of the spark jobs. Only used on the driver.
+#
+# Every job keeps its state under <state>/<job>/current: one parquet directory per table and
+# a one row json watermark ({"id": ..., "unixReviewTime": ..., plus job specific counters}).
+# A run writes <state>/<job>/next and then swaps it in, so a failed run leaves the previous
+# state untouched and the next run simply reprocesses the same delta.
+# Output that a run appends elsewhere is staged in <state>/<job>/next/output and only moved to
+# its destination after the swap, so a failed run never leaves part of its output behind.
+
+from pyspark.sql import functions as F
+
+WATERMARK = "watermark"
+STAGED_OUTPUT = "output"
+
+
+def _path(spark, path):
+    jvm = spark.sparkContext._jvm
+    hadoop_path = jvm.org.apache.hadoop.fs.Path(path)
+    filesystem = hadoop_path.getFileSystem(spark.sparkContext._jsc.hadoopConfiguration())
+    return filesystem, hadoop_path
+
+
+def _exists(spark, path):
+    filesystem, hadoop_path = _path(spark, path)
+    return filesystem.exists(hadoop_path)
+
+
+def _recover(spark, root):
+    """Finishes a swap that was interrupted after current was deleted"""
+    current = root + "/current"
+    if not _exists(spark, current) and _exists(spark, root + "/next/" + WATERMARK):
+        filesystem, next_path = _path(spark, root + "/next")
+        filesystem.rename(next_path, _path(spark, current)[1])
+
+
+def staged_output(root):
+    """Directory a run writes its appended output to, see commit_state"""
+    return root + "/next/" + STAGED_OUTPUT
+
+
+def publish(spark, root, output):
+    """Moves the output staged by the committed run into output (one partition level, like
+    bucket=N). Files are moved one by one, so an interrupted publish is finished by the next one"""
+    hadoop_path = spark.sparkContext._jvm.org.apache.hadoop.fs.Path
+    filesystem, staged = _path(spark, root + "/current/" + STAGED_OUTPUT)
+    if not filesystem.exists(staged):
+        return
+    # listFiles returns qualified paths
+    staged = filesystem.makeQualified(staged)
+    destination = _path(spark, output)[1]
+    files = filesystem.listFiles(staged, True)
+    while files.hasNext():
+        path = files.next().getPath()
+        name = path.getName()
+        # _SUCCESS and the .crc files of the local filesystem
+        if name.startswith("_") or name.startswith("."):
+            continue
+        parent = path.getParent()
+        directory = destination if parent.equals(staged) else hadoop_path(destination, parent.getName())
+        filesystem.mkdirs(directory)
+        # spark part file names carry the id of the job that wrote them, so they do not collide
+        filesystem.rename(path, hadoop_path(directory, name))
+    filesystem.delete(staged, True)
+
+
+def load_state(spark, root, tables, output=None):
+    """Returns (watermark dict, {table: DataFrame}) or (None, None) if the job has no state yet
+    With output, the output staged by the last committed run is published first"""
+    _recover(spark, root)
+    if output:
+        publish(spark, root, output)
+    current = root + "/current"
+    if not _exists(spark, current + "/" + WATERMARK):
+        return None, None
+    watermark = spark.read.json(current + "/" + WATERMARK).first().asDict()
+    return watermark, {table: spark.read.parquet(current + "/" + table) for table in tables}
+
+
+def commit_state(spark, root, watermark, frames, output=None, replace=False):
+    """Writes the new state next to the current one and swaps it in
+    With output, what the run wrote to staged_output(root) is then moved into output
+    With replace, output is emptied first (a run without previous state covers every review)"""
+    next_dir = root + "/next"
+    for table, df in frames.items():
+        df.write.mode("overwrite").parquet(next_dir + "/" + table)
+    # the watermark is written last, a next directory without one is incomplete
+    spark.createDataFrame([watermark]).coalesce(1).write.mode("overwrite").json(next_dir + "/" + WATERMARK)
+
+    if output and replace:
+        # before the swap: if it is interrupted the next run has no state either and replaces again
+        filesystem, output_path = _path(spark, output)
+        if filesystem.exists(output_path):
+            filesystem.delete(output_path, True)
+
+    filesystem, current = _path(spark, root + "/current")
+    if filesystem.exists(current):
+        filesystem.delete(current, True)
+    filesystem.rename(_path(spark, next_dir)[1], current)
+    if output:
+        publish(spark, root, output)
+
+
+def delta(reviews_df, watermark):
+    """Returns the reviews added after the watermark"""
+    if watermark is None:
+        return reviews_df
+    return reviews_df.filter(F.col("id").cast("long") > watermark["id"])
+
+
+def advance(reviews_df, watermark, **counters):
+    """Returns the watermark after processing reviews_df"""
+    aggs = [F.max(F.col("id").cast("long")).alias("id")]
+    if "unixReviewTime" in reviews_df.columns:
+        aggs.append(F.max(F.col("unixReviewTime").cast("long")).alias("unixReviewTime"))
+    row = reviews_df.agg(*aggs).first().asDict()
+    new = dict(watermark or {"id": 0, "unixReviewTime": 0})
+    if row["id"] is not None:
+        new["id"] = max(new["id"], int(row["id"]))
+    if row.get("unixReviewTime") is not None:
+        new["unixReviewTime"] = max(new.get("unixReviewTime") or 0, int(row["unixReviewTime"]))
+    new.update(counters)
+    return new
+
+
+def merge_sums(old, new, keys):
+    """Adds up two partial aggregates that share the same key and sum columns"""
+    if old is None:
+        return new
+    columns = [c for c in new.columns if c not in keys]
+    return old.unionByName(new).groupBy(*keys).agg(*[F.sum(c).alias(c) for c in columns])
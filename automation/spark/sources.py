@@ -0,0 +1,50 @@
+# Helpers shared by the spark jobs. Only used on the driver, so spark-submit finds this
+# module next to the job without --py-files.
+#
+# Jobs take a master that is either the DNS of the EC2 namenode (spark://<dns>:7077, data on
+# hdfs://<dns>:9000) or a spark master url such as local[4]. With a master url, inputs default
+# to the sample data in spark/data and outputs go to ./output.
+
+import os
+
+SAMPLE_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+SAMPLES = {"kindle.parquet": "kindle_short.csv", "meta.parquet": "meta_short.json"}
+
+
+def is_cluster(master):
+    """True if master is the DNS/IP of the namenode rather than a spark master url"""
+    return not (master.startswith("local") or "://" in master)
+
+
+def spark_master(master):
+    if is_cluster(master):
+        return "spark://{}:7077".format(master)
+    return master
+
+
+def default_input(master, name):
+    """Returns hdfs://<master>:9000/data/<name> on the cluster, the matching sample file otherwise"""
+    if is_cluster(master):
+        return "hdfs://{}:9000/data/{}".format(master, name)
+    return "file://" + os.path.join(SAMPLE_DATA, SAMPLES.get(name, name))
+
+
+def default_output(master, name):
+    """Returns hdfs://<master>:9000/<name> on the cluster, file://<cwd>/output/<name> otherwise"""
+    if is_cluster(master):
+        return "hdfs://{}:9000/{}".format(master, name)
+    return "file://" + os.path.join(os.getcwd(), "output", name)
+
+
+def read_table(spark, path):
+    """Reads a dataset, picking the format from the path: parquet (default), csv or json"""
+    path_lower = path.rstrip("/").lower()
+    if path_lower.endswith(".csv"):
+        df = spark.read.csv(path, header=True, sep=",", multiLine=True, escape='"')
+        # pandas exports (like the sample data) have an unnamed index column instead of id
+        if "id" not in df.columns and "_c0" in df.columns:
+            df = df.withColumnRenamed("_c0", "id")
+        return df
+    if path_lower.endswith(".json"):
+        return spark.read.json(path)
+    return spark.read.parquet(path)
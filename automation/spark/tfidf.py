@@ -1,42 +1,108 @@
-import sys
+import argparse
+import time
 import pyspark
 from pyspark.sql import SparkSession
 from pyspark.ml.feature import CountVectorizer, IDF, Tokenizer
-from pyspark.sql.functions import udf, col
-from pyspark.sql.types import StringType
+from pyspark.sql import functions as F
+from pyspark.sql.functions import udf
+from sources import read_table, spark_master, default_input, default_output
+from incremental import load_state, commit_state, staged_output, delta, advance, merge_sums
 
 # to run
 # $SPARK_HOME/bin/spark-submit --master spark://<master-ip>:7077 tfidf.py <master-ip>
 # $SPARK_HOME/bin/spark-submit --master spark://ec2-54-169-135-228.ap-southeast-1.compute.amazonaws.com:7077 tfidf.py ec2-54-169-135-228.ap-southeast-1.compute.amazonaws.com
+# optional: --vocab-size 5000 --min-df 2 --top-k 10 --benchmark
+# optional: --incremental --input hdfs://<master-ip>:9000/data/kindle_delta.parquet
+# locally, on the sample data in spark/data: python tfidf.py local[4]
 
+DEFAULT_VOCAB_SIZE = 20
+DEFAULT_MIN_DF = 1.0
+DEFAULT_TOP_K = 10
+DEFAULT_BUCKETS = 16
 
-sc = pyspark.SparkContext("spark://{}:7077".format(sys.argv[1]), "tfidf")
-spark = SparkSession(sc)
 
-data = spark.read.csv("hdfs://{}:9000/data/{}".format(sys.argv[1], "kindle.csv"), header=True, sep=",")
+def tokenize(data):
+    """Drops rows without review text and splits the text into lowercase words"""
+    # drop rows with null values in reviews
+    data = data.na.drop(subset=["reviewText"])
+    tokenizer = Tokenizer(inputCol="reviewText", outputCol="words")
+    return tokenizer.transform(data)
 
-# drop rows with null values in reviews
-data = data.na.drop(subset=["reviewText"])
 
-# convert to words
-tokenizer = Tokenizer(inputCol="reviewText", outputCol="words")
-wordsData = tokenizer.transform(data)
+def term_counts(words_data):
+    """Returns one row per (document, word) with the term frequency of the word in that review"""
+    terms = words_data.select("id", "asin", F.explode("words").alias("word"))
+    terms = terms.filter(F.col("word") != "")
+    return terms.groupBy("id", "asin", "word").agg(F.count(F.lit(1)).alias("tf"))
 
 
-# use CountVectorizer to get term frequency vectors
-cv = CountVectorizer(inputCol="words", outputCol="rawFeatures", vocabSize=20)
-model = cv.fit(wordsData)
-featurizedData = model.transform(wordsData)
+def document_frequencies(terms):
+    """Returns one row per word with its total count and the number of reviews containing it"""
+    return terms.groupBy("word").agg(F.sum("tf").alias("term_count"),
+                                     F.count(F.lit(1)).alias("df"))
 
-vocab = model.vocabulary
 
-# Applying IDF needs two passes:
-# First to compute the IDF vector and second to scale the term frequencies by IDF.
-idf = IDF(inputCol="rawFeatures", outputCol="features")
-idfModel = idf.fit(featurizedData)
-rescaledData = idfModel.transform(featurizedData)
+def vocabulary(frequencies, n_docs, vocab_size, min_df):
+    """Picks the vocab_size most frequent words, the same way CountVectorizer does,
+    and attaches the smoothed idf used by pyspark.ml.feature.IDF
+    min_df is a document count if >= 1, otherwise a fraction of n_docs"""
+    min_count = min_df if min_df >= 1 else min_df * n_docs
+    vocab = frequencies.filter(F.col("df") >= min_count) \
+        .orderBy(F.col("term_count").desc(), F.col("word")) \
+        .limit(vocab_size)
+    return vocab.select("word", F.log((F.lit(n_docs) + 1) / (F.col("df") + 1)).alias("idf"))
 
 
+def score(terms, vocab, top_k, buckets):
+    """Returns one row per review with a word -> tfidf map and its top_k words
+    Only the words present in a review are touched, nothing is densified"""
+    scored = terms.join(F.broadcast(vocab), ["word"]) \
+        .withColumn("tfidf", F.col("tf") * F.col("idf"))
+    docs = scored.groupBy("id", "asin").agg(
+        F.map_from_entries(F.collect_list(F.struct("word", "tfidf"))).alias("tfidf"),
+        F.sort_array(F.collect_list(F.struct("tfidf", "word")), asc=False).alias("ranked"))
+    return docs.select(
+        "id", "asin", "tfidf",
+        F.expr("transform(slice(ranked, 1, {}), t -> t.word)".format(top_k)).alias("top_terms"),
+        F.expr("pmod(hash(asin), {})".format(buckets)).alias("bucket"))
+
+
+def native_tfidf(data, vocab_size, min_df, top_k, buckets):
+    """Computes tfidf with native Spark functions only"""
+    words_data = tokenize(data)
+    n_docs = words_data.count()
+    terms = term_counts(words_data).cache()
+    vocab = vocabulary(document_frequencies(terms), n_docs, vocab_size, min_df)
+    return score(terms, vocab, top_k, buckets)
+
+
+def tfidf_incremental(spark, state_root, data, output, vocab_size, min_df, top_k, buckets):
+    """Scores the reviews added since the last incremental run and appends them to output
+    Document frequencies are kept under state_root and merged with those of the new reviews,
+    so the idf reflects the whole corpus. Rows written by earlier runs keep the idf of their
+    run, the current vocabulary and idf are written to <output>_vocab for rescaling.
+    The scored rows are staged with the state and only appended to output once it is committed,
+    so a run that fails is repeated without duplicating rows. Without state every review is
+    scored, so output is replaced instead of appended to."""
+    watermark, state = load_state(spark, state_root, ["frequencies"], output)
+    new_reviews = delta(data, watermark)
+
+    words_data = tokenize(new_reviews)
+    n_docs = words_data.count() + (watermark["n_docs"] if watermark else 0)
+    terms = term_counts(words_data).cache()
+    frequencies = merge_sums(state["frequencies"] if state else None, document_frequencies(terms), ["word"])
+    vocab = vocabulary(frequencies, n_docs, vocab_size, min_df).cache()
+
+    score(terms, vocab, top_k, buckets).write.mode("overwrite").partitionBy("bucket").parquet(staged_output(state_root))
+    vocab.write.mode("overwrite").parquet(output + "_vocab")
+    commit_state(spark, state_root, advance(new_reviews, watermark, n_docs=n_docs), {"frequencies": frequencies},
+                 output, replace=watermark is None)
+
+
+# ======================
+# Previous implementation, kept for benchmarking
+# ======================
+
 # trying to map the index of word -> actual word cause CountVectorizer gives index
 def map_to_word1(row, vocab):
     d = {}
@@ -49,11 +115,85 @@ def map_to_word1(row, vocab):
             d[word] = tfidf
     return str(d)
 
+
 def map_to_word(vocab):
     return udf(lambda row: map_to_word1(row, vocab))
 
-# apply udf to convert index back to word
-df = rescaledData.withColumn("tfidf", map_to_word(vocab)(rescaledData.features))
 
-output = df.select("id", "tfidf")
-output.write.format("csv").save("hdfs://{}:9000/tfidf".format(sys.argv[1]))
\ No newline at end of file
+def udf_tfidf(data, vocab_size, min_df):
+    """Computes tfidf with CountVectorizer/IDF and maps indices back to words in a python udf"""
+    wordsData = tokenize(data)
+    # use CountVectorizer to get term frequency vectors
+    cv = CountVectorizer(inputCol="words", outputCol="rawFeatures", vocabSize=vocab_size, minDF=min_df)
+    model = cv.fit(wordsData)
+    featurizedData = model.transform(wordsData)
+    # Applying IDF needs two passes:
+    # First to compute the IDF vector and second to scale the term frequencies by IDF.
+    idfModel = IDF(inputCol="rawFeatures", outputCol="features").fit(featurizedData)
+    rescaledData = idfModel.transform(featurizedData)
+    # apply udf to convert index back to word
+    df = rescaledData.withColumn("tfidf", map_to_word(model.vocabulary)(rescaledData.features))
+    return df.select("id", "tfidf")
+
+
+def benchmark(data, output, vocab_size, min_df, top_k, buckets):
+    """Times the udf implementation against the native one, writing both outputs"""
+    start = time.time()
+    udf_tfidf(data, vocab_size, min_df).write.mode("overwrite").csv(output + "_bench_udf")
+    udf_time = time.time() - start
+
+    start = time.time()
+    native_tfidf(data, vocab_size, min_df, top_k, buckets).write.mode("overwrite").parquet(output + "_bench_native")
+    native_time = time.time() - start
+
+    print("udf + csv:        {:.2f}s".format(udf_time))
+    print("native + parquet: {:.2f}s".format(native_time))
+    print("speedup:          {:.2f}x".format(udf_time / native_time))
+
+
+def run(spark, input_path, output, vocab_size=DEFAULT_VOCAB_SIZE, min_df=DEFAULT_MIN_DF,
+        top_k=DEFAULT_TOP_K, buckets=DEFAULT_BUCKETS, state=None):
+    """Computes tfidf of the reviews at input_path and writes it as parquet to output
+    With a state directory, only reviews added since the last run with that state are scored"""
+    data = read_table(spark, input_path)
+    if state:
+        tfidf_incremental(spark, state + "/tfidf", data, output, vocab_size, min_df, top_k, buckets)
+        return
+    output_df = native_tfidf(data, vocab_size, min_df, top_k, buckets)
+    output_df.write.mode("overwrite").partitionBy("bucket").parquet(output)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("master", help="DNS of the spark master / hdfs namenode, or a master url like local[4]")
+    parser.add_argument("--input", help="Reviews dataset, defaults to hdfs://<master>:9000/data/kindle.parquet "
+                                        "(the sample csv in spark/data with a master url)")
+    parser.add_argument("--output", help="Output directory, defaults to hdfs://<master>:9000/tfidf (./output/tfidf)")
+    parser.add_argument("--vocab-size", type=int, default=DEFAULT_VOCAB_SIZE)
+    parser.add_argument("--min-df", type=float, default=DEFAULT_MIN_DF,
+                        help="Minimum number (>= 1) or fraction (< 1) of reviews a word must appear in")
+    parser.add_argument("--top-k", type=int, default=DEFAULT_TOP_K, help="Number of top words kept per review")
+    parser.add_argument("--buckets", type=int, default=DEFAULT_BUCKETS, help="Number of output partitions (by asin)")
+    parser.add_argument("--benchmark", action="store_true", help="Compare against the previous udf implementation")
+    parser.add_argument("--incremental", action="store_true", help="Only score reviews added since the last incremental run")
+    parser.add_argument("--state", help="State directory, defaults to hdfs://<master>:9000/state (./output/state)")
+    args = parser.parse_args()
+
+    input_path = args.input or default_input(args.master, "kindle.parquet")
+    output = args.output or default_output(args.master, "tfidf")
+
+    sc = pyspark.SparkContext(spark_master(args.master), "tfidf")
+    spark = SparkSession(sc)
+
+    if args.benchmark:
+        benchmark(read_table(spark, input_path), output, args.vocab_size, args.min_df, args.top_k, args.buckets)
+        return
+
+    state = None
+    if args.incremental:
+        state = args.state or default_output(args.master, "state")
+    run(spark, input_path, output, args.vocab_size, args.min_df, args.top_k, args.buckets, state)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import os
+import socket
+import sys
+import urllib.request
+import pytest
+import yaml
+
+moto_server = pytest.importorskip("moto.server")
+boto3 = pytest.importorskip("boto3")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils.user as user
+from utils.provision import ConfigFile, provision
+
+# Runs the provisioning DAG against a local moto server, e.g.
+#   pip install -r requirements-test.txt && python -m pytest tests
+
+AMI = "ami-12c6146b"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(scope="session")
+def server_url():
+    port = free_port()
+    server = moto_server.ThreadedMotoServer(ip_address="127.0.0.1", port=port)
+    server.start()
+    yield "http://127.0.0.1:%d" % port
+    server.stop()
+
+
+@pytest.fixture
+def endpoint(server_url):
+    # moto keeps its state for the whole process, every test starts from an empty account
+    urllib.request.urlopen(urllib.request.Request(server_url + "/moto-api/reset", method="POST")).close()
+    user.init()
+    user.ACCESS_KEY = "testing"
+    user.SECRET_KEY = "testing"
+    user.KEY_PAIR = "test-key"
+    user.REGION = "ap-southeast-1"
+    user.NODES = 3
+    user.REPLICAS = 1
+    user.ENDPOINT_URL = server_url
+    return user.ENDPOINT_URL
+
+
+def ec2(endpoint):
+    return boto3.client("ec2", region_name=user.REGION, aws_access_key_id="testing",
+                        aws_secret_access_key="testing", endpoint_url=endpoint)
+
+
+def running_instances(endpoint):
+    reservations = ec2(endpoint).describe_instances()["Reservations"]
+    return {i["InstanceId"] for r in reservations for i in r["Instances"]}
+
+
+def read_config(path):
+    with open(path) as file:
+        return yaml.load(file, Loader=yaml.FullLoader)
+
+
+def test_provision_records_everything(endpoint, tmp_path):
+    path = str(tmp_path / "config.yml")
+    provisioned = provision(ConfigFile({}, path), "127.0.0.1", AMI, AMI, "t2.micro", "t2.medium")
+
+    config = read_config(path)
+    assert len(provisioned["hadoop"]) == 3
+    assert len(config["SLAVES"]) == 2
+    assert len(config["MYSQL_REPLICAS"]) == 1 and len(config["MONGO_REPLICAS"]) == 1
+    assert set(config["INSTANCE_IDS"]) == running_instances(endpoint)
+    assert len(config["SECURITY_GROUPS"]) == 4
+
+    # the databases accept their own group and flask's group
+    mysql_group = provisioned["mysql_sg"]
+    group = ec2(endpoint).describe_security_groups(GroupIds=[mysql_group])["SecurityGroups"][0]
+    pairs = {pair["GroupId"] for rule in group["IpPermissions"] for pair in rule.get("UserIdGroupPairs", [])}
+    assert pairs == {mysql_group, provisioned["flask_sg"]}
+
+
+def test_failed_provision_leaves_resources_in_config(endpoint, tmp_path):
+    path = str(tmp_path / "config.yml")
+
+    def fail(flask):
+        raise RuntimeError("ingress failed")
+
+    with pytest.raises(RuntimeError, match="ingress failed"):
+        provision(ConfigFile({}, path), "127.0.0.1", AMI, AMI, "t2.micro", "t2.medium",
+                  extra_tasks={"fail": (fail, ["flask"])})
+
+    # clean.py finds every instance and security group created before the failure
+    config = read_config(path)
+    assert "FLASK" not in config
+    assert set(config["INSTANCE_IDS"]) == running_instances(endpoint)
+    assert len(config["SECURITY_GROUPS"]) == 4
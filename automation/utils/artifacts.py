@@ -0,0 +1,212 @@
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+import hashlib
+import logging
+import os
+import tarfile
+import threading
+import time
+import urllib.request
+import zipfile
+import yaml
+from utils.ssh import sessions
+
+logger = logging.getLogger("logger")
+
+# Everything the instances need is packaged once into a local cache as a .tar.gz named after
+# the hash of its contents. Shipping an artifact copies it over the shared ssh connection and
+# unpacks it, unless the node already has that hash, so re-deploying unchanged code or data
+# costs a single `cat` per artifact.
+
+REPO = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+CACHE_DIR = os.path.join(REPO, "automation", "cache")
+MANIFEST_PATH = os.path.join(CACHE_DIR, "manifest.yml")
+MARKER_DIR = ".artifacts"
+SKIP = ("__pycache__", "node_modules", ".pyenv", ".env", "dist", "catalog.bin")
+
+# name -> one of
+#   files: {repo path: path in the archive}
+#   dirs: [repo directories, kept at the same path in the archive]
+#   url: downloaded once; select picks members of a zip, name renames a single file
+ARTIFACTS = {
+    "app": {"dirs": ["server", "static"]},
+    "spark-jobs": {"files": {"automation/spark/extract.py": "extract.py",
+                             "automation/spark/sources.py": "sources.py",
+                             "automation/spark/incremental.py": "incremental.py",
+                             "automation/spark/correlation.py": "correlation.py",
+                             "automation/spark/tfidf.py": "tfidf.py",
+                             "automation/spark/embedded.py": "embedded.py",
+                             "automation/scripts/analytics/ACTIVATE.sh": "ACTIVATE.sh"}},
+    "loader": {"files": {"automation/scripts/loader.py": "loader.py"}},
+    "kindle-reviews": {"url": "https://istd50043.s3-ap-southeast-1.amazonaws.com/kindle-reviews.zip",
+                       "select": ["kindle_reviews.csv"]},
+    "kindle-metadata": {"url": "https://istd50043.s3-ap-southeast-1.amazonaws.com/meta_kindle_store.zip",
+                        "select": ["meta_Kindle_Store.json"]},
+    "categories": {"url": "https://www.dropbox.com/s/7r3ajphm9vytn2b/categories.json?dl=0",
+                   "name": "categories.json"},
+}
+
+_manifest_lock = threading.Lock()
+_build_locks = {name: threading.Lock() for name in ARTIFACTS}
+
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+    with open(MANIFEST_PATH) as file:
+        return yaml.load(file, Loader=yaml.FullLoader) or {}
+
+
+def save_manifest(name, entry):
+    with _manifest_lock:
+        manifest = load_manifest()
+        manifest[name] = entry
+        with open(MANIFEST_PATH, 'w') as file:
+            yaml.dump(manifest, file)
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def local_members(spec):
+    """Returns sorted [(absolute path, path in the archive)] of a files/dirs artifact"""
+    members = [(os.path.join(REPO, path), arcname) for path, arcname in spec.get("files", {}).items()]
+    for directory in spec.get("dirs", []):
+        for root, dirs, files in os.walk(os.path.join(REPO, directory)):
+            dirs[:] = [d for d in dirs if d not in SKIP]
+            for file_name in files:
+                if file_name in SKIP or file_name.endswith(".pyc"):
+                    continue
+                path = os.path.join(root, file_name)
+                members.append((path, os.path.relpath(path, REPO)))
+    return sorted(members, key=lambda member: member[1])
+
+
+def content_hash(members):
+    digest = hashlib.sha256()
+    for path, arcname in members:
+        digest.update(arcname.encode("utf-8") + b"\0")
+        digest.update(sha256_file(path).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def write_archive(archive_path, entries):
+    """Writes a reproducible .tar.gz (no timestamps or owners)
+        Parameters: entries, list of (path in the archive, open binary file, size, mode)"""
+    tmp = archive_path + ".part"
+    with open(tmp, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as gz, \
+            tarfile.open(fileobj=gz, mode='w') as tar:
+        for arcname, fileobj, size, mode in entries:
+            info = tarfile.TarInfo(arcname)
+            info.size = size
+            info.mode = mode
+            tar.addfile(info, fileobj)
+    os.replace(tmp, archive_path)
+
+
+def download(url, path):
+    if os.path.exists(path):
+        return path
+    logger.info("Downloading %s..." % url)
+    urllib.request.urlretrieve(url, path + ".part")
+    os.replace(path + ".part", path)
+    return path
+
+
+def build(name):
+    """Packages an artifact into the cache unless its contents are unchanged
+        Return: manifest entry {file, sha256, size}"""
+    with _build_locks[name]:
+        return _build(name, ARTIFACTS[name])
+
+
+def _build(name, spec):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    cached = load_manifest().get(name)
+
+    if "url" in spec:
+        # remote sources are immutable, the download and archive are reused as long as they exist
+        if cached and os.path.exists(os.path.join(CACHE_DIR, cached["file"])):
+            return cached
+        source = download(spec["url"], os.path.join(CACHE_DIR, "download-" + name))
+        if "select" in spec:
+            with zipfile.ZipFile(source) as archive:
+                infos = [archive.getinfo(member) for member in spec["select"]]
+                entries = [(info.filename, archive.open(info), info.file_size, 0o644) for info in infos]
+                archive_path = os.path.join(CACHE_DIR, name + ".tar.gz")
+                write_archive(archive_path, entries)
+        else:
+            archive_path = os.path.join(CACHE_DIR, name + ".tar.gz")
+            with open(source, 'rb') as f:
+                write_archive(archive_path, [(spec["name"], f, os.path.getsize(source), 0o644)])
+        digest = sha256_file(archive_path)
+    else:
+        members = local_members(spec)
+        digest = content_hash(members)
+        if cached and cached["sha256"] == digest and os.path.exists(os.path.join(CACHE_DIR, cached["file"])):
+            return cached
+        archive_path = os.path.join(CACHE_DIR, name + ".tar.gz")
+        files = [open(path, 'rb') for path, arcname in members]
+        try:
+            write_archive(archive_path, [(arcname, f, os.path.getsize(path), os.stat(path).st_mode & 0o777)
+                                         for (path, arcname), f in zip(members, files)])
+        finally:
+            for f in files:
+                f.close()
+
+    final_path = os.path.join(CACHE_DIR, "%s-%s.tar.gz" % (name, digest[:12]))
+    os.replace(archive_path, final_path)
+    entry = {"file": os.path.basename(final_path), "sha256": digest, "size": os.path.getsize(final_path)}
+    save_manifest(name, entry)
+    if cached and cached["file"] != entry["file"] and os.path.exists(os.path.join(CACHE_DIR, cached["file"])):
+        os.remove(os.path.join(CACHE_DIR, cached["file"]))
+    logger.info("Packaged %s (%s, %.1f MB)" % (name, digest[:12], entry["size"] / 1e6))
+    return entry
+
+
+def build_all(names=None):
+    """Builds the artifacts concurrently (downloads overlap), returns name -> manifest entry"""
+    names = list(names or ARTIFACTS)
+    with ThreadPoolExecutor(max_workers=len(names) or 1) as pool:
+        return dict(zip(names, pool.map(build, names)))
+
+
+def remote_hash(host, user, dest, name):
+    exit_status, stdout, stderr = sessions.run(host, user, "cat %s/%s/%s 2>/dev/null" % (dest, MARKER_DIR, name))
+    return stdout.strip() if exit_status == 0 else None
+
+
+def ship(host, user, name, dest):
+    """Copies an artifact to host and unpacks it into dest, unless dest already has the same hash
+        Return: "cached" or "shipped" """
+    entry = build(name)
+    if remote_hash(host, user, dest, name) == entry["sha256"]:
+        logger.info("%s: %s is up to date" % (host, name))
+        return "cached"
+
+    start = time.time()
+    remote_archive = "/tmp/" + entry["file"]
+    sessions.put(host, user, os.path.join(CACHE_DIR, entry["file"]), remote_archive)
+    cmd = ("sudo mkdir -p {dest}/{markers} && sudo chown {user}: {dest} {dest}/{markers}"
+           " && echo '{sha256}  {archive}' | sha256sum -c --quiet"
+           " && tar -xzf {archive} -C {dest} && rm {archive}"
+           " && echo {sha256} > {dest}/{markers}/{name}").format(
+        dest=dest, markers=MARKER_DIR, user=user, sha256=entry["sha256"], archive=remote_archive, name=name)
+    exit_status, stdout, stderr = sessions.run(host, user, cmd)
+    if exit_status != 0:
+        raise RuntimeError("%s: could not unpack %s: %s" % (host, name, stderr.strip()))
+    logger.info("%s: shipped %s (%.1f MB) in %.1fs" % (host, name, entry["size"] / 1e6, time.time() - start))
+    return "shipped"
+
+
+def ship_all(deliveries):
+    """Ships artifacts concurrently
+        Parameters: deliveries, list of (host, user, artifact name, destination directory)
+        Return: list of "cached"/"shipped", in order"""
+    with ThreadPoolExecutor(max_workers=len(deliveries) or 1) as pool:
+        return list(pool.map(lambda delivery: ship(*delivery), deliveries))
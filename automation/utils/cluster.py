@@ -0,0 +1,127 @@
+from concurrent.futures import ThreadPoolExecutor
+from string import Template
+import logging
+import os
+import time
+from utils.ssh import sessions
+
+logger = logging.getLogger("logger")
+
+# Configures the hadoop/spark cluster for any number of datanodes. The config files are rendered
+# from templates/hadoop and pushed over the shared ssh connections, and every datanode is set up
+# at the same time, so a large cluster configures in about the time of a single node.
+
+USER = "ubuntu"
+TEMPLATES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates", "hadoop")
+HADOOP_HOME = "/home/ubuntu/server/hadoop-2.8.5"
+HADOOP_CONF = HADOOP_HOME + "/etc/hadoop"
+SPARK_HOME = "/usr/lib/spark"
+DATA_DIR = "/usr/local/hadoop/hdfs/data"
+
+
+def render(name, **values):
+    """Fills in the $placeholders of templates/hadoop/<name>"""
+    with open(os.path.join(TEMPLATES, name)) as f:
+        return Template(f.read()).substitute(**values)
+
+
+def run(host, cmd, user=USER):
+    """Runs cmd on host, raises RuntimeError if it fails"""
+    exit_status, stdout, stderr = sessions.run(host, user, cmd)
+    if exit_status != 0:
+        raise RuntimeError("%s: '%s' exited with %d: %s" % (host, cmd, exit_status, stderr.strip()))
+    return stdout
+
+
+def push(host, files):
+    """Writes files (dict of remote path -> content) to host, replacing the current ones"""
+    for path, content in files.items():
+        staged = "/tmp/isit_" + os.path.basename(path)
+        sessions.write(host, USER, content, staged)
+        run(host, "sudo install -o ubuntu -g ubuntu -m 644 %s %s && rm %s" % (staged, path, staged))
+
+
+def parallel(fn, items):
+    """Calls fn on every item at the same time, returns the results in order"""
+    with ThreadPoolExecutor(max_workers=len(items) or 1) as pool:
+        return list(pool.map(fn, items))
+
+
+def render_configs(master, slaves):
+    """Returns (namenode files, datanode files), each a dict of remote path -> content"""
+    namenode = master["DNS"]
+    replication = min(3, len(slaves))
+    core_site = render("core-site.xml", namenode=namenode)
+
+    ssh_hosts = [(master, "nnode")] + [(slave, "dnode%d" % i) for i, slave in enumerate(slaves, 1)]
+    ssh_config = "".join(render("ssh_host", alias="%s %s" % (alias, node["DNS"]), host=node["DNS"])
+                         for node, alias in ssh_hosts)
+    # start-dfs.sh starts the secondary namenode over ssh on 0.0.0.0
+    ssh_config += render("ssh_host", alias="0.0.0.0 localhost", host="localhost")
+
+    namenode_files = {
+        HADOOP_CONF + "/core-site.xml": core_site,
+        HADOOP_CONF + "/hdfs-site.xml": render("hdfs-site.xml", replication=replication,
+                                               data_dir_property="dfs.namenode.name.dir"),
+        HADOOP_CONF + "/mapred-site.xml": render("mapred-site.xml", namenode=namenode),
+        HADOOP_CONF + "/yarn-site.xml": render("yarn-site.xml", namenode=namenode),
+        HADOOP_CONF + "/masters": namenode + "\n",
+        HADOOP_CONF + "/slaves": "".join(slave["DNS"] + "\n" for slave in slaves),
+        SPARK_HOME + "/conf/slaves": "".join(slave["IP"] + "\n" for slave in slaves),
+        "/home/ubuntu/.ssh/config": ssh_config,
+    }
+    datanode_files = {
+        HADOOP_CONF + "/core-site.xml": core_site,
+        HADOOP_CONF + "/hdfs-site.xml": render("hdfs-site.xml", replication=replication,
+                                               data_dir_property="dfs.datanode.data.dir"),
+    }
+    return namenode_files, datanode_files
+
+
+def authorize(host, public_key):
+    """Adds public_key to the authorized keys of host (once)"""
+    run(host, "grep -qxF '%s' ~/.ssh/authorized_keys || echo '%s' >> ~/.ssh/authorized_keys" % (public_key, public_key))
+
+
+def setup_datanode(slave, files, public_key):
+    authorize(slave["IP"], public_key)
+    push(slave["IP"], files)
+    run(slave["IP"], "sudo mkdir -p %s && sudo chown -R ubuntu:ubuntu %s" % (DATA_DIR, DATA_DIR))
+    logger.info("Datanode %s configured" % slave["DNS"])
+
+
+def setup_namenode(master, files, public_key):
+    authorize(master["IP"], public_key)
+    push(master["IP"], files)
+    run(master["IP"], "chmod 600 ~/.ssh/config && sudo mkdir -p %s && sudo chown -R ubuntu:ubuntu %s" % (DATA_DIR, DATA_DIR))
+    logger.info("Namenode %s configured" % master["DNS"])
+
+
+def start_cluster(master, slaves):
+    """Formats hdfs, starts hdfs/yarn/spark on the namenode, then a spark worker on every datanode"""
+    run(master["IP"], "yes | %s/bin/hdfs namenode -format" % HADOOP_HOME)
+    run(master["IP"], "%s/sbin/start-dfs.sh" % HADOOP_HOME)
+    run(master["IP"], "%s/sbin/start-yarn.sh" % HADOOP_HOME)
+    run(master["IP"], "%s/sbin/mr-jobhistory-daemon.sh start historyserver" % HADOOP_HOME)
+    run(master["IP"], "%s/sbin/start-master.sh" % SPARK_HOME)
+    parallel(lambda slave: run(slave["IP"], "%s/sbin/start-slave.sh spark://%s:7077" % (SPARK_HOME, master["DNS"])), slaves)
+
+
+def configure_cluster(master, slaves):
+    """Configures and starts hadoop/spark
+        Parameters: master, dict with the DNS and IP of the namenode
+                    slaves, list of dicts with the DNS and IP of the datanodes"""
+    start = time.time()
+    namenode_files, datanode_files = render_configs(master, slaves)
+
+    # passwordless ssh from the namenode to every node, used by start-dfs.sh/start-yarn.sh
+    run(master["IP"], "test -f ~/.ssh/id_rsa || ssh-keygen -t rsa -f ~/.ssh/id_rsa -q -P ''")
+    public_key = run(master["IP"], "cat ~/.ssh/id_rsa.pub").strip()
+
+    tasks = [lambda: setup_namenode(master, namenode_files, public_key)]
+    tasks += [lambda slave=slave: setup_datanode(slave, datanode_files, public_key) for slave in slaves]
+    parallel(lambda task: task(), tasks)
+    logger.info("Configured %d datanodes in %.0fs" % (len(slaves), time.time() - start))
+
+    start_cluster(master, slaves)
+    logger.info("Hdfs is up! Please visit %s:50070" % master["DNS"])
@@ -0,0 +1,42 @@
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import logging
+import time
+
+logger = logging.getLogger("logger")
+
+
+def run_dag(tasks, max_workers=None):
+    """Runs tasks concurrently as soon as their dependencies have finished
+        Parameters: tasks, dict of name -> (function, [dependency names]).
+                    The function is called with the results of its dependencies, in order.
+        Return: dict of name -> result
+        Raises the first exception of a failed task (once the running tasks finished)"""
+    for name, (fn, deps) in tasks.items():
+        unknown = [dep for dep in deps if dep not in tasks]
+        if unknown:
+            raise ValueError("Task %s depends on unknown tasks %s" % (name, unknown))
+
+    pending = dict(tasks)
+    running = {}
+    results = {}
+    started = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(tasks) or 1) as pool:
+        while pending or running:
+            for name in list(pending):
+                fn, deps = pending[name]
+                if all(dep in results for dep in deps):
+                    del pending[name]
+                    started[name] = time.time()
+                    running[pool.submit(fn, *[results[dep] for dep in deps])] = name
+
+            if not running:
+                raise ValueError("Dependency cycle between tasks %s" % list(pending))
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name] = future.result()
+                logger.info("%s finished in %.1fs" % (name, time.time() - started[name]))
+
+    return results
@@ -0,0 +1,149 @@
+import logging
+import os
+import threading
+import yaml
+from utils.dag import run_dag
+from utils.utils import create_security_group, authorize_ingress, launch_instances, wait_for_instances
+import utils.user as user
+
+logger = logging.getLogger("logger")
+
+# Security groups and instances are created concurrently, each instance only waits for its
+# own security group. MySQL/Mongo accept connections from the flask and master IPs, so those
+# ingress rules are added as soon as both instances are running. Read replicas and the flask
+# app reach the databases over private IPs, allowed by security group.
+# Every security group and instance is written to config.yml as soon as it exists, so clean.py
+# removes them even if provisioning fails half way.
+
+CONFIG_PATH = os.path.join("config", "config.yml")
+SCRIPTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts")
+HADOOP_SCRIPT = os.path.join(SCRIPTS, "hadoop_script.sh")
+FLASK_SCRIPT = os.path.join(SCRIPTS, "flask_script.sh")
+SQL_SCRIPT = os.path.join(SCRIPTS, "sql_script.sh")
+MONGO_SCRIPT = os.path.join(SCRIPTS, "mongo_script.sh")
+
+
+class ConfigFile:
+    """CONFIG, written to config.yml after every change"""
+
+    def __init__(self, config, path=CONFIG_PATH):
+        self.config = config
+        self.path = path
+        self._lock = threading.Lock()
+
+    def set(self, key, value):
+        with self._lock:
+            self.config[key] = value
+            self._write()
+
+    def append(self, key, values):
+        with self._lock:
+            self.config.setdefault(key, []).extend(values)
+            self._write()
+
+    def _write(self):
+        with open(self.path, 'w') as file:
+            yaml.dump(self.config, file)
+
+
+def database_info(instance_info):
+    return {"IP": instance_info["PublicIpAddress"], "ID": instance_info["InstanceId"], "PRIVATE_IP": instance_info["PrivateIpAddress"]}
+
+
+def provision(config_file, local_ip, ubuntu_ami, amazon_linux_ami, instance_type, hadoop_instance_type, extra_tasks=None):
+    """Creates the security groups and instances and records them in config_file
+        Parameters: extra_tasks, more run_dag tasks to run alongside (e.g. packaging the artifacts)
+        Return: the run_dag results"""
+    ssh_permission = {'IpProtocol': 'tcp',
+                        'FromPort': 22,
+                        'ToPort': 22,
+                        'IpRanges': [{'CidrIp': local_ip + '/32'}]}
+
+    flask_permissions = [ssh_permission,
+                            {'IpProtocol': 'tcp',
+                            'FromPort': 5000,
+                            'ToPort': 5000,
+                            'IpRanges': [{'CidrIp': '0.0.0.0/0'}]}]
+
+    hadoop_permissions = [{'IpProtocol': 'tcp',
+                            'FromPort': 0,
+                            'ToPort': 65535,
+                            'IpRanges': [{'CidrIp': '0.0.0.0/0'}]}]
+
+    # temporary ssh access, so that can ssh into it and check
+    sql_permissions = [ssh_permission]
+    mongo_permissions = [ssh_permission]
+
+    def security_group(name, permissions):
+        def create():
+            group_id = create_security_group(name, permissions)
+            if group_id is None:
+                raise RuntimeError("Could not create security group %s" % name)
+            config_file.append("SECURITY_GROUPS", [group_id])
+            return group_id
+        return create
+
+    def instances(count, image_id, instance_type, group_name, script_path):
+        def launch(group_id):
+            logger.info('Starting %s instance(s)...' % group_name)
+            instance_ids = launch_instances(count, image_id, instance_type, [group_name], script_path)
+            if instance_ids is None:
+                raise RuntimeError("Could not start %s instances" % group_name)
+            config_file.append("INSTANCE_IDS", instance_ids)
+            info = wait_for_instances(instance_ids)
+            if info is None:
+                raise RuntimeError("%s instances did not start" % group_name)
+            return info
+        return launch
+
+    def database_ingress(port):
+        def authorize(group_id, flask_group, flask_info, hadoop_info):
+            permissions = [{'IpProtocol': 'tcp',
+                            'FromPort': port,
+                            'ToPort': port,
+                            'IpRanges': [{'CidrIp': flask_info[0]["PublicIpAddress"] + '/32'},
+                                        {'CidrIp': local_ip + '/32'},
+                                        {'CidrIp': hadoop_info[0]["PublicIpAddress"] + '/32'}],
+                            'UserIdGroupPairs': [{'GroupId': group_id}, {'GroupId': flask_group}]}]
+            return authorize_ingress(group_id, permissions)
+        return authorize
+
+    tasks = {
+        "flask_sg": (security_group("flask-webapp", flask_permissions), []),
+        "hadoop_sg": (security_group("hadoop", hadoop_permissions), []),
+        "mysql_sg": (security_group("mysql-server", sql_permissions), []),
+        "mongo_sg": (security_group("mongo_db", mongo_permissions), []),
+        "flask": (instances(1, ubuntu_ami, instance_type, "flask-webapp", FLASK_SCRIPT), ["flask_sg"]),
+        "hadoop": (instances(int(user.NODES), ubuntu_ami, hadoop_instance_type, "hadoop", HADOOP_SCRIPT), ["hadoop_sg"]),
+        "mysql": (instances(1 + user.REPLICAS, amazon_linux_ami, instance_type, "mysql-server", SQL_SCRIPT), ["mysql_sg"]),
+        "mongo": (instances(1 + user.REPLICAS, ubuntu_ami, instance_type, "mongo_db", MONGO_SCRIPT), ["mongo_sg"]),
+        "mysql_ingress": (database_ingress(3306), ["mysql_sg", "flask_sg", "flask", "hadoop"]),
+        "mongo_ingress": (database_ingress(27017), ["mongo_sg", "flask_sg", "flask", "hadoop"]),
+    }
+    tasks.update(extra_tasks or {})
+    provisioned = run_dag(tasks)
+
+    for name in ["flask", "hadoop", "mysql", "mongo"]:
+        for instance_info in provisioned[name]:
+            logger.info(f'Launched {name} instance {instance_info["InstanceId"]}')
+            logger.info(f'    VPC ID: {instance_info["VpcId"]}')
+            logger.info(f'    Private IP Address: {instance_info["PrivateIpAddress"]}')
+            logger.info(f'    Public IP Address: {instance_info["PublicIpAddress"]}')
+            logger.info(f'    Current State: {instance_info["State"]["Name"]}')
+
+    flask_instance_info = provisioned["flask"][0]
+    hadoop_instance_info = provisioned["hadoop"]
+
+    config_file.set("FLASK", {"IP": flask_instance_info["PublicIpAddress"], "ID": flask_instance_info["InstanceId"],"DNS": flask_instance_info["PublicDnsName"]})
+    config_file.set("MASTER", {"IP": hadoop_instance_info[0]["PublicIpAddress"],
+                                "ID": hadoop_instance_info[0]["InstanceId"],
+                                "DNS": hadoop_instance_info[0]["PublicDnsName"]})
+    config_file.set("SLAVES", [{"IP": hadoop_instance_info[i]["PublicIpAddress"],
+                                "ID": hadoop_instance_info[i]["InstanceId"],
+                                "DNS": hadoop_instance_info[i]["PublicDnsName"]} for i in range(1, int(user.NODES))])
+    # the first mysql/mongo instance is the primary, the others become its read replicas
+    config_file.set("MYSQL", database_info(provisioned["mysql"][0]))
+    config_file.set("MONGO", database_info(provisioned["mongo"][0]))
+    config_file.set("MYSQL_REPLICAS", [database_info(info) for info in provisioned["mysql"][1:]])
+    config_file.set("MONGO_REPLICAS", [database_info(info) for info in provisioned["mongo"][1:]])
+    return provisioned
@@ -0,0 +1,82 @@
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import random
+import socket
+import time
+from utils.ssh import sessions
+
+logger = logging.getLogger("logger")
+
+# Probes run cheapest first: an open port, then an ssh login, then the marker file written
+# at the end of the instance's user data script.
+DEFAULT_DEADLINE = 1800
+BASE_DELAY = 1
+MAX_DELAY = 30
+
+
+def boot_marker(instance_id):
+    """Path of the file cloud-init writes once the user data script has finished"""
+    return "/var/lib/cloud/instances/%s/boot-finished" % instance_id
+
+
+def backoff(attempt, base=BASE_DELAY, cap=MAX_DELAY):
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def tcp_probe(host, port=22, timeout=3):
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def ssh_probe(host, user):
+    try:
+        sessions.transport(host, user)
+        return True
+    except Exception:
+        sessions.drop(host, user)
+        return False
+
+
+def file_probe(host, user, path):
+    try:
+        exit_status, stdout, stderr = sessions.run(host, user, "test -f %s" % path, timeout=30)
+        return exit_status == 0
+    except Exception:
+        sessions.drop(host, user)
+        return False
+
+
+def wait_ready(host, user, marker=None, port=22, deadline=DEFAULT_DEADLINE):
+    """Blocks until host accepts connections on port, an ssh login and (optionally) marker exists
+        Return: seconds waited
+        Raises TimeoutError once deadline seconds have passed"""
+    probes = [("port %d" % port, lambda: tcp_probe(host, port)),
+              ("ssh", lambda: ssh_probe(host, user))]
+    if marker:
+        probes.append((marker, lambda: file_probe(host, user, marker)))
+
+    start = time.time()
+    for name, probe in probes:
+        attempt = 0
+        while not probe():
+            elapsed = time.time() - start
+            if elapsed > deadline:
+                raise TimeoutError("%s not ready after %ds, waiting for %s" % (host, elapsed, name))
+            time.sleep(min(backoff(attempt), max(deadline - elapsed, 0)))
+            attempt += 1
+        logger.info("%s: %s ready after %.0fs" % (host, name, time.time() - start))
+    return time.time() - start
+
+
+def wait_all(targets, deadline=DEFAULT_DEADLINE):
+    """Waits for several hosts concurrently
+        Parameters: targets, list of (host, user, marker)
+        Return: dict of host -> seconds waited
+        Raises the first TimeoutError"""
+    with ThreadPoolExecutor(max_workers=len(targets) or 1) as pool:
+        futures = {host: pool.submit(wait_ready, host, user, marker, 22, deadline) for host, user, marker in targets}
+        return {host: future.result() for host, future in futures.items()}
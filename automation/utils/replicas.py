@@ -0,0 +1,102 @@
+import base64
+import logging
+import os
+import time
+from utils.cluster import run, parallel
+from utils.readiness import backoff
+from utils.ssh import sessions
+
+logger = logging.getLogger("logger")
+
+# Turns the extra MySQL/Mongo instances into read replicas of the primary ones. Runs before the
+# datasets are loaded, so the replicas receive the data through replication. Replicas talk to
+# the primary over private IPs, which the database security groups allow from their own group.
+
+MYSQL_USER = "ec2-user"
+MONGO_USER = "ubuntu"
+REPLICA_SET = "rs0"
+MYSQL = "mysql -u root -ppassword -e \"%s\""
+MONGO = "mongo -u admin -p password --authenticationDatabase admin --quiet --eval '%s'"
+
+
+def mysql_server_config(server_id, read_only):
+    """Enables the binlog and GTIDs (once), replicas are also made read only"""
+    lines = ["[mysqld]", "server-id=%d" % server_id, "log-bin=mysql-bin",
+             "gtid_mode=ON", "enforce_gtid_consistency=ON"]
+    if read_only:
+        lines.append("read_only=ON")
+    return ("grep -q '^server-id' /etc/my.cnf || (printf '%s\\n' | sudo tee -a /etc/my.cnf > /dev/null"
+            " && sudo service mysqld restart)") % "\\n".join(lines)
+
+
+def configure_mysql_replication(primary, replicas):
+    """Sets up GTID based replication from primary to every replica
+        Parameters: primary/replicas, dicts with the IP and PRIVATE_IP of the instances"""
+    if not replicas:
+        return
+    start = time.time()
+    run(primary["IP"], mysql_server_config(1, False), MYSQL_USER)
+    run(primary["IP"], MYSQL % ("CREATE USER IF NOT EXISTS 'repl'@'%' IDENTIFIED BY 'password'; "
+                                "GRANT REPLICATION SLAVE ON *.* TO 'repl'@'%'"), MYSQL_USER)
+
+    def replica(item):
+        server_id, node = item
+        run(node["IP"], mysql_server_config(server_id, True), MYSQL_USER)
+        run(node["IP"], MYSQL % ("STOP SLAVE; CHANGE MASTER TO MASTER_HOST='%s', MASTER_USER='repl', "
+                                 "MASTER_PASSWORD='password', MASTER_AUTO_POSITION=1; START SLAVE"
+                                 % primary["PRIVATE_IP"]), MYSQL_USER)
+        logger.info("MySQL replica %s is replicating from %s" % (node["IP"], primary["IP"]))
+
+    parallel(replica, list(enumerate(replicas, 2)))
+    logger.info("Configured %d MySQL replicas in %.0fs" % (len(replicas), time.time() - start))
+
+
+def mongo_member_config(host, key):
+    """Installs the replica set key file and adds the replica set to mongod.conf (once)"""
+    sessions.write(host, MONGO_USER, key, "/tmp/mongod.key")
+    run(host, "sudo install -o mongodb -g mongodb -m 400 /tmp/mongod.key /etc/mongod.key && rm /tmp/mongod.key", MONGO_USER)
+    run(host, "grep -q '^replication:' /etc/mongod.conf || ("
+              "sudo sed -i 's,^security:,security:\\n  keyFile: /etc/mongod.key,' /etc/mongod.conf"
+              " && printf 'replication:\\n  replSetName: %s\\n' | sudo tee -a /etc/mongod.conf > /dev/null"
+              " && sudo service mongod restart)" % REPLICA_SET, MONGO_USER)
+
+
+def wait_for_primary(host, deadline=300):
+    start = time.time()
+    attempt = 0
+    while True:
+        try:
+            if run(host, MONGO % "print(db.isMaster().ismaster)", MONGO_USER).strip().endswith("true"):
+                return
+        except RuntimeError:
+            pass
+        if time.time() - start > deadline:
+            raise TimeoutError("%s did not become the replica set primary" % host)
+        time.sleep(backoff(attempt))
+        attempt += 1
+
+
+def configure_mongo_replica_set(primary, replicas):
+    """Makes primary and replicas one replica set and waits until primary is elected
+        Parameters: primary/replicas, dicts with the IP and PRIVATE_IP of the instances"""
+    if not replicas:
+        return
+    start = time.time()
+    # members authenticate to each other with a shared key
+    key = base64.b64encode(os.urandom(756)).decode("ascii")
+    parallel(lambda node: mongo_member_config(node["IP"], key), [primary] + replicas)
+
+    members = ", ".join('{_id: %d, host: "%s:27017", priority: %d}' % (i, node["PRIVATE_IP"], 2 if i == 0 else 1)
+                        for i, node in enumerate([primary] + replicas))
+    # rs.status()/rs.initiate() need clusterAdmin, which instances set up before it was in mongo_script.sh lack
+    run(primary["IP"], MONGO % 'db.getSiblingDB("admin").grantRolesToUser("admin", [{role: "clusterAdmin", db: "admin"}])',
+        MONGO_USER)
+    # a thrown error makes the shell exit non zero, so that run() raises right away
+    run(primary["IP"], MONGO % ('var status = rs.status(); '
+                                'if (status.ok == 0) { '
+                                'if (status.code != 94) { throw new Error("rs.status failed: " + tojson(status)) } '
+                                'var reply = rs.initiate({_id: "%s", members: [%s]}); printjson(reply); '
+                                'if (reply.ok != 1) { throw new Error("rs.initiate failed: " + tojson(reply)) } }'
+                                % (REPLICA_SET, members)), MONGO_USER)
+    wait_for_primary(primary["IP"])
+    logger.info("Configured the mongo replica set with %d secondaries in %.0fs" % (len(replicas), time.time() - start))
@@ -0,0 +1,149 @@
+import io
+import threading
+import time
+import paramiko
+import utils.user
+
+
+class SSHSessions:
+    """Keeps one ssh connection per (host, user) and runs every command on its own channel of
+    that connection, so the key exchange and authentication happen once per host.
+    Parsed keys are cached, dropped connections are reopened when a channel cannot be opened and the latency of
+    every command is recorded per host."""
+
+    def __init__(self, connect_timeout=10):
+        self.connect_timeout = connect_timeout
+        self._keys = {}
+        self._clients = {}
+        self._host_locks = {}
+        self._lock = threading.Lock()
+        self._latency = {}
+
+    def _key(self):
+        key_path = utils.user.KEY_PATH
+        with self._lock:
+            if key_path not in self._keys:
+                self._keys[key_path] = paramiko.RSAKey.from_private_key_file(key_path)
+            return self._keys[key_path]
+
+    def _host_lock(self, host, user):
+        with self._lock:
+            return self._host_locks.setdefault((host, user), threading.Lock())
+
+    def _connect(self, host, user):
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect(hostname=host, username=user, pkey=self._key(),
+                       timeout=self.connect_timeout, banner_timeout=self.connect_timeout)
+        client.get_transport().set_keepalive(30)
+        return client
+
+    def transport(self, host, user):
+        """Returns the open transport to host, connecting if there is none or it dropped"""
+        with self._host_lock(host, user):
+            client = self._clients.get((host, user))
+            if client is None or not client.get_transport() or not client.get_transport().is_active():
+                if client is not None:
+                    client.close()
+                client = self._connect(host, user)
+                self._clients[(host, user)] = client
+            return client.get_transport()
+
+    def drop(self, host, user):
+        """Closes the connection to host, the next command reconnects"""
+        with self._host_lock(host, user):
+            client = self._clients.pop((host, user), None)
+            if client is not None:
+                client.close()
+
+    def _open(self, host, user, opener):
+        """Returns opener(transport), e.g. a new channel
+        A cached transport can die between commands (instance reboot, idle timeout), so failing
+        to open is retried once on a fresh connection. Only opening is retried: once a command
+        started it may have run remotely, and commands like tee -a must not run twice"""
+        try:
+            return opener(self.transport(host, user))
+        except (paramiko.SSHException, EOFError, OSError):
+            self.drop(host, user)
+            return opener(self.transport(host, user))
+
+    def _session(self, host, user):
+        return self._open(host, user, lambda transport: transport.open_session(timeout=self.connect_timeout))
+
+    def _sftp(self, host, user):
+        return self._open(host, user, paramiko.SFTPClient.from_transport)
+
+    def _record(self, host, seconds):
+        with self._lock:
+            stats = self._latency.setdefault(host, {"count": 0, "total": 0.0, "max": 0.0})
+            stats["count"] += 1
+            stats["total"] += seconds
+            stats["max"] = max(stats["max"], seconds)
+
+    def run(self, host, user, cmd, timeout=None):
+        """Runs cmd on host and waits for it
+            Return: (exit status, stdout, stderr)"""
+        start = time.time()
+        channel = self._session(host, user)
+        try:
+            channel.settimeout(timeout)
+            channel.exec_command(cmd)
+            stdout = channel.makefile('r').read().decode("utf-8")
+            stderr = channel.makefile_stderr('r').read().decode("utf-8")
+            result = channel.recv_exit_status(), stdout, stderr
+        finally:
+            channel.close()
+        self._record(host, time.time() - start)
+        return result
+
+    def run_batch(self, host, user, cmds, timeout=None):
+        """Runs cmds in order over the same connection, returns their results"""
+        return [self.run(host, user, cmd, timeout) for cmd in cmds]
+
+    def run_bg(self, host, user, cmd):
+        """Starts cmd on host without waiting for it, cmd backgrounds itself (nohup ... &)
+            Return: exit status of the shell that started it"""
+        channel = self._session(host, user)
+        try:
+            channel.exec_command(cmd)
+            # the shell exits as soon as cmd is in the background
+            return channel.recv_exit_status()
+        finally:
+            channel.close()
+
+    def put(self, host, user, local_path, remote_path):
+        """Copies a file to host over sftp on the shared connection"""
+        start = time.time()
+        sftp = self._sftp(host, user)
+        try:
+            sftp.put(local_path, remote_path)
+        finally:
+            sftp.close()
+        self._record(host, time.time() - start)
+
+    def write(self, host, user, content, remote_path):
+        """Writes content (str) to remote_path on host over sftp on the shared connection"""
+        start = time.time()
+        sftp = self._sftp(host, user)
+        try:
+            sftp.putfo(io.BytesIO(content.encode("utf-8")), remote_path)
+        finally:
+            sftp.close()
+        self._record(host, time.time() - start)
+
+    def latency(self):
+        """Returns host -> {count, mean, max} of the command latencies in seconds"""
+        with self._lock:
+            return {host: {"count": s["count"], "mean": s["total"] / s["count"], "max": s["max"]}
+                    for host, s in self._latency.items()}
+
+    def close_all(self):
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            client.close()
+
+
+# shared by all the helpers in utils.utils
+sessions = SSHSessions()
@@ -0,0 +1,160 @@
+from botocore.exceptions import ClientError
+import logging
+import os
+import threading
+import time
+import yaml
+from utils.dag import run_dag
+from utils.readiness import backoff
+from utils.utils import ec2_client
+
+logger = logging.getLogger("logger")
+
+# Tears down everything listed in config.yml. Instances are terminated together and every
+# security group is deleted as soon as the instances using it and the groups referencing it
+# are gone. Finished steps are recorded in a progress file, so an interrupted clean up picks
+# up where it stopped.
+
+PROGRESS_PATH = os.path.join("config", "clean_progress.yml")
+DELETE_ATTEMPTS = 8
+MISSING_INSTANCE = "InvalidInstanceID.NotFound"
+MISSING_GROUP = "InvalidGroup.NotFound"
+
+
+class Progress:
+    """Thread safe record of the instances terminated and security groups deleted"""
+
+    def __init__(self, path=PROGRESS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self.done = {"instances": [], "security_groups": []}
+        if os.path.exists(path):
+            with open(path) as file:
+                self.done.update(yaml.load(file, Loader=yaml.FullLoader) or {})
+
+    def is_done(self, kind, id):
+        return id in self.done[kind]
+
+    def mark(self, kind, id):
+        with self._lock:
+            self.done[kind].append(id)
+            with open(self.path, 'w') as file:
+                yaml.dump(self.done, file)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def error_code(e):
+    return e.response.get("Error", {}).get("Code")
+
+
+def instance_groups(instance_ids):
+    """Returns instance id -> security group ids of the instances that still exist"""
+    client = ec2_client()
+    groups = {}
+    for instance_id in instance_ids:
+        try:
+            reservations = client.describe_instances(InstanceIds=[instance_id])["Reservations"]
+        except ClientError as e:
+            if error_code(e) != MISSING_INSTANCE:
+                raise
+            continue
+        for reservation in reservations:
+            for instance in reservation["Instances"]:
+                groups[instance_id] = [group["GroupId"] for group in instance.get("SecurityGroups", [])]
+    return groups
+
+
+def group_references(group_ids):
+    """Returns group id -> the other groups in group_ids whose ingress rules name it
+    (the database groups allow the flask group, AWS keeps it until they are gone)"""
+    client = ec2_client()
+    referenced_by = {group_id: [] for group_id in group_ids}
+    for group_id in group_ids:
+        try:
+            security_groups = client.describe_security_groups(GroupIds=[group_id])["SecurityGroups"]
+        except ClientError as e:
+            if error_code(e) != MISSING_GROUP:
+                raise
+            continue
+        for security_group in security_groups:
+            for rule in security_group.get("IpPermissions", []):
+                for pair in rule.get("UserIdGroupPairs", []):
+                    target = pair.get("GroupId")
+                    if target in referenced_by and target != group_id and group_id not in referenced_by[target]:
+                        referenced_by[target].append(group_id)
+    # groups referencing each other cannot be ordered, their deletions are left to retry
+    return {group_id: [other for other in others if group_id not in referenced_by[other]]
+            for group_id, others in referenced_by.items()}
+
+
+def terminate(instance_ids):
+    """Asks for every instance to be terminated in one call"""
+    ec2_client().terminate_instances(InstanceIds=instance_ids)
+    logger.info("Terminating %d instances..." % len(instance_ids))
+
+
+def wait_terminated(instance_id, progress):
+    ec2_client().get_waiter('instance_terminated').wait(InstanceIds=[instance_id])
+    progress.mark("instances", instance_id)
+    logger.info("Instance %s terminated" % instance_id)
+
+
+def delete_security_group(group_id, progress, attempts=DELETE_ATTEMPTS):
+    """Deletes a security group, retrying while it is still in use
+    (network interfaces of terminated instances are released a little after termination)"""
+    client = ec2_client()
+    for attempt in range(attempts):
+        try:
+            client.delete_security_group(GroupId=group_id)
+            break
+        except ClientError as e:
+            if error_code(e) == MISSING_GROUP:
+                break
+            if error_code(e) != "DependencyViolation" or attempt == attempts - 1:
+                raise
+            time.sleep(backoff(attempt + 2))
+    progress.mark("security_groups", group_id)
+    logger.info("Security group %s deleted" % group_id)
+
+
+def guarded(name, fn, *args):
+    """Runs fn, logging instead of raising so that independent steps still run
+        Return: True if fn succeeded"""
+    try:
+        fn(*args)
+        return True
+    except Exception as e:
+        logger.error("%s failed: %s" % (name, e))
+        return False
+
+
+def teardown(instance_ids, security_group_ids, progress=None):
+    """Terminates the instances and deletes the security groups, skipping what progress says is done
+        Return: True if everything is gone"""
+    progress = progress or Progress()
+    instance_ids = [i for i in instance_ids if not progress.is_done("instances", i)]
+    security_group_ids = [g for g in security_group_ids if not progress.is_done("security_groups", g)]
+    groups = instance_groups(instance_ids)
+    for instance_id in instance_ids:
+        if instance_id not in groups:
+            progress.mark("instances", instance_id)
+    instance_ids = [i for i in instance_ids if i in groups]
+
+    tasks = {}
+    if instance_ids:
+        tasks["terminate"] = (lambda: guarded("terminate", terminate, instance_ids), [])
+    for instance_id in instance_ids:
+        tasks[instance_id] = (lambda ok, i=instance_id: ok and guarded(i, wait_terminated, i, progress), ["terminate"])
+    referenced_by = group_references(security_group_ids)
+    for group_id in security_group_ids:
+        users = [i for i in instance_ids if group_id in groups.get(i, [])]
+        # a security group can only go once every instance using it has terminated and every
+        # group whose rules reference it is deleted
+        tasks[group_id] = (lambda *ok, g=group_id: all(ok) and guarded(g, delete_security_group, g, progress),
+                           users + referenced_by[group_id])
+
+    results = run_dag(tasks)
+    return all(results.values())
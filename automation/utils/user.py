@@ -4,10 +4,15 @@ def init():
     global KEY_PAIR
     global KEY_PATH
     global NODES
+    global REPLICAS
     global REGION
+    global ENDPOINT_URL
     ACCESS_KEY = ""
     SECRET_KEY = ""
     KEY_PATH = ""
     KEY_PATH = ""
     NODES = 0
+    REPLICAS = 0
     REGION = ""
+    # set to a local AWS API stand-in (e.g. a moto server) to provision without AWS
+    ENDPOINT_URL = None
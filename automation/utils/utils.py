@@ -1,77 +1,83 @@
 from botocore.exceptions import ClientError, WaiterError
 import boto3
-import paramiko
-import time
 import utils.user
+from utils.ssh import sessions
 import subprocess
 
 
-def create_ec2_instance(count, image_id, instance_type, security_group, script_path=None):
-
-    # Provision and launch the EC2 instance
-    ec2_client = boto3.client(
+def ec2_client():
+    # boto3's default session is not thread safe, so every client gets its own session
+    session = boto3.session.Session()
+    return session.client(
         'ec2',
         region_name=utils.user.REGION,
         aws_access_key_id=utils.user.ACCESS_KEY,
-        aws_secret_access_key=utils.user.SECRET_KEY)
+        aws_secret_access_key=utils.user.SECRET_KEY,
+        endpoint_url=utils.user.ENDPOINT_URL)
+
+
+def launch_instances(count, image_id, instance_type, security_group, script_path=None):
+    """Starts instances without waiting for them
+        Return: list of instance ids, or None on failure"""
+    client = ec2_client()
+    params = dict(ImageId=image_id,
+                  InstanceType=instance_type,
+                  KeyName=utils.user.KEY_PAIR,
+                  MinCount=count,
+                  MaxCount=count,
+                  SecurityGroups=security_group)
+    if script_path != None:
+        with open(script_path, 'r') as f:
+            params["UserData"] = '\n'.join(f)
 
     try:
-        if script_path != None:
-            with open(script_path, 'r') as f:
-                script = '\n'.join(f)
-                response = ec2_client.run_instances(ImageId=image_id,
-                                                    InstanceType=instance_type,
-                                                    KeyName=utils.user.KEY_PAIR,
-                                                    MinCount=count,
-                                                    MaxCount=count,
-                                                    SecurityGroups=security_group,
-                                                    UserData=script)
-        else:
-            response = ec2_client.run_instances(ImageId=image_id,
-                                                    InstanceType=instance_type,
-                                                    KeyName=utils.user.KEY_PAIR,
-                                                    MinCount=count,
-                                                    MaxCount=count,
-                                                    SecurityGroups=security_group)
-                                            
-
-        instanceId = [response['Instances'][i]["InstanceId"] for i in range(count)]
-
-        try:
-            ec2_client.get_waiter('instance_running').wait(InstanceIds=instanceId)
-            response_final = ec2_client.describe_instances(InstanceIds=instanceId)
-    
-        except WaiterError as e:
-            print(e)
-
+        response = client.run_instances(**params)
     except ClientError as e:
         print(e)
         return None
-    
-    return response_final['Reservations'][0]['Instances']
+
+    return [instance["InstanceId"] for instance in response['Instances']]
+
+
+def wait_for_instances(instance_ids):
+    """Blocks until the instances are running
+        Return: list of instance descriptions (in the order of instance_ids), or None on failure"""
+    client = ec2_client()
+    try:
+        client.get_waiter('instance_running').wait(InstanceIds=instance_ids)
+        response = client.describe_instances(InstanceIds=instance_ids)
+    except (ClientError, WaiterError) as e:
+        print(e)
+        return None
+
+    instances = {i["InstanceId"]: i for r in response['Reservations'] for i in r['Instances']}
+    return [instances[instance_id] for instance_id in instance_ids]
+
+
+def create_ec2_instance(count, image_id, instance_type, security_group, script_path=None):
+    # Provision and launch the EC2 instance
+    instance_ids = launch_instances(count, image_id, instance_type, security_group, script_path)
+    if instance_ids is None:
+        return None
+    return wait_for_instances(instance_ids)
 
 
 def create_security_group(name, permissions):    
-    ec2_client = boto3.client(
-        'ec2',
-        region_name=utils.user.REGION,
-        aws_access_key_id=utils.user.ACCESS_KEY,
-        aws_secret_access_key=utils.user.SECRET_KEY)
+    client = ec2_client()
 
-    response = ec2_client.describe_vpcs()
+    response = client.describe_vpcs()
     vpc_id = response.get('Vpcs', [{}])[0].get('VpcId', '')
 
+    security_group_id = None
     try:
-        response = ec2_client.create_security_group(GroupName=name,
+        response = client.create_security_group(GroupName=name,
                                             Description="DESCRIPTION",
                                             VpcId=vpc_id)
         security_group_id = response['GroupId']
         # print('Security Group Created %s in vpc %s.' % (security_group_id, vpc_id))
 
-        data = ec2_client.authorize_security_group_ingress(
-            GroupId=security_group_id,
-            IpPermissions=permissions)
-        # print('Ingress Successfully Set %s' % data)
+        if permissions:
+            authorize_ingress(security_group_id, permissions)
 
     except ClientError as e:
         print(e)
@@ -79,154 +85,52 @@ def create_security_group(name, permissions):
     return security_group_id
 
 
+def authorize_ingress(security_group_id, permissions):
+    """Adds ingress rules to an existing security group, e.g. once the IPs they refer to are known"""
+    client = ec2_client()
+    data = client.authorize_security_group_ingress(
+        GroupId=security_group_id,
+        IpPermissions=permissions)
+    # print('Ingress Successfully Set %s' % data)
+    return data
+
+
 def execute_cmds_ssh(instance_ip, user, cmds):
-    
-    key = paramiko.RSAKey.from_private_key_file(utils.user.KEY_PATH)
-    client = paramiko.SSHClient()
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
 
-    # Connect/ssh to an instance
+    # Execute the commands(cmds) in order over the pooled connection to the instance
     try:
-        client.connect(hostname=instance_ip, username=user, pkey=key)
-
-        # Execute a command(cmd) after connecting/ssh to an instance
-        for cmd in cmds:
-            stdin, stdout, stderr = client.exec_command(cmd, get_pty=False)
-            print(stdout.read().decode("utf-8"))
+        for exit_status, stdout, stderr in sessions.run_batch(instance_ip, user, cmds):
+            print(stdout)
 
         return "Complete"
         
     except Exception as e:
         print(e)
+        sessions.drop(instance_ip, user)
         return "Failed"
-
-    finally:
-        # Close the client connection once the job is done
-        client.close()
     
 
 def execute_bg(instance_ip, user, cmd):
-    
-    key = paramiko.RSAKey.from_private_key_file(utils.user.KEY_PATH)
-    client = paramiko.SSHClient()
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
 
-    # Connect/ssh to an instance
+    # Start a command(cmd) on the instance without waiting for it
     try:
-        client.connect(hostname=instance_ip, username=user, pkey=key)
-
-        # Execute a command(cmd) after connecting/ssh to an instance
-        transport = client.get_transport()
-        channel = transport.open_session()
-        channel.exec_command(cmd)
+        sessions.run_bg(instance_ip, user, cmd)
         return "Complete"
         
     except Exception as e:
         print(e)
+        sessions.drop(instance_ip, user)
         return "Failed"
 
-    finally:
-        # Close the client connection once the job is done
-        client.close()
-
 
 def scp_to_instance(instance_ip, user, file_path):
 
-    key = paramiko.RSAKey.from_private_key_file(utils.user.KEY_PATH)
-    client = paramiko.SSHClient()
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-
-    # Connect/ssh to an instance
     try:
-        client.connect(hostname=instance_ip, username=user, pkey=key)
-        
-        try:
-            scp_client = client.open_sftp()
-            scp_client.put(file_path, file_path)
-
-        except Exception as e:
-            print(e)
-
-        finally:
-            scp_client.close()
-
-    except Exception as e:
-        print(e)
-
-    finally:
-        # Close the client connection once the job is done
-        client.close()
-
-
-def exists(file_path, instance_ip, user):
+        sessions.put(instance_ip, user, file_path, file_path)
 
-    cmd = 'test -f %s && echo Complete' % (file_path)
-    
-    key = paramiko.RSAKey.from_private_key_file(utils.user.KEY_PATH)
-    client = paramiko.SSHClient()
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-
-    # Connect/ssh to an instance
-    try:
-        client.connect(hostname=instance_ip, username=user, pkey=key)
-
-        # Execute a command(cmd) after connecting/ssh to an instance
-        while True:
-            stdin, stdout, stderr = client.exec_command(cmd)
-            res_str = stdout.read().decode("utf-8")
-            print(res_str)
-            if "Complete" in res_str:
-                break
-            time.sleep(10)
-            print("Instantiating...")
-        return True
-        
     except Exception as e:
         print(e)
-        return "Failed"
-
-    finally:
-        # Close the client connection once the job is done
-        client.close()
-
-
-def del_security_group(id):    
-    ec2_client = boto3.client(
-        'ec2',
-        region_name=utils.user.REGION,
-        aws_access_key_id=utils.user.ACCESS_KEY,
-        aws_secret_access_key=utils.user.SECRET_KEY)
-
-    try:
-        response = ec2_client.delete_security_group(GroupId=id)
-
-    except ClientError as e:
-        print(e)
-
-    return response
-
-def terminate_instances(ids):
-    ec2_client = boto3.client(
-        'ec2',
-        region_name=utils.user.REGION,
-        aws_access_key_id=utils.user.ACCESS_KEY,
-        aws_secret_access_key=utils.user.SECRET_KEY)
-
-    try:
-        ec2_client.terminate_instances(
-                InstanceIds=ids)
-
-        try:
-            ec2_client.get_waiter('instance_terminated').wait(InstanceIds=ids)
-            response_final = ec2_client.describe_instances(InstanceIds=ids)
-    
-        except WaiterError as e:
-            print(e)
-
-    except ClientError as e:
-        print(e)
-
-    return response_final["Reservations"][0]["Instances"]
+        sessions.drop(instance_ip, user)
 
 
 def run_command_bash(command):
@@ -1,20 +1,32 @@
-from flask import Flask, make_response, render_template, request
+from flask import Flask, Response, jsonify, make_response, render_template, request
 from flask_restful import Api
+from werkzeug.middleware.proxy_fix import ProxyFix
 from resources.book_preview import BookPreviewResource, BookCategoryResource
 from resources.categories import CategoriesResource
 from resources.metadata import GetBookDetails, BooksListResource, RegisterNewBook, UpdateBookResource, GetBookTitles
+from resources.book_page import BookPageResource
 from resources.test import testMySql, testMongo
-from resources.review import ReviewsAPI, ReviewsByUserAPI, ReviewAPI
+from resources.review import ReviewsAPI, ReviewsByUserAPI, ReviewerSummaryAPI, ReviewAPI
 from resources.user import UserLogin, UserSignup
-from resources.logs import LogsList, LogAPI
-from common.util import mongo, mongo_log
+from resources.logs import LogsList, LogAPI, LogStreamAPI
+from common.util import mongo, mongo_log, mongo_read, MONGO_REPLICAS
+from common.catalog import start_catalog
+from common.admission import admission, admit, release, TRUSTED_PROXIES
+from common.profiling import profiles, start_profile, stop_profile, PROFILE_ADMIN_TOKEN, PROFILE_HEADER
+from common.slow_queries import slow_queries
+from common.log_stream import log_stream
+from common.warmup import hot_cache, cache_key, start_warmup, WARMUP_ENVIRON
 import datetime
 import logging
+import os
 
 app = Flask(__name__,
     static_folder="../static/public",
     template_folder="../static"
     )
+if TRUSTED_PROXIES:
+    # remote_addr is then the client address the outermost trusted proxy saw
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES)
 
 logging.basicConfig(level=logging.DEBUG,
 					format="%(asctime)s %(levelname)s %(name)s %(threadName)s : %(message)s")
@@ -30,6 +42,7 @@ api.add_resource(BookCategoryResource, '/books/category')
 api.add_resource(CategoriesResource, '/categories')
 
 api.add_resource(GetBookDetails, '/book/<string:asin>')
+api.add_resource(BookPageResource, '/book/<string:asin>/page')
 api.add_resource(BooksListResource, '/books')
 api.add_resource(GetBookTitles, '/books_titles')
 api.add_resource(RegisterNewBook, '/book/new')
@@ -37,34 +50,114 @@ api.add_resource(UpdateBookResource, '/book/update/<string:asin>')
 
 api.add_resource(ReviewsAPI, '/reviews/<asin>', endpoint = 'reviews')
 api.add_resource(ReviewsByUserAPI, '/reviews/user/<reviewerID>', endpoint = 'reviews/user')
+api.add_resource(ReviewerSummaryAPI, '/reviews/user/<reviewerID>/summary', endpoint = 'reviews/user/summary')
 api.add_resource(ReviewAPI, '/review/<id>', endpoint = 'review')
 
 api.add_resource(UserLogin, '/user/login')
 api.add_resource(UserSignup, '/user/signup')
 
 api.add_resource(LogsList, '/user/logs')
+api.add_resource(LogStreamAPI, '/user/logs/stream')
 api.add_resource(LogAPI, '/user/logs/<string:id>', endpoint='user/logs')
+
+# Landing pages and popular books are served from the responses encoded by the last warmup
+@app.before_request
+def serve_hot():
+    if request.method != "GET" or request.environ.get(WARMUP_ENVIRON):
+        return None
+    hot = hot_cache.get(cache_key(request.path, request.args))
+    if hot is None:
+        return None
+    body, content_type = hot
+    return Response(body, status=200, content_type=content_type)
+
+# Cached responses above are always served, everything else goes through admission control
+app.before_request(admit)
+app.teardown_request(release)
+
+@app.route('/admission/stats')
+def admission_stats():
+    return make_response(jsonify(admission.stats()), 200)
+
+# Sampled profiling of admitted requests, reports per resource (flask_restful endpoint name)
+app.before_request(start_profile)
+app.teardown_request(stop_profile)
+
+def profile_forbidden():
+    # the reports show query shapes and stacks, without a token nobody may read them
+    return not PROFILE_ADMIN_TOKEN or request.headers.get(PROFILE_HEADER) != PROFILE_ADMIN_TOKEN
+
+@app.route('/profile', methods=['GET', 'DELETE'])
+def profile_summary():
+    if profile_forbidden():
+        return make_response(jsonify({"message": "Forbidden"}), 403)
+    if request.method == 'DELETE':
+        profiles.reset()
+    return make_response(jsonify(profiles.summary()), 200)
+
+@app.route('/profile/<resource>/collapsed')
+def profile_collapsed(resource):
+    """Collapsed stacks, e.g. flamegraph.pl collapsed.txt > flamegraph.svg"""
+    if profile_forbidden():
+        return make_response(jsonify({"message": "Forbidden"}), 403)
+    return make_response(profiles.collapsed(resource), 200, {'Content-type': 'text/plain'})
+
+@app.route('/profile/<resource>/top')
+def profile_top(resource):
+    if profile_forbidden():
+        return make_response(jsonify({"message": "Forbidden"}), 403)
+    n = request.args.get('n', default=20, type=int)
+    sort = request.args.get('sort', default='tottime')
+    if sort not in ('tottime', 'cumtime', 'calls'):
+        return make_response(jsonify({"message": "sort must be tottime, cumtime or calls"}), 400)
+    return make_response(jsonify(profiles.top(resource, n, sort)), 200)
+
+@app.route('/queries/slow', methods=['GET', 'DELETE'])
+def slow_query_top():
+    """Query shapes slower than SLOW_QUERY_MS, most total time first, with their plans"""
+    if profile_forbidden():
+        return make_response(jsonify({"message": "Forbidden"}), 403)
+    if request.method == 'DELETE':
+        slow_queries.reset()
+    n = request.args.get('n', default=20, type=int)
+    return make_response(jsonify(slow_queries.top(n)), 200)
+
 # Invoked after every requests to log the timestamp, content & status
 @app.after_request
 def log_request(response):
-    response.direct_passthrough = False
+    if request.environ.get(WARMUP_ENVIRON) or request.environ.get("isit.shed"):
+        # shed requests are only counted, logging them would add load when the server is busiest
+        return response
     time = datetime.datetime.now()
-    body = response.data.decode("utf-8")
+    if response.is_streamed:
+        # reading the body here would buffer the whole stream
+        body = "<streamed %s>" % response.mimetype
+    else:
+        response.direct_passthrough = False
+        body = response.data.decode("utf-8")
     status_as_string = response.status
     status_as_integer = response.status_code
     try:
-        _id = mongo_log.db.logs.insert_one({
+        log = {
             "time": time,
             "body": body,
             "method": request.method,
             "path": request.full_path,
             "status": status_as_string,
             "status_code": status_as_integer
-        })
+        }
+        _id = mongo_log.db.logs.insert_one(log)
         app.logger.debug("Successful log insert with _id %s" % _id.inserted_id)
+        # insert_one added the _id to log
+        log_stream.publish(log)
     except:
         app.logger.warning("Error encountered during insertion of log to database")    
     return response
     
 if __name__ == "__main__":
+    # with debug the app runs in a child process of the reloader, only that one warms up
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        # change streams need a replica set, otherwise the write endpoints keep the catalog fresh
+        start_catalog(mongo_read.db.kindle_metadata, watch_changes=bool(MONGO_REPLICAS))
+        start_warmup(app)
     app.run(debug=True)
@@ -0,0 +1,168 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from flask import g, jsonify, request
+from werkzeug.datastructures import ImmutableMultiDict
+from common.warmup import WARMUP_ENVIRON
+
+# Admission control, checked before a request reaches its resource. Each client (by IP) has a
+# token bucket and every endpoint costs some tokens, expensive endpoints also have a cap on the
+# requests they run at the same time. A request that does not fit is answered right away with
+# 429 (client over its rate) or 503 (endpoint busy) and a Retry-After, instead of queueing for
+# a worker. count is clamped and oversized arrays in the body are refused.
+
+ADMISSION_RATE = float(os.getenv("ADMISSION_RATE", "20"))     # tokens per second per client
+ADMISSION_BURST = float(os.getenv("ADMISSION_BURST", "60"))
+MAX_COUNT = int(os.getenv("ADMISSION_MAX_COUNT", "100"))
+# proxies in front of the server that append to X-Forwarded-For, 0 when clients connect directly
+TRUSTED_PROXIES = int(os.getenv("ADMISSION_TRUSTED_PROXIES", "0"))
+MAX_ARRAY = int(os.getenv("ADMISSION_MAX_ARRAY", "200"))
+MAX_CLIENTS = 10000
+
+# url rule -> (cost in tokens, requests running at once or None)
+ENDPOINT_COSTS = {
+    "/books_titles": (10, 2),
+    "/books/category": (3, 8),
+    "/books/previews": (2, 8),
+    "/user/login": (5, 4),      # pbkdf2
+    "/user/signup": (5, 4),
+    "/reviews/user/<reviewerID>": (2, 8),
+    "/book/<string:asin>/page": (2, 16),
+}
+DEFAULT_COST = (1, None)
+# url rule -> largest count, endpoints that allow more than MAX_COUNT (as documented in README)
+MAX_COUNTS = {
+    "/reviews/user/<reviewerID>": 500,
+}
+# json body arrays that are limited to MAX_ARRAY items
+ARRAY_FIELDS = ["asinArray", "categoryArray", "categories"]
+FORM_TYPES = ("multipart/form-data", "application/x-www-form-urlencoded")
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.time()
+
+    def take(self, cost):
+        """Returns 0 if cost tokens were taken, otherwise the seconds until they are available"""
+        now = time.time()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0
+        return (cost - self.tokens) / self.rate
+
+
+class Admission:
+    def __init__(self, rate=ADMISSION_RATE, burst=ADMISSION_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = OrderedDict()
+        self._slots = {rule: threading.BoundedSemaphore(limit)
+                       for rule, (cost, limit) in ENDPOINT_COSTS.items() if limit}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def count(self, rule, outcome):
+        with self._lock:
+            counters = self._counters.setdefault(rule, {"admitted": 0, "rate_limited": 0, "busy": 0, "too_large": 0})
+            counters[outcome] += 1
+
+    def stats(self):
+        with self._lock:
+            return {rule: dict(counters) for rule, counters in self._counters.items()}
+
+    def take(self, client, cost):
+        with self._lock:
+            bucket = self._buckets.pop(client, None) or TokenBucket(self.rate, self.burst)
+            # most recently seen last, the clients not seen for longest are dropped first
+            self._buckets[client] = bucket
+            if len(self._buckets) > MAX_CLIENTS:
+                self._buckets.popitem(last=False)
+            return bucket.take(cost)
+
+    def acquire(self, rule):
+        slot = self._slots.get(rule)
+        if slot is None:
+            return True
+        if slot.acquire(blocking=False):
+            g.admission_slot = slot
+            return True
+        return False
+
+
+admission = Admission()
+
+
+def client_address():
+    # X-Forwarded-For is set by the client unless a trusted proxy rewrites it, app.py applies
+    # ProxyFix with ADMISSION_TRUSTED_PROXIES hops so that remote_addr is the client behind them
+    return request.remote_addr
+
+
+def reject(rule, outcome, status, message, retry_after=None):
+    admission.count(rule, outcome)
+    request.environ["isit.shed"] = True
+    response = jsonify({"message": message})
+    response.status_code = status
+    if retry_after is not None:
+        response.headers["Retry-After"] = str(max(1, int(math.ceil(retry_after))))
+    return response
+
+
+def clamp_count(rule):
+    max_count = MAX_COUNTS.get(rule, MAX_COUNT)
+    count = request.args.get("count", type=int)
+    if count is not None and count > max_count:
+        args = request.args.copy()
+        args["count"] = str(max_count)
+        request.args = ImmutableMultiDict(args)
+
+
+def oversized_array():
+    # reading a form body here would leave request.form empty for the resource
+    if request.method not in ("POST", "PUT") or request.mimetype in FORM_TYPES:
+        return None
+    body = request.get_json(force=True, silent=True)
+    if not isinstance(body, dict):
+        return None
+    for field in ARRAY_FIELDS:
+        if isinstance(body.get(field), list) and len(body[field]) > MAX_ARRAY:
+            return field
+    return None
+
+
+def admit():
+    """before_request hook, returns the rejection or None to let the request through"""
+    if request.url_rule is None or request.environ.get(WARMUP_ENVIRON):
+        return None
+    rule = request.url_rule.rule
+    cost, limit = ENDPOINT_COSTS.get(rule, DEFAULT_COST)
+
+    field = oversized_array()
+    if field:
+        return reject(rule, "too_large", 413, "{} can have at most {} items".format(field, MAX_ARRAY))
+
+    wait = admission.take(client_address(), cost)
+    if wait:
+        return reject(rule, "rate_limited", 429, "Too many requests", wait)
+
+    if not admission.acquire(rule):
+        return reject(rule, "busy", 503, "Server busy, try again shortly", 1)
+
+    clamp_count(rule)
+    admission.count(rule, "admitted")
+    return None
+
+
+def release(exception=None):
+    """teardown_request hook, frees the endpoint slot taken by admit"""
+    slot = g.pop("admission_slot", None)
+    if slot is not None:
+        slot.release()
@@ -0,0 +1,446 @@
+import argparse
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+
+# Snapshot of the lightweight book fields (asin, title, imUrl and the first category list) that
+# the list/preview/title endpoints serve without going to Mongo.
+#
+# Each column is one utf-8 blob plus an array of row offsets, _ids are 12 raw bytes per row and
+# asin -> row is an open addressing hash table of int32 slots (crc32 of the asin, linear
+# probing). Every part is a flat buffer, so a snapshot built offline is memory mapped as is.
+# Books added or updated after the snapshot was built are kept in a small overlay, fed by the
+# write endpoints (and a change stream when mongo runs as a replica set).
+#
+# to build a snapshot file / measure the memory use, from the server folder
+#   python -m common.catalog build catalog.bin
+#   python -m common.catalog bench --books 1000000
+
+MAGIC = b"ISITCAT1"
+HEADER = struct.Struct("<8sQQ")
+SECTION = struct.Struct("<QQ")
+SECTIONS = ["ids", "flags", "asin_offsets", "asin", "title_offsets", "title",
+            "imUrl_offsets", "imUrl", "categories_offsets", "categories", "index"]
+STRING_COLUMNS = ["asin", "title", "imUrl", "categories"]
+# flags, the field was present in the document
+HAS_ID, HAS_TITLE, HAS_IMURL = 1, 2, 4
+# categories[0] is stored joined by this separator
+CATEGORY_SEPARATOR = "\x1f"
+
+
+def asin_hash(asin_bytes):
+    return zlib.crc32(asin_bytes)
+
+
+def first_categories(doc):
+    categories = doc.get("categories")
+    if isinstance(categories, list) and categories and isinstance(categories[0], list):
+        return [str(category) for category in categories[0]]
+    return []
+
+
+def projection(doc):
+    """The fields of a mongo document kept in the catalog"""
+    record = {"asin": str(doc.get("asin", ""))}
+    _id = doc.get("_id")
+    if _id is not None and len(str(_id)) == 24:
+        record["_id"] = str(_id)
+    for field in ("title", "imUrl"):
+        if doc.get(field) is not None:
+            record[field] = str(doc[field])
+    record["categories"] = first_categories(doc)
+    return record
+
+
+def _align(buffer):
+    buffer.extend(b"\0" * (-len(buffer) % 8))
+
+
+def encode(records):
+    """Serializes records (dicts from projection, in natural order) into a snapshot buffer"""
+    ids = bytearray()
+    flags = bytearray()
+    columns = {name: (array("I", [0]), bytearray()) for name in STRING_COLUMNS}
+    for record in records:
+        flag = 0
+        if "_id" in record:
+            ids += bytes.fromhex(record["_id"])
+            flag |= HAS_ID
+        else:
+            ids += b"\0" * 12
+        flag |= HAS_TITLE if "title" in record else 0
+        flag |= HAS_IMURL if "imUrl" in record else 0
+        flags.append(flag)
+        values = {"asin": record["asin"], "title": record.get("title", ""), "imUrl": record.get("imUrl", ""),
+                  "categories": CATEGORY_SEPARATOR.join(record.get("categories", []))}
+        for name, value in values.items():
+            offsets, blob = columns[name]
+            blob += value.encode("utf-8")
+            offsets.append(len(blob))
+
+    rows = len(flags)
+    size = 8
+    while size < 2 * rows:
+        size *= 2
+    index = array("i", [0]) * size
+    asin_offsets, asin_blob = columns["asin"]
+    for row in range(rows):
+        slot = asin_hash(asin_blob[asin_offsets[row]:asin_offsets[row + 1]]) & (size - 1)
+        while index[slot]:
+            slot = (slot + 1) & (size - 1)
+        index[slot] = row + 1
+
+    parts = {"ids": ids, "flags": flags, "index": index.tobytes()}
+    for name, (offsets, blob) in columns.items():
+        parts[name + "_offsets"] = offsets.tobytes()
+        parts[name] = blob
+
+    body = bytearray()
+    table = []
+    start = HEADER.size + SECTION.size * len(SECTIONS)
+    for name in SECTIONS:
+        _align(body)
+        table.append(SECTION.pack(start + len(body), len(parts[name])))
+        body += parts[name]
+    return HEADER.pack(MAGIC, rows, len(SECTIONS)) + b"".join(table) + bytes(body)
+
+
+class Snapshot:
+    """Read only view over an encoded buffer (bytes or mmap)"""
+
+    def __init__(self, buffer):
+        view = memoryview(buffer)
+        magic, self.rows, sections = HEADER.unpack_from(view, 0)
+        if magic != MAGIC or sections != len(SECTIONS):
+            raise ValueError("Not a catalog snapshot")
+        self.buffer = buffer
+        self.nbytes = len(view)
+        parts = {}
+        for i, name in enumerate(SECTIONS):
+            offset, length = SECTION.unpack_from(view, HEADER.size + SECTION.size * i)
+            parts[name] = view[offset:offset + length]
+        self.ids = parts["ids"]
+        self.flags = parts["flags"]
+        self.columns = {name: (parts[name + "_offsets"].cast("I"), parts[name]) for name in STRING_COLUMNS}
+        self.index = parts["index"].cast("i")
+        self._postings = None
+        self._postings_lock = threading.Lock()
+
+    def string(self, name, row):
+        offsets, blob = self.columns[name]
+        return bytes(blob[offsets[row]:offsets[row + 1]]).decode("utf-8")
+
+    def row(self, asin):
+        """Returns the row of asin or None"""
+        key = asin.encode("utf-8")
+        offsets, blob = self.columns["asin"]
+        mask = len(self.index) - 1
+        slot = asin_hash(key) & mask
+        while self.index[slot]:
+            row = self.index[slot] - 1
+            if blob[offsets[row]:offsets[row + 1]] == key:
+                return row
+            slot = (slot + 1) & mask
+        return None
+
+    def record(self, row):
+        flag = self.flags[row]
+        record = {"asin": self.string("asin", row)}
+        if flag & HAS_ID:
+            record["_id"] = bytes(self.ids[row * 12:row * 12 + 12]).hex()
+        if flag & HAS_TITLE:
+            record["title"] = self.string("title", row)
+        if flag & HAS_IMURL:
+            record["imUrl"] = self.string("imUrl", row)
+        categories = self.string("categories", row)
+        record["categories"] = categories.split(CATEGORY_SEPARATOR) if categories else []
+        return record
+
+    def postings(self):
+        """category -> rows having it in their first category list, built on first use"""
+        with self._postings_lock:
+            if self._postings is None:
+                postings = {}
+                for row in range(self.rows):
+                    categories = self.string("categories", row)
+                    if categories:
+                        for category in set(categories.split(CATEGORY_SEPARATOR)):
+                            postings.setdefault(category, array("I")).append(row)
+                self._postings = postings
+            return self._postings
+
+
+class Catalog:
+    """The snapshot plus the books written since it was built
+    Rows keep mongo's natural order, books added later get rows after the snapshot's.
+    Reads take the lock too, so that they never mix a snapshot with another one's overlay."""
+
+    def __init__(self):
+        self.snapshot = None
+        self._changed = {}
+        self._added = []
+        self._added_rows = {}
+        self._pending = []
+        self._building = False
+        self._lock = threading.RLock()
+
+    @property
+    def ready(self):
+        return self.snapshot is not None
+
+    def begin_build(self):
+        """Call before reading mongo for a new snapshot, writes from now on are replayed onto it"""
+        with self._lock:
+            self._building = True
+            self._pending = []
+
+    def abort_build(self):
+        """Call when the snapshot could not be built, drops the writes kept for it"""
+        with self._lock:
+            self._building = False
+            self._pending = []
+
+    def load(self, buffer):
+        """Swaps in a new snapshot, then replays the writes seen while it was being built"""
+        snapshot = Snapshot(buffer)
+        with self._lock:
+            pending = self._pending
+            self.snapshot = snapshot
+            self._changed, self._added, self._added_rows, self._pending = {}, [], {}, []
+            self._building = False
+            for record in pending:
+                self._apply(record)
+
+    def upsert(self, doc):
+        """Write hook, doc is the book as stored in mongo"""
+        record = projection(doc)
+        if not record["asin"]:
+            return
+        self._apply(record)
+
+    def _apply(self, record):
+        with self._lock:
+            if self._building:
+                # kept for the snapshot being built, it may have been read before this write
+                self._pending.append(record)
+            if self.snapshot is None:
+                return
+            row = self.snapshot.row(record["asin"])
+            if row is not None:
+                self._changed[row] = record
+            elif record["asin"] in self._added_rows:
+                self._added[self._added_rows[record["asin"]]] = record
+            else:
+                self._added_rows[record["asin"]] = len(self._added)
+                self._added.append(record)
+
+    def count(self):
+        with self._lock:
+            return self.snapshot.rows + len(self._added)
+
+    def record(self, row):
+        if row >= self.snapshot.rows:
+            return self._added[row - self.snapshot.rows]
+        changed = self._changed.get(row)
+        return changed if changed is not None else self.snapshot.record(row)
+
+    def page(self, offset, limit):
+        with self._lock:
+            return [self.record(row) for row in range(max(offset, 0), min(offset + limit, self.count()))]
+
+    def find(self, asins):
+        """Records of the given asins that exist, in row order"""
+        with self._lock:
+            return self._find(asins)
+
+    def _find(self, asins):
+        rows = set()
+        for asin in asins:
+            row = self.snapshot.row(str(asin))
+            if row is None:
+                row = self._added_rows.get(str(asin))
+                row = None if row is None else self.snapshot.rows + row
+            if row is not None:
+                rows.add(row)
+        return [self.record(row) for row in sorted(rows)]
+
+    def in_categories(self, categories, offset=0, limit=None):
+        """Returns (count, records) of the books whose first category list has any of categories"""
+        wanted = set(categories)
+        # built outside the lock, it takes a while the first time
+        self.snapshot.postings()
+        with self._lock:
+            return self._in_categories(wanted, offset, limit)
+
+    def _in_categories(self, wanted, offset, limit):
+        postings = self.snapshot.postings()
+        rows = set()
+        for category in wanted:
+            rows.update(postings.get(category, ()))
+        rows.difference_update(self._changed)
+        rows.update(row for row, record in self._changed.items() if wanted.intersection(record["categories"]))
+        rows.update(self.snapshot.rows + i for i, record in enumerate(self._added)
+                    if wanted.intersection(record["categories"]))
+        rows = sorted(rows)
+        selected = rows[offset:] if limit is None else rows[offset:offset + limit]
+        return len(rows), [self.record(row) for row in selected]
+
+    def titles(self):
+        """[(asin, title)] of every book that has a title"""
+        with self._lock:
+            titles = []
+            for row in range(self.count()):
+                if row < self.snapshot.rows and row not in self._changed:
+                    if self.snapshot.flags[row] & HAS_TITLE:
+                        titles.append((self.snapshot.string("asin", row), self.snapshot.string("title", row)))
+                else:
+                    record = self.record(row)
+                    if "title" in record:
+                        titles.append((record["asin"], record["title"]))
+            return titles
+
+
+catalog = Catalog()
+
+CATALOG_PATH = os.getenv("CATALOG_PATH", "catalog.bin")
+CATALOG_RETRY = int(os.getenv("CATALOG_RETRY", "60"))    # seconds before a failed build is retried
+
+
+def open_snapshot(path, use_mmap=True):
+    """Returns the buffer of a snapshot file, mapped read only or read into memory"""
+    with open(path, "rb") as f:
+        if use_mmap:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return f.read()
+
+
+def build_snapshot(collection, path=None):
+    """Encodes the catalog from the kindle_metadata collection, writing it to path if given"""
+    cursor = collection.find({}, {"asin": 1, "title": 1, "imUrl": 1, "categories": 1})
+    buffer = encode(projection(doc) for doc in cursor)
+    if path:
+        with open(path + ".part", "wb") as f:
+            f.write(buffer)
+        os.replace(path + ".part", path)
+    return buffer
+
+
+def watch(collection):
+    """Applies inserts/updates from a change stream (only available on a replica set)"""
+    try:
+        with collection.watch(full_document="updateLookup") as stream:
+            for change in stream:
+                if change.get("fullDocument"):
+                    catalog.upsert(change["fullDocument"])
+    except Exception as e:
+        print("Catalog change stream stopped, relying on the write hooks: %s" % e)
+
+
+def start_catalog(collection, path=CATALOG_PATH, use_mmap=True, watch_changes=False):
+    """Serves the snapshot file left by the last run right away, then rebuilds it from mongo in a
+    daemon thread (the file may miss writes made while the server was down)
+    The endpoints query mongo until the catalog is ready, a failed build is retried every CATALOG_RETRY seconds"""
+    def load():
+        if watch_changes:
+            threading.Thread(target=watch, args=(collection,), name="catalog-watch", daemon=True).start()
+        if os.path.exists(path):
+            try:
+                # writes made while the file is read are replayed onto it
+                catalog.begin_build()
+                catalog.load(open_snapshot(path, use_mmap))
+                print("Catalog of %d books loaded from %s" % (catalog.count(), path))
+            except Exception as e:
+                catalog.abort_build()
+                print("Could not load the catalog from %s: %s" % (path, e))
+        while True:
+            try:
+                start = time.time()
+                catalog.begin_build()
+                build_snapshot(collection, path)
+                # replacing the file leaves the previous mapping valid
+                catalog.load(open_snapshot(path, use_mmap))
+                print("Catalog of %d books built in %.1fs" % (catalog.count(), time.time() - start))
+                return
+            except Exception as e:
+                catalog.abort_build()
+                print("Could not build the catalog, retrying in %ds: %s" % (CATALOG_RETRY, e))
+                time.sleep(CATALOG_RETRY)
+
+    thread = threading.Thread(target=load, name="catalog", daemon=True)
+    thread.start()
+    return thread
+
+
+# ================
+# Offline build and benchmark
+# ================
+
+def synthetic_records(books):
+    for i in range(books):
+        asin = "B%09d" % i
+        yield {"_id": "%024x" % i, "asin": asin,
+               "title": "Synthetic book number %d of the kindle store" % i,
+               "imUrl": "http://ecx.images-amazon.com/images/I/%s.jpg" % asin,
+               "categories": ["Books", "Kindle Store", "Category %d" % (i % 300)]}
+
+
+def bench(books):
+    import random
+    import tracemalloc
+
+    tracemalloc.start()
+    as_dicts = list(synthetic_records(books))
+    index = {record["asin"]: i for i, record in enumerate(as_dicts)}
+    dict_bytes = tracemalloc.get_traced_memory()[0]
+    del as_dicts, index
+    tracemalloc.stop()
+
+    start = time.time()
+    buffer = encode(synthetic_records(books))
+    build_seconds = time.time() - start
+    current = Catalog()
+    current.load(buffer)
+    asins = ["B%09d" % random.randrange(books) for _ in range(100000)]
+    start = time.time()
+    for asin in asins:
+        current.snapshot.row(asin)
+    lookup_seconds = time.time() - start
+    start = time.time()
+    current.page(books // 2, 24)
+    page_seconds = time.time() - start
+
+    per_million = 1e6 / books / 1e6
+    print("books:                %d" % books)
+    print("snapshot:             %.1f MB (%.1f MB per million books, %.0f bytes per book)"
+          % (len(buffer) / 1e6, len(buffer) * per_million, len(buffer) / books))
+    print("list of dicts + dict: %.1f MB (%.1f MB per million books)" % (dict_bytes / 1e6, dict_bytes * per_million))
+    print("build:                %.1fs" % build_seconds)
+    print("asin lookup:          %.2f us" % (lookup_seconds / len(asins) * 1e6))
+    print("page of 24:           %.2f ms" % (page_seconds * 1e3))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+    build_parser = subparsers.add_parser("build", help="Build a snapshot file from mongo")
+    build_parser.add_argument("path", nargs="?", default=CATALOG_PATH)
+    bench_parser = subparsers.add_parser("bench", help="Memory use and lookup speed on synthetic books")
+    bench_parser.add_argument("--books", type=int, default=1000000)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        from common.util import mongo_read
+        buffer = build_snapshot(mongo_read.db.kindle_metadata, args.path)
+        print("Wrote %s (%.1f MB)" % (args.path, len(buffer) / 1e6))
+    else:
+        bench(args.books)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
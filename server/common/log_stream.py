@@ -0,0 +1,78 @@
+import os
+import queue
+import threading
+
+# Fan-out of new logs to the /user/logs/stream viewers. log_request publishes every log it
+# inserts and each viewer gets its own bounded queue, so any number of viewers cost no database
+# queries. A viewer that falls LOG_STREAM_BUFFER logs behind loses the oldest ones rather than
+# holding up the requests. Only logs written by this process are seen, the server runs as one.
+
+LOG_STREAM_BUFFER = int(os.getenv("LOG_STREAM_BUFFER", "1000"))
+LOG_STREAM_MAX_VIEWERS = int(os.getenv("LOG_STREAM_MAX_VIEWERS", "50"))
+
+
+def log_matches(log, path=None, status=None):
+    """path is a prefix of the logged path, status a code (404) or a class (4xx)"""
+    if path and not (log.get("path") or "").startswith(path):
+        return False
+    if status:
+        code = str(log.get("status_code"))
+        if status.lower().endswith("xx"):
+            return code[:1] == status[:1]
+        return code == status
+    return True
+
+
+class Viewer:
+    def __init__(self, path=None, status=None, buffer=LOG_STREAM_BUFFER):
+        self.path = path
+        self.status = status
+        self.logs = queue.Queue(maxsize=buffer)
+        self.dropped = 0
+
+    def put(self, log):
+        if not log_matches(log, self.path, self.status):
+            return
+        while True:
+            try:
+                self.logs.put_nowait(log)
+                return
+            except queue.Full:
+                try:
+                    self.logs.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+
+class LogStream:
+    def __init__(self, max_viewers=LOG_STREAM_MAX_VIEWERS):
+        self.max_viewers = max_viewers
+        self._viewers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, path=None, status=None):
+        """Returns a Viewer, or None when there are already max_viewers"""
+        with self._lock:
+            if len(self._viewers) >= self.max_viewers:
+                return None
+            viewer = Viewer(path, status)
+            self._viewers.add(viewer)
+            return viewer
+
+    def unsubscribe(self, viewer):
+        with self._lock:
+            self._viewers.discard(viewer)
+
+    def publish(self, log):
+        with self._lock:
+            viewers = list(self._viewers)
+        for viewer in viewers:
+            viewer.put(log)
+
+    def viewers(self):
+        with self._lock:
+            return len(self._viewers)
+
+
+log_stream = LogStream()
@@ -0,0 +1,143 @@
+import cProfile
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from flask import g, request
+
+# Request profiling, off unless PROFILE_SAMPLE_RATE > 0 or a request carries
+# "X-Profile: <PROFILE_ADMIN_TOKEN>". A profiled request runs under cProfile (aggregated per
+# resource into pstats, for the top-N report) and a sampler thread records its stack every
+# PROFILE_INTERVAL_MS (aggregated per resource as collapsed stacks, the input of flamegraph.pl
+# or speedscope). When neither is configured the hooks return after checking the two settings.
+
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_HEADER = "X-Profile"
+MAX_DEPTH = 128
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return "%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+
+
+class Profiles:
+    """Collapsed stacks and pstats per resource"""
+
+    def __init__(self, interval_ms=PROFILE_INTERVAL_MS):
+        self.interval = interval_ms / 1000.0
+        self.stacks = {}
+        self.stats = {}
+        self.requests = {}
+        self._active = {}
+        self._lock = threading.Lock()
+        # signalled under _lock when a request starts, so the sampler cannot miss it
+        self._wake = threading.Condition(self._lock)
+        self._sampler = None
+
+    def start(self, resource):
+        """Starts profiling the current thread, returns the cProfile.Profile or None"""
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiler is active (python 3.12+ allows one at a time), stack samples only
+            profile = None
+        with self._lock:
+            self._active[threading.get_ident()] = resource
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample, name="profiler", daemon=True)
+                self._sampler.start()
+            self._wake.notify()
+        return profile
+
+    def stop(self, resource, profile):
+        if profile is not None:
+            profile.disable()
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+            self.requests[resource] = self.requests.get(resource, 0) + 1
+            if profile is not None:
+                if resource in self.stats:
+                    self.stats[resource].add(profile)
+                else:
+                    self.stats[resource] = pstats.Stats(profile)
+
+    def _sample(self):
+        while True:
+            with self._lock:
+                while not self._active:
+                    self._wake.wait()
+                active = dict(self._active)
+            frames = sys._current_frames()
+            samples = []
+            for ident, resource in active.items():
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None and len(stack) < MAX_DEPTH:
+                    stack.append(frame_name(frame))
+                    frame = frame.f_back
+                if stack:
+                    samples.append((resource, ";".join(reversed(stack))))
+            with self._lock:
+                for resource, stack in samples:
+                    counts = self.stacks.setdefault(resource, {})
+                    counts[stack] = counts.get(stack, 0) + 1
+            time.sleep(self.interval)
+
+    def summary(self):
+        with self._lock:
+            return {resource: {"requests": count, "samples": sum(self.stacks.get(resource, {}).values())}
+                    for resource, count in self.requests.items()}
+
+    def collapsed(self, resource):
+        """Collapsed stacks, one "frame;frame;frame count" line per distinct stack"""
+        with self._lock:
+            counts = dict(self.stacks.get(resource, {}))
+        return "".join("%s %d\n" % (stack, count) for stack, count in sorted(counts.items()))
+
+    def top(self, resource, n=20, sort="tottime"):
+        """The n functions with the most own (tottime) or cumulative (cumtime) time"""
+        with self._lock:
+            stats = self.stats.get(resource)
+            rows = [] if stats is None else [
+                {"function": "%s:%d(%s)" % (os.path.basename(file), line, name),
+                 "calls": nc, "tottime": round(tt, 6), "cumtime": round(ct, 6)}
+                for (file, line, name), (cc, nc, tt, ct, callers) in stats.stats.items()]
+        return sorted(rows, key=lambda row: row[sort], reverse=True)[:n]
+
+    def reset(self):
+        with self._lock:
+            self.stacks, self.stats, self.requests = {}, {}, {}
+
+
+profiles = Profiles()
+
+
+def admin_request():
+    return bool(PROFILE_ADMIN_TOKEN) and request.headers.get(PROFILE_HEADER) == PROFILE_ADMIN_TOKEN
+
+
+def start_profile():
+    """before_request hook, samples PROFILE_SAMPLE_RATE of the requests (and admin ones)"""
+    if not PROFILE_SAMPLE_RATE and not PROFILE_ADMIN_TOKEN:
+        return None
+    sampled = PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE
+    if not sampled and not admin_request():
+        return None
+    if request.endpoint is None or request.endpoint.startswith("profile"):
+        return None
+    g.profile_resource = request.endpoint
+    g.profile = profiles.start(request.endpoint)
+    return None
+
+
+def stop_profile(exception=None):
+    """teardown_request hook"""
+    resource = g.pop("profile_resource", None)
+    if resource is not None:
+        profiles.stop(resource, g.pop("profile", None))
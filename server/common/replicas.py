@@ -0,0 +1,77 @@
+import random
+import threading
+import time
+import mysql.connector as db
+from mysql.connector import pooling
+from mysql.connector.errors import PoolError
+
+
+class MySQLRouter:
+    """Hands out MySQL connections from one pool per endpoint.
+    Writes always go to the primary. Reads go to a random replica whose replication lag
+    (Seconds_Behind_Master, checked at most every check_interval seconds) is below max_lag,
+    and fall back to the primary when no replica qualifies or a replica cannot be reached."""
+
+    def __init__(self, primary, replicas, user, password, database, pool_size=5, max_lag=10, check_interval=5):
+        self.config = {"user": user, "passwd": password, "db": database}
+        self.primary = primary
+        self.replicas = [host for host in replicas if host]
+        self.pool_size = pool_size
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._pools = {}
+        self._lag = {}
+        self._lock = threading.Lock()
+
+    def _pool(self, host):
+        with self._lock:
+            if host not in self._pools:
+                self._pools[host] = pooling.MySQLConnectionPool(
+                    pool_name="isit_" + host, pool_size=self.pool_size, host=host, **self.config)
+            return self._pools[host]
+
+    def _connection(self, host):
+        try:
+            return self._pool(host).get_connection()
+        except PoolError:
+            # every pooled connection is busy, serve this request with a dedicated one
+            return db.connect(host=host, **self.config)
+
+    def replica_lag(self, host):
+        """Returns the replication lag of host in seconds, None if it is not replicating or unreachable"""
+        now = time.time()
+        checked = self._lag.get(host)
+        if checked and now - checked[0] < self.check_interval:
+            return checked[1]
+        lag = None
+        try:
+            con = self._connection(host)
+            try:
+                cursor = con.cursor(dictionary=True)
+                cursor.execute("SHOW SLAVE STATUS")
+                status = cursor.fetchone()
+                if status and status.get("Slave_SQL_Running") == "Yes":
+                    lag = status.get("Seconds_Behind_Master")
+            finally:
+                con.close()
+        except db.Error as e:
+            print(e)
+        self._lag[host] = (now, lag)
+        return lag
+
+    def read_host(self):
+        """Returns a replica that is caught up enough to serve reads, or the primary"""
+        healthy = [host for host in self.replicas
+                   if self.replica_lag(host) is not None and self.replica_lag(host) <= self.max_lag]
+        return random.choice(healthy) if healthy else self.primary
+
+    def connect(self, read_only=False):
+        host = self.read_host() if read_only else self.primary
+        try:
+            return self._connection(host)
+        except db.Error as e:
+            if host == self.primary:
+                raise
+            print(e)
+            self._lag[host] = (time.time(), None)
+            return self._connection(self.primary)
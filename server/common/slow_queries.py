@@ -0,0 +1,220 @@
+import json
+import os
+import re
+import threading
+import time
+from flask import has_request_context, request
+from pymongo import monitoring
+
+# Slow query log. Mongo commands are timed by a pymongo CommandListener and MySQL statements by
+# the cursors of common.util.connect. Anything slower than SLOW_QUERY_MS is recorded under its
+# shape (the query with its values replaced by ?) with the resource that ran it, and the first
+# time a shape is slow its plan is captured with explain/EXPLAIN in a background thread.
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+MONGO_COMMANDS = {"find", "count", "aggregate", "distinct", "findAndModify", "update", "delete", "insert"}
+# fields of the command documents that are not part of the query
+MONGO_INTERNAL = {"lsid", "txnNumber", "$db", "$clusterTime", "$readPreference", "readConcern", "writeConcern"}
+MYSQL_EXPLAINABLE = ("SELECT", "UPDATE", "DELETE")
+
+
+_origin = threading.local()
+
+
+def current_resource():
+    if has_request_context() and request.endpoint:
+        return request.endpoint
+    return getattr(_origin, "resource", None) or threading.current_thread().name
+
+
+def with_resource(function):
+    """function for another thread, its queries are attributed to the current resource"""
+    resource = current_resource()
+
+    def run(*args, **kwargs):
+        _origin.resource = resource
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _origin.resource = None
+    return run
+
+
+def mongo_shape(value):
+    """value with every literal replaced by "?", keeping field names and operators"""
+    if isinstance(value, dict):
+        return {key: mongo_shape(item) for key, item in value.items()}
+    if isinstance(value, list):
+        # a list of documents (pipelines, $or) keeps its items, a list of values becomes one ?
+        if value and all(isinstance(item, dict) for item in value):
+            return [mongo_shape(item) for item in value]
+        return "?"
+    return "?"
+
+
+def mongo_command_shape(command_name, command):
+    collection = command.get(command_name)
+    query = {key: mongo_shape(value) for key, value in command.items()
+             if key != command_name and key not in MONGO_INTERNAL and key not in ("documents", "updates", "deletes")}
+    for key in ("updates", "deletes"):
+        if key in command and command[key]:
+            query[key] = mongo_shape(command[key][0])
+    return "%s %s %s" % (command_name, collection, json.dumps(query, sort_keys=True, default=str))
+
+
+MULTI_ROW = re.compile(r"(\([^()]*\))(\s*,\s*\([^()]*\))+")
+LITERALS = re.compile(r"'(?:[^'\\]|\\.)*'|\b\d+\b")
+SPACES = re.compile(r"\s+")
+
+
+def mysql_shape(statement):
+    shape = MULTI_ROW.sub(r"\1, ...", statement)
+    shape = LITERALS.sub("?", shape)
+    return SPACES.sub(" ", shape).strip()
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms=SLOW_QUERY_MS):
+        self.threshold_ms = threshold_ms
+        self.shapes = {}
+        self._lock = threading.Lock()
+
+    def record(self, kind, shape, duration_ms, resource, explain):
+        """Records a query if it is slow, explain() is called in the background for new shapes"""
+        if duration_ms < self.threshold_ms:
+            return
+        key = (kind, shape)
+        with self._lock:
+            entry = self.shapes.get(key)
+            new = entry is None
+            if new:
+                entry = self.shapes[key] = {"kind": kind, "shape": shape, "count": 0, "total_ms": 0.0,
+                                            "max_ms": 0.0, "resources": {}, "explain": None}
+            entry["count"] += 1
+            entry["total_ms"] += duration_ms
+            entry["max_ms"] = max(entry["max_ms"], duration_ms)
+            entry["resources"][resource] = entry["resources"].get(resource, 0) + 1
+        if new:
+            threading.Thread(target=self._explain, args=(key, explain), name="explain", daemon=True).start()
+
+    def _explain(self, key, explain):
+        try:
+            plan = explain()
+        except Exception as e:
+            plan = {"error": str(e)}
+        with self._lock:
+            if key in self.shapes:
+                self.shapes[key]["explain"] = plan
+
+    def top(self, n=20):
+        """The n shapes with the most time spent above the threshold"""
+        with self._lock:
+            entries = [dict(entry, resources=dict(entry["resources"]),
+                            avg_ms=round(entry["total_ms"] / entry["count"], 1),
+                            total_ms=round(entry["total_ms"], 1), max_ms=round(entry["max_ms"], 1))
+                       for entry in self.shapes.values()]
+        return sorted(entries, key=lambda entry: entry["total_ms"], reverse=True)[:n]
+
+    def reset(self):
+        with self._lock:
+            self.shapes = {}
+
+
+slow_queries = SlowQueryLog()
+
+
+# ================
+# Mongo
+# ================
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Registered before the clients are created, times the commands of every client"""
+
+    def __init__(self, log=slow_queries):
+        self.log = log
+        self._started = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        if event.command_name not in MONGO_COMMANDS:
+            return
+        with self._lock:
+            self._started[(event.connection_id, event.request_id)] = (event.command, current_resource())
+
+    def succeeded(self, event):
+        with self._lock:
+            started = self._started.pop((event.connection_id, event.request_id), None)
+        if started is None:
+            return
+        command, resource = started
+        shape = mongo_command_shape(event.command_name, command)
+        database = event.database_name
+        self.log.record("mongo", shape, event.duration_micros / 1000.0, resource,
+                        lambda: explain_mongo(database, command))
+
+    def failed(self, event):
+        with self._lock:
+            self._started.pop((event.connection_id, event.request_id), None)
+
+
+def explain_mongo(database, command):
+    from common.util import mongo
+    query = {key: value for key, value in command.items() if key not in MONGO_INTERNAL}
+    plan = mongo.cx[database].command("explain", query, verbosity="queryPlanner")
+    return json.loads(json.dumps(plan.get("queryPlanner", plan), default=str))
+
+
+mongo_listener = MongoCommandListener()
+
+
+# ================
+# MySQL
+# ================
+
+class TracedCursor:
+    """Cursor that times execute(), everything else goes to the wrapped cursor"""
+
+    def __init__(self, cursor, log=slow_queries):
+        self._cursor = cursor
+        self._log = log
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        start = time.time()
+        try:
+            return self._cursor.execute(operation, params, *args, **kwargs)
+        finally:
+            duration_ms = (time.time() - start) * 1000
+            self._log.record("mysql", mysql_shape(operation), duration_ms, current_resource(),
+                             lambda: explain_mysql(operation, params))
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+
+class TracedConnection:
+    """Connection whose cursors are TracedCursors"""
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def cursor(self, *args, **kwargs):
+        return TracedCursor(self._connection.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+def explain_mysql(operation, params):
+    if not operation.lstrip().upper().startswith(MYSQL_EXPLAINABLE):
+        return None
+    from common.util import mysql_router
+    con = mysql_router.connect(read_only=True)
+    try:
+        cursor = con.cursor(dictionary=True)
+        cursor.execute("EXPLAIN " + operation, params)
+        return cursor.fetchall()
+    finally:
+        con.close()
@@ -1,8 +1,10 @@
 import os
+import re
 from flask import Flask
 from flask_pymongo import PyMongo
 from common.env import getenv
-import mysql.connector as db
+from common.replicas import MySQLRouter
+from common.slow_queries import mongo_listener, TracedConnection
 
 # Get environment variables from .env
 getenv()
@@ -11,20 +13,71 @@ SQL_DATABASE = os.getenv("SQL_DB")
 SQL_HOST = os.getenv("SQL_HOST")
 SQL_USER = os.getenv("SQL_USER")
 SQL_PW = os.getenv("SQL_PW")
+# Read replicas (comma separated hosts), reads fall back to SQL_HOST when they lag more than SQL_MAX_LAG seconds
+SQL_REPLICAS = [host.strip() for host in os.getenv("SQL_REPLICAS", "").split(",") if host.strip()]
+SQL_MAX_LAG = int(os.getenv("SQL_MAX_LAG", "10"))
+SQL_POOL_SIZE = int(os.getenv("SQL_POOL_SIZE", "5"))
 
 # Connect to mongodb
 MONGO_HOST = os.getenv("MONGO_HOST")
 MONGO_DB = os.getenv("MONGO_DB")
 LOG_DB = os.getenv("LOG_DB")
+# Replica set members besides MONGO_HOST (comma separated hosts). Reads from mongo_read prefer
+# secondaries that are at most MONGO_MAX_STALENESS seconds behind (90 is the smallest mongo allows)
+MONGO_REPLICAS = [host.strip() for host in os.getenv("MONGO_REPLICAS", "").split(",") if host.strip()]
+MONGO_REPLICA_SET = os.getenv("MONGO_REPLICA_SET", "rs0")
+MONGO_MAX_STALENESS = int(os.getenv("MONGO_MAX_STALENESS", "90"))
+MONGO_POOL_SIZE = int(os.getenv("MONGO_POOL_SIZE", "100"))
+
+def mongo_uri(database, read_preference="primary"):
+    hosts = ",".join("{}:27017".format(host) for host in [MONGO_HOST] + MONGO_REPLICAS)
+    uri = "mongodb://admin:password@{}/{}?authSource=admin&maxPoolSize={}".format(hosts, database, MONGO_POOL_SIZE)
+    if MONGO_REPLICAS:
+        uri += "&replicaSet={}&readPreference={}".format(MONGO_REPLICA_SET, read_preference)
+        if read_preference != "primary":
+            uri += "&maxStalenessSeconds={}".format(MONGO_MAX_STALENESS)
+    return uri
+
 app = Flask(__name__)
 # kindle metadata
-mongo = PyMongo(app, uri="mongodb://admin:password@{}:27017/{}?authSource=admin".format(MONGO_HOST, MONGO_DB))
+mongo = PyMongo(app, uri=mongo_uri(MONGO_DB), event_listeners=[mongo_listener])
+# read only resources, served by secondaries when there are any (pymongo keeps a pool per member)
+mongo_read = PyMongo(app, uri=mongo_uri(MONGO_DB, "secondaryPreferred"),
+                     event_listeners=[mongo_listener]) if MONGO_REPLICAS else mongo
 # logs
-mongo_log = PyMongo(app, uri="mongodb://admin:password@{}:27017/{}?authSource=admin".format(MONGO_HOST, LOG_DB))
+mongo_log = PyMongo(app, uri=mongo_uri(LOG_DB))
+
+# Connect to MySQL, one connection pool per endpoint
+mysql_router = MySQLRouter(SQL_HOST, SQL_REPLICAS, SQL_USER, SQL_PW, SQL_DATABASE,
+                           pool_size=SQL_POOL_SIZE, max_lag=SQL_MAX_LAG)
+
+# ?fields= on the book endpoints, pushed down as a mongo projection
+FIELD_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z0-9_]+)*$")
+
+def fields_projection(fields):
+    """Returns the mongo projection of a comma separated list of fields, None if fields is empty
+    asin is always returned, _id only when asked for. Raises ValueError on invalid field names"""
+    if not fields:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    invalid = [name for name in names if not FIELD_NAME.match(name)]
+    if invalid:
+        raise ValueError("Invalid fields {}".format(", ".join(invalid)))
+    projection = {"_id": 0, "asin": 1}
+    for name in names:
+        projection[name] = 1
+    return projection
+
+def trim_fields(doc, projection):
+    """Drops the top level fields of doc that projection does not ask for"""
+    if doc is None or projection is None:
+        return doc
+    wanted = {name.split(".")[0] for name, value in projection.items() if value}
+    return {key: value for key, value in doc.items() if key in wanted}
 
-# Connect to MySQL
-def connect():
-    con = db.connect(host=SQL_HOST, user=SQL_USER, passwd=SQL_PW, db=SQL_DATABASE)
+def connect(read_only=False):
+    """Returns a connection and cursor, read_only ones may come from a replica
+    Closing the connection hands it back to its pool"""
+    con = TracedConnection(mysql_router.connect(read_only))
     cursor = con.cursor()
     return con, cursor
-    
\ No newline at end of file
@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+from common.util import mongo_log
+
+# The landing pages run the same queries for every visitor. warm() renders them through the
+# app itself and keeps the encoded responses, which app.py returns as is for matching GET
+# requests. It runs when the server starts and then every WARMUP_INTERVAL seconds.
+
+WARMUP_PAGES = int(os.getenv("WARMUP_PAGES", "5"))
+# page sizes requested by the frontend (AllBooks, AlsoBought)
+WARMUP_PAGE_SIZES = [int(size) for size in os.getenv("WARMUP_PAGE_SIZES", "24,18").split(",")]
+WARMUP_BOOKS = int(os.getenv("WARMUP_BOOKS", "100"))
+WARMUP_WINDOW_DAYS = int(os.getenv("WARMUP_WINDOW_DAYS", "7"))
+WARMUP_INTERVAL = int(os.getenv("WARMUP_INTERVAL", "600"))
+# set on the requests made by warm(), so that they are neither logged nor served from the cache
+WARMUP_ENVIRON = "isit.warmup"
+
+
+def cache_key(path, args):
+    """Key of a request, independent of the order of its query parameters"""
+    query = urlencode(sorted(args.items(multi=True)))
+    return path + "?" + query if query else path
+
+
+class HotCache:
+    """Encoded responses by cache_key, replaced as a whole by every warmup
+    Every invalidation bumps a generation, so that a warmup which started rendering before it
+    does not put back the responses it invalidated"""
+
+    def __init__(self):
+        self._responses = {}
+        self._generation = 0
+        # (generation, prefix) of the invalidations since the last replace
+        self._invalidated = []
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self._responses.get(key)
+
+    def generation(self):
+        """Taken before rendering, passed to replace"""
+        with self._lock:
+            return self._generation
+
+    def replace(self, responses, generation):
+        """Caches responses rendered since generation, except those invalidated meanwhile"""
+        with self._lock:
+            prefixes = [prefix for invalidated, prefix in self._invalidated if invalidated > generation]
+            self._responses = {key: response for key, response in responses.items()
+                               if not any(key.startswith(prefix) for prefix in prefixes)}
+            self._invalidated = []
+
+    def invalidate(self, prefix):
+        """Drops the responses whose key starts with prefix, they come back on the next warmup"""
+        with self._lock:
+            self._generation += 1
+            self._invalidated.append((self._generation, prefix))
+            self._responses = {key: response for key, response in self._responses.items()
+                               if not key.startswith(prefix)}
+
+    def __len__(self):
+        return len(self._responses)
+
+
+hot_cache = HotCache()
+
+
+def popular_books(limit=WARMUP_BOOKS, days=WARMUP_WINDOW_DAYS):
+    """Returns the asins of the books whose details were requested most in the last days
+    Requests of the book page (/book/<asin>/page, what the frontend loads) count for the book"""
+    pipeline = [
+        {"$match": {"method": "GET", "status_code": 200,
+                    "path": {"$regex": "^/book/[^/?]+(/page)?(\\?|$)"},
+                    "time": {"$gte": datetime.now() - timedelta(days=days)}}},
+        {"$group": {"_id": "$path", "hits": {"$sum": 1}}},
+        {"$sort": {"hits": -1}},
+        {"$limit": limit * 3}
+    ]
+    asins = []
+    for row in mongo_log.db.logs.aggregate(pipeline):
+        # the logged path is request.full_path, e.g. /book/B000FA5KK0? or /book/B000FA5KK0/page?
+        asin = row["_id"].split("?")[0][len("/book/"):].split("/")[0]
+        if asin and asin not in asins and asin not in ("new", "update"):
+            asins.append(asin)
+    return asins[:limit]
+
+
+def warmup_paths():
+    paths = ["/categories"]
+    for count in WARMUP_PAGE_SIZES:
+        paths += ["/books?count=%d&page=%d" % (count, page) for page in range(1, WARMUP_PAGES + 1)]
+    try:
+        # the book page is what the frontend loads, review writes invalidate it (resources/review.py)
+        paths += ["/book/%s/page" % asin for asin in popular_books()]
+    except Exception as e:
+        print(e)
+    return paths
+
+
+def warm(app):
+    """Renders the hot set and replaces the cached responses
+        Return: number of responses cached"""
+    start = time.time()
+    generation = hot_cache.generation()
+    responses = {}
+    client = app.test_client()
+    for path in warmup_paths():
+        try:
+            response = client.get(path, environ_overrides={WARMUP_ENVIRON: True})
+        except Exception as e:
+            print(e)
+            continue
+        if response.status_code == 200:
+            # the paths above are already in cache_key form
+            responses[path] = (response.get_data(), response.headers.get("Content-Type", "application/json"))
+    hot_cache.replace(responses, generation)
+    app.logger.info("Warmed %d responses in %.1fs" % (len(hot_cache), time.time() - start))
+    return len(hot_cache)
+
+
+def start_warmup(app, interval=WARMUP_INTERVAL):
+    """Warms the cache now and then every interval seconds, in a daemon thread"""
+    def loop():
+        while True:
+            try:
+                warm(app)
+            except Exception as e:
+                app.logger.warning("Warmup failed: %s" % e)
+            time.sleep(interval)
+
+    thread = threading.Thread(target=loop, name="warmup", daemon=True)
+    thread.start()
+    return thread
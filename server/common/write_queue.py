@@ -0,0 +1,126 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from common.util import mysql_router
+from common.slow_queries import TracedConnection
+
+# Review writes from concurrent requests are queued and written by one thread in batches:
+# the inserts of a batch become one multi-row INSERT, updates and deletes run one statement
+# each, and the whole batch is committed once. A batch is written as soon as REVIEW_BATCH_MAX
+# writes are queued or the oldest one waited REVIEW_FLUSH_MS. If the batch fails it is rolled
+# back and every write is retried alone, so that only the bad one reports the error.
+
+REVIEW_BATCH_MAX = int(os.getenv("REVIEW_BATCH_MAX", "100"))
+REVIEW_FLUSH_MS = float(os.getenv("REVIEW_FLUSH_MS", "5"))
+
+INSERT_COLUMNS = ["asin", "helpful", "overall", "reviewText", "reviewTime", "reviewerID", "reviewerName",
+                  "summary", "unixReviewTime"]
+INSERT = "INSERT INTO kindle_reviews ({}) VALUES ".format(", ".join(INSERT_COLUMNS))
+INSERT_ROW = "({})".format(", ".join(["%s"] * len(INSERT_COLUMNS)))
+STATEMENTS = {
+    "update": "UPDATE kindle_reviews SET overall=%s, reviewText=%s, summary=%s, reviewTime=%s, unixReviewTime=%s WHERE id=%s",
+    "delete": "DELETE FROM kindle_reviews WHERE id=%s",
+}
+
+
+class Write:
+    def __init__(self, kind, params):
+        self.kind = kind
+        self.params = params
+        self.future = Future()
+
+
+class ReviewWriter:
+    """Queue of review writes, each submit returns a Future of the write's result:
+    the new review id for an insert, the number of rows affected for an update or delete"""
+
+    def __init__(self, batch_max=REVIEW_BATCH_MAX, flush_ms=REVIEW_FLUSH_MS):
+        self.batch_max = batch_max
+        self.flush_seconds = flush_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, kind, params):
+        if kind != "insert" and kind not in STATEMENTS:
+            raise ValueError("Unknown review write {}".format(kind))
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="review-writer", daemon=True)
+                self._thread.start()
+        write = Write(kind, params)
+        self._queue.put(write)
+        return write.future
+
+    def insert(self, row):
+        """row has the INSERT_COLUMNS"""
+        return self.submit("insert", tuple(row[column] for column in INSERT_COLUMNS))
+
+    def update(self, id, overall, reviewText, summary, reviewTime, unixReviewTime):
+        return self.submit("update", (overall, reviewText, summary, reviewTime, unixReviewTime, id))
+
+    def delete(self, id):
+        return self.submit("delete", (id,))
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.time() + self.flush_seconds
+        while len(batch) < self.batch_max:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                results = self._write(batch)
+            except Exception as e:
+                print(e)
+                if len(batch) == 1:
+                    batch[0].future.set_exception(e)
+                    continue
+                for write in batch:
+                    try:
+                        write.future.set_result(self._write([write])[0])
+                    except Exception as e:
+                        write.future.set_exception(e)
+                continue
+            for write, result in zip(batch, results):
+                write.future.set_result(result)
+
+    def _write(self, batch):
+        """Writes batch in one transaction, returns the result of every write"""
+        results = [None] * len(batch)
+        con = TracedConnection(mysql_router.connect())
+        try:
+            cursor = con.cursor()
+            inserts = [i for i, write in enumerate(batch) if write.kind == "insert"]
+            if inserts:
+                values = [value for i in inserts for value in batch[i].params]
+                cursor.execute(INSERT + ", ".join([INSERT_ROW] * len(inserts)), values)
+                # the ids of a multi-row insert are consecutive (innodb_autoinc_lock_mode 0 or 1,
+                # 1 is the default of mysql 5.7), lastrowid is the first one
+                for n, i in enumerate(inserts):
+                    results[i] = cursor.lastrowid + n
+            for i, write in enumerate(batch):
+                if write.kind != "insert":
+                    cursor.execute(STATEMENTS[write.kind], write.params)
+                    results[i] = cursor.rowcount
+            con.commit()
+            return results
+        except Exception:
+            con.rollback()
+            raise
+        finally:
+            con.close()
+
+
+review_writer = ReviewWriter()
@@ -0,0 +1,117 @@
+from concurrent.futures import ThreadPoolExecutor
+from flask import json
+from flask_restful import Resource, reqparse
+from common.util import mongo_read, connect, fields_projection, trim_fields
+from common.catalog import catalog
+from common.slow_queries import with_resource
+from bson.json_util import dumps, default
+from resources.review import dictfetchall, reviews_query
+import time
+
+# shared by every request, each page runs its mongo and mysql queries at the same time
+BOOK_PAGE_WORKERS = 16
+DEFAULT_REVIEW_COUNT = 100
+RELATED_COUNT = 6
+executor = ThreadPoolExecutor(max_workers=BOOK_PAGE_WORKERS, thread_name_prefix="book-page")
+
+def book_details(asin, projection=None):
+    cursor = mongo_read.db.kindle_metadata.find_one({'asin': asin}, projection)
+    return json.loads(dumps(cursor, default=default))
+
+def related_previews(details):
+    """First page of the also bought previews, as BookPreviewResource returns them"""
+    asins = ((details or {}).get('related') or {}).get('also_bought') or []
+    if not asins:
+        return {"body": [], "count": 0}
+    if catalog.ready:
+        records = catalog.find(asins)
+        count = len(records)
+        records = records[:RELATED_COUNT]
+    else:
+        query = {"asin": {"$in": asins}}
+        count = mongo_read.db.kindle_metadata.find(query).count()
+        records = mongo_read.db.kindle_metadata.find(query, {"asin": 1, "title": 1, "imUrl": 1}).limit(RELATED_COUNT)
+    body = [{"asin": book.get('asin'), "title": book.get('title'), "imUrl": book.get('imUrl')} for book in records]
+    return {"body": body, "count": count}
+
+def details_and_related(asin, projection=None):
+    query_projection = None
+    if projection and not any(name.split(".")[0] == "related" for name in projection):
+        # the related previews need the also bought asins
+        query_projection = dict(projection, **{"related.also_bought": 1})
+    details = book_details(asin, query_projection)
+    return trim_fields(details, projection), related_previews(details)
+
+def review_page(asin, limit, offset, query):
+    con, cursor = connect(read_only=True)
+    try:
+        cursor.execute(query, (asin, limit, offset))
+        return dictfetchall(cursor)
+    finally:
+        con.close()
+
+def rating_summary(asin):
+    """Number of reviews per overall rating, in the shape BookDetails.jsx keeps them"""
+    con, cursor = connect(read_only=True)
+    try:
+        cursor.execute("SELECT overall, COUNT(*) FROM kindle_reviews where asin=%s GROUP BY overall", (asin,))
+        summary = {str(rating): 0 for rating in range(6)}
+        for overall, count in cursor.fetchall():
+            summary[str(overall)] = count
+        summary["total"] = sum(summary.values())
+        return summary
+    finally:
+        con.close()
+
+class BookPageResource(Resource):
+    """Returns everything the book page shows in one response
+    Book details (with the related previews), a page of reviews and the rating summary are fetched
+    concurrently, so the response takes as long as the slowest of them"""
+    def get(self, asin):
+        parser = reqparse.RequestParser()
+        parser.add_argument('page', type=int, location='args')
+        parser.add_argument('count', type=int, location='args')
+        parser.add_argument('fields', type=str, location='args', help="Comma separated fields of the book to return")
+        parser.add_argument('sort', type=str, location='args', help="Order of the reviews, as in /reviews/<asin>")
+        args = parser.parse_args()
+        try:
+            projection = fields_projection(args['fields'])
+            query = reviews_query(args['sort'])
+        except ValueError as e:
+            return {"message": str(e)}, 400
+
+        if not args['count'] or not args['page']:
+            _limit = DEFAULT_REVIEW_COUNT
+            _offset = 0
+        else:
+            _limit = args['count']
+            _offset = (args['page'] - 1) * args['count']
+
+        start = time.time()
+        details = executor.submit(with_resource(details_and_related), asin, projection)
+        reviews = executor.submit(with_resource(review_page), asin, _limit, _offset, query)
+        summary = executor.submit(with_resource(rating_summary), asin)
+
+        try:
+            book, related = details.result()
+        except Exception as e:
+            print(e)
+            return {"message": "Error retrieving book {}".format(asin)}, 500
+        if book is None:
+            return {"message": "Book {} not found".format(asin)}, 404
+
+        # the book is still shown when mysql is unavailable
+        try:
+            review_list = reviews.result()
+            rating = summary.result()
+        except Exception as e:
+            print(e)
+            review_list = None
+            rating = None
+
+        return {"message": "Successfully retrieve book page",
+                "book": book,
+                "related": related,
+                "reviews": review_list,
+                "rating": rating,
+                "elapsed_ms": round((time.time() - start) * 1000, 1)}, 200
@@ -1,11 +1,26 @@
 from flask import render_template, make_response, request
 from flask_restful import Resource, reqparse
-from common.util import mongo
+from common.util import mongo_read, fields_projection
+from common.catalog import catalog
+from resources.metadata import CATALOG_FIELDS, lightweight, fields_argument
+from bson.json_util import dumps, default
 import json
 
 default_book_title = "untitled"
 default_img_Url = "no-url"
 # mongodb_database = kindle_metadata
+PREVIEW_PROJECTION = {"asin" : 1, "title": 1, "imUrl": 1}
+
+def catalog_previews(records, projection):
+    """Previews of catalog records, only asin and the ?fields= ones when a projection is given"""
+    if projection is None:
+        return [{"asin": book.get('asin'), "title": book.get('title'), "imUrl": book.get('imUrl')} for book in records]
+    fields = [field for field, value in projection.items() if value]
+    return [lightweight(book, fields) for book in records]
+
+def served_by_catalog(projection):
+    return catalog.ready and (projection is None or
+                              {field for field, value in projection.items() if value} <= set(CATALOG_FIELDS))
 
 class BookPreviewResource(Resource):
     def regex_generator(self, arr):
@@ -19,23 +34,41 @@ class BookPreviewResource(Resource):
     def post(self):
         """Returns book information (lightweight)   
         Request Body: (asinArray) Array of string 
-        Response Body: Array of json(asin,title,imUrl)"""
+        Response Body: Array of json(asin,title,imUrl), or asin and the fields in ?fields="""
         parser = reqparse.RequestParser()
         parser.add_argument('page', type=int, location='args')
         parser.add_argument('count', type=int, location='args')
+        fields_argument(parser)
         args = parser.parse_args()
+        try:
+            projection = fields_projection(args['fields'])
+        except ValueError as e:
+            return {"message": str(e)}, 400
         json_request = request.get_json(force=True)
         _asinArray = json_request.get('asinArray')
         booksJSONArray = list()
 
-        _count = mongo.db.kindle_metadata.find({"asin": {"$regex": self.regex_generator(_asinArray) }}).count()
+        if served_by_catalog(projection):
+            # exact asins, the frontend always sends whole ones
+            records = catalog.find(_asinArray or [])
+            _count = len(records)
+            if args['count'] and args['page']:
+                records = records[(args['page']-1) * args['count']:args['page'] * args['count']]
+            booksJSONArray = catalog_previews(records, projection)
+            return {"message": "Book previews shown", "asinArray": str(_asinArray), "body": booksJSONArray, "count": _count}, 200
+
+        _count = mongo_read.db.kindle_metadata.find({"asin": {"$regex": self.regex_generator(_asinArray) }}).count()
 
         if (not args['count'] or not args['page']):
-            bookInfo = mongo.db.kindle_metadata.find({"asin" : {"$regex": self.regex_generator(_asinArray) }}, {"asin" : 1, "title": 1, "imUrl": 1})
+            bookInfo = mongo_read.db.kindle_metadata.find({"asin" : {"$regex": self.regex_generator(_asinArray) }}, projection or PREVIEW_PROJECTION)
         else:
             _limit = args['count']
             _offset = (args['page']-1) * args['count']
-            bookInfo = mongo.db.kindle_metadata.find({"asin" : {"$regex": self.regex_generator(_asinArray) }}, {"asin" : 1, "title": 1, "imUrl": 1}).skip(_offset).limit(_limit)
+            bookInfo = mongo_read.db.kindle_metadata.find({"asin" : {"$regex": self.regex_generator(_asinArray) }}, projection or PREVIEW_PROJECTION).skip(_offset).limit(_limit)
+
+        if projection:
+            booksJSONArray = json.loads(dumps(bookInfo, default=default))
+            return {"message": "Book previews shown", "asinArray": str(_asinArray), "body": booksJSONArray, "count": _count}, 200
 
         for item in bookInfo:
             book_asin = item.get('asin')
@@ -50,22 +83,39 @@ class BookCategoryResource(Resource):
     def post(self):
         """Returns books that have categories containing categories in categoryArray
         Request Body: (categoryArray) Array of String 
-        Response Body: Array of json(asin, title, imUrl)"""
+        Response Body: Array of json(asin, title, imUrl), or asin and the fields in ?fields="""
         parser = reqparse.RequestParser()
         parser.add_argument('page', type=int, location='args')
         parser.add_argument('count', type=int, location='args')
+        fields_argument(parser)
         args = parser.parse_args()
+        try:
+            projection = fields_projection(args['fields'])
+        except ValueError as e:
+            return {"message": str(e)}, 400
         json_request = request.get_json(force=True)
         _categoryArray = json_request.get('categoryArray')
         filteredArray = list()
-        _count = mongo.db.kindle_metadata.find({"categories.0": {"$elemMatch": {"$in": _categoryArray}}}).count()
+
+        if served_by_catalog(projection):
+            if (not args['count'] or not args['page']):
+                _count, records = catalog.in_categories(_categoryArray or [])
+            else:
+                _count, records = catalog.in_categories(_categoryArray or [], (args['page']-1) * args['count'], args['count'])
+            filteredArray = catalog_previews(records, projection)
+            return {"message": "Books filtered based on categories", "categoryArray": str(_categoryArray), "body": filteredArray, "count": _count}, 200
+        _count = mongo_read.db.kindle_metadata.find({"categories.0": {"$elemMatch": {"$in": _categoryArray}}}).count()
 
         if (not args['count'] or not args['page']):
-            bookInfo = mongo.db.kindle_metadata.find({"categories.0": {"$elemMatch": {"$in": _categoryArray}}}, {"asin" : 1, "title": 1, "imUrl": 1})
+            bookInfo = mongo_read.db.kindle_metadata.find({"categories.0": {"$elemMatch": {"$in": _categoryArray}}}, projection or PREVIEW_PROJECTION)
         else:
             _limit = args['count']
             _offset = (args['page']-1) * args['count']
-            bookInfo = mongo.db.kindle_metadata.find({"categories.0": {"$elemMatch": {"$in": _categoryArray}}}, {"asin" : 1, "title": 1, "imUrl": 1}).skip(_offset).limit(_limit)
+            bookInfo = mongo_read.db.kindle_metadata.find({"categories.0": {"$elemMatch": {"$in": _categoryArray}}}, projection or PREVIEW_PROJECTION).skip(_offset).limit(_limit)
+
+        if projection:
+            filteredArray = json.loads(dumps(bookInfo, default=default))
+            return {"message": "Books filtered based on categories", "categoryArray": str(_categoryArray), "body": filteredArray, "count": _count}, 200
 
         for item in bookInfo:
             book_asin = item.get('asin')
@@ -2,7 +2,8 @@ from flask import render_template, make_response, request
 from flask_restful import Resource, reqparse
 from flask import json
 from pymongo import ASCENDING, DESCENDING
-from common.util import mongo
+from common.util import mongo, mongo_read
+from common.warmup import hot_cache
 from bson.json_util import dumps, default
 
 class CategoriesResource(Resource):
@@ -14,7 +15,7 @@ class CategoriesResource(Resource):
 
         if (not args['initial']):
             try:
-                cursor = mongo.db.categories.find({}, {"letter":1, "categories": 1, "_id": 0}).sort([('categories', ASCENDING), ('letter', ASCENDING)])
+                cursor = mongo_read.db.categories.find({}, {"letter":1, "categories": 1, "_id": 0}).sort([('categories', ASCENDING), ('letter', ASCENDING)])
                 jsonstring = dumps(cursor, default=default)
                 return json.loads(jsonstring), 200
 
@@ -25,7 +26,7 @@ class CategoriesResource(Resource):
         _initial = args['initial']
 
         try:
-            cursor = mongo.db.categories.find_one({'letter': _initial}, {'categories': 1})
+            cursor = mongo_read.db.categories.find_one({'letter': _initial}, {'categories': 1})
             jsonstring = dumps(cursor, default=default)
             return json.loads(jsonstring), 200
 
@@ -72,6 +73,7 @@ class CategoriesResource(Resource):
                     print(e)
                     return {"message": "error adding new category {}".format(cat)}, 400
             
+            hot_cache.invalidate("/categories")
             return {"message": "Successfully added new categories {}".format(add_categories)}, 200
 
         return {"message": "No new categories to add"}, 200
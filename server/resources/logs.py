@@ -1,11 +1,18 @@
+from flask import Response, json, request
 from flask_restful import Resource, reqparse
 from common.util import mongo_log
+from common.log_stream import log_stream, LOG_STREAM_BUFFER
 from datetime import datetime
 from bson import ObjectId
+from bson.errors import InvalidId
+import queue
+import re
 
 MAX_STRING_LENGTH = 70
 DEFAULT_COUNT = 50
 DEFAULT_OFFSET = 0
+HEARTBEAT_SECONDS = 15
+STATUS_FILTER = re.compile(r"^[1-5](\d\d|xx)$")
 
 class LogsList(Resource):
     """ Returns a list of loggings """
@@ -28,23 +35,7 @@ class LogsList(Resource):
         logs = mongo_log.db.logs.find({}).limit(_limit).skip(_offset)
         logs_count = mongo_log.db.logs.find({}).count()
         for log in logs:
-            log_id = str(log.get('_id'))
-            time = log.get('time').strftime("%d-%m-%Y, %H:%M:%S")
-            method = log.get('method')
-            path = log.get('path')
-            status = log.get('status')
-            body = log.get('body')
-            if len(body) > MAX_STRING_LENGTH:
-                body = body[:MAX_STRING_LENGTH-1] + '...'
-            json = {
-                "id": log_id,
-                "time": time,
-                "method": method,
-                "path": path,
-                "status": status,
-                "body": body
-            }
-            log_array.append(json)
+            log_array.append(log_json(log))
         return {"message": "Successful returns logs list", "body": log_array, "count": logs_count}, 200
 
 class LogAPI(Resource):
@@ -66,3 +57,84 @@ class LogAPI(Resource):
             "body": body
         }
         return json
+
+def log_json(log):
+    """A log as LogsList returns it"""
+    body = log.get('body') or ''
+    if len(body) > MAX_STRING_LENGTH:
+        body = body[:MAX_STRING_LENGTH-1] + '...'
+    return {
+        "id": str(log.get('_id')),
+        "time": log.get('time').strftime("%d-%m-%Y, %H:%M:%S"),
+        "method": log.get('method'),
+        "path": log.get('path'),
+        "status": log.get('status'),
+        "body": body
+    }
+
+def log_query(path, status):
+    """The mongo filter of log_matches"""
+    query = {}
+    if path:
+        query["path"] = {"$regex": "^" + re.escape(path)}
+    if status:
+        if status.endswith("xx"):
+            low = int(status[0]) * 100
+            query["status_code"] = {"$gte": low, "$lt": low + 100}
+        else:
+            query["status_code"] = int(status)
+    return query
+
+class LogStreamAPI(Resource):
+    """ Streams new logs as server-sent events, optionally filtered by path prefix and status (404 or 4xx)
+    A reconnecting EventSource sends Last-Event-ID, the logs it missed are sent first """
+    def get(self):
+        parser = reqparse.RequestParser()
+        parser.add_argument('path', type=str, location='args')
+        parser.add_argument('status', type=str, location='args')
+        args = parser.parse_args()
+        status = args['status'].lower() if args['status'] else None
+        if status and not STATUS_FILTER.match(status):
+            return {"message": "status must be a status code or class, e.g. 404 or 4xx"}, 400
+        try:
+            last_id = ObjectId(request.headers['Last-Event-ID']) if request.headers.get('Last-Event-ID') else None
+        except InvalidId:
+            last_id = None
+
+        # subscribed before reading the missed logs, so that none are lost in between
+        viewer = log_stream.subscribe(args['path'], status)
+        if viewer is None:
+            return {"message": "Too many log viewers, try again later"}, 503
+        missed = []
+        if last_id is not None:
+            try:
+                query = dict(log_query(args['path'], status), _id={"$gt": last_id})
+                missed = list(mongo_log.db.logs.find(query).sort("_id", 1).limit(LOG_STREAM_BUFFER))
+            except Exception as e:
+                print(e)
+        response = Response(self.events(viewer, missed), mimetype="text/event-stream",
+                            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+        # closing a generator that never started (HEAD requests) skips its finally, the
+        # response is closed in every case
+        response.call_on_close(lambda: log_stream.unsubscribe(viewer))
+        return response
+
+    def events(self, viewer, missed):
+        yield "retry: 3000\n\n"
+        last_id = None
+        for log in missed:
+            last_id = log['_id']
+            yield self.event(log)
+        while True:
+            try:
+                log = viewer.logs.get(timeout=HEARTBEAT_SECONDS)
+            except queue.Empty:
+                # keeps proxies from closing an idle stream, and notices viewers that left
+                yield ": keepalive\n\n"
+                continue
+            if last_id is not None and log['_id'] <= last_id:
+                continue
+            yield self.event(log)
+
+    def event(self, log):
+        return "id: {}\ndata: {}\n\n".format(log['_id'], json.dumps(log_json(log)))
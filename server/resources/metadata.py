@@ -1,23 +1,65 @@
 from flask import json
 from flask_restful import Resource, request, reqparse
-from common.util import mongo
+from common.util import mongo, mongo_read, fields_projection, trim_fields
+from common.warmup import hot_cache
+from common.catalog import catalog
 from bson.json_util import dumps, default
+from pymongo import ReturnDocument
 from random import random
 
+CATALOG_FIELDS = ["_id", "asin", "title", "imUrl"]
+# returned by the book endpoints when no fields are asked for
+LIST_FIELDS = ["_id", "asin", "imUrl", "title"]
+PAGE_FIELDS = ["_id", "asin", "imUrl"]
+
+def lightweight(record, fields):
+    """Catalog record as mongo would return it with the given projection"""
+    book = {}
+    for field in fields:
+        if field == "_id" and "_id" in record:
+            book["_id"] = {"$oid": record["_id"]}
+        elif field in record:
+            book[field] = record[field]
+    return book
+
+def fields_argument(parser):
+    parser.add_argument('fields', type=str, location='args', help="Comma separated fields to return")
+
 class GetBookTitles(Resource):
-    """Returns all book titles"""
+    """Returns all book titles (asin and title, or asin and the fields in ?fields=)"""
     def get(self):
+        parser = reqparse.RequestParser()
+        fields_argument(parser)
+        args = parser.parse_args()
+        try:
+            projection = fields_projection(args['fields'])
+        except ValueError as e:
+            return {"message": str(e)}, 400
+
         try:
-            cursor = mongo.db.kindle_metadata.find({'title': {'$exists': 1}}, {'_id': 0, 'asin': 1,'title': 1})
+            fields = [field for field, value in projection.items() if value] if projection else ["asin", "title"]
+            if catalog.ready and set(fields) <= {"asin", "title"}:
+                titles = [{"asin": asin, "title": title} if "title" in fields else {"asin": asin}
+                          for asin, title in catalog.titles()]
+                return {"message": "Successfully retrieve all titles", "titles": titles}, 200
+            cursor = mongo_read.db.kindle_metadata.find({'title': {'$exists': 1}}, projection or {'_id': 0, 'asin': 1,'title': 1})
             json_query = json.loads(dumps(cursor, default=default))
             return {"message": "Successfully retrieve all titles", "titles": json_query}, 200
         except:
             return {"message": "Failed to retrieve all titles"}, 500
 
 class GetBookDetails(Resource):
-    """Returns book details (all available fields)"""
+    """Returns book details (all available fields, or the ones in ?fields=)"""
     def get(self, asin):
-        cursor = mongo.db.kindle_metadata.find_one({'asin': asin})
+        parser = reqparse.RequestParser()
+        fields_argument(parser)
+        args = parser.parse_args()
+        try:
+            projection = fields_projection(args['fields'])
+        except ValueError as e:
+            return {"message": str(e)}, 400
+
+        cursor = mongo_read.db.kindle_metadata.find_one({'asin': asin}, projection)
         jsonstring = dumps(cursor, default=default)
         return json.loads(jsonstring)
 
@@ -27,20 +69,32 @@ class BooksListResource(Resource):
         parser = reqparse.RequestParser()
         parser.add_argument('page', type=int, location='args')
         parser.add_argument('count', type=int, location='args')
+        fields_argument(parser)
         args = parser.parse_args()
-
-        _total_count = mongo.db.kindle_metadata.count()
+        try:
+            projection = fields_projection(args['fields'])
+        except ValueError as e:
+            return {"message": str(e)}, 400
 
         if (not args['count'] or not args['page']):
-            cursor = mongo.db.kindle_metadata.find({},
-                {"asin" : 1, "imUrl" : 1, "title" : 1}).skip(0).limit(15)
-            json_query = json.loads(dumps(cursor, default=default))
-            return {"message": "Successfully retrieve all books", "books": json_query, "count": _total_count}, 200
-        
-        _limit = args['count']
-        _offset = (args['page']-1) * args['count']
-        cursor = mongo.db.kindle_metadata.find({},
-             {"asin" : 1, "imUrl" : 1}).skip(_offset).limit(_limit)
+            _limit = 15
+            _offset = 0
+            fields = LIST_FIELDS
+        else:
+            _limit = args['count']
+            _offset = (args['page']-1) * args['count']
+            fields = PAGE_FIELDS
+        if projection:
+            fields = [field for field, value in projection.items() if value]
+
+        if catalog.ready and set(fields) <= set(CATALOG_FIELDS):
+            books = [lightweight(record, fields) for record in catalog.page(_offset, _limit)]
+            return {"message": "Successfully retrieve all books", "books": books, "count": catalog.count()}, 200
+
+        _total_count = mongo_read.db.kindle_metadata.count()
+
+        cursor = mongo_read.db.kindle_metadata.find({},
+             projection or {field: 1 for field in fields}).skip(_offset).limit(_limit)
         json_query = json.loads(dumps(cursor, default=default))
         return {"message": "Successfully retrieve all books", "books": json_query, "count": _total_count}, 200
 
@@ -59,7 +113,15 @@ class RegisterNewBook(Resource):
         return int2str.zfill(10)
 
     def post(self):
-        """Returns a dictionary of fields that were updated"""
+        """Returns a dictionary of fields that were updated (or the ones in ?fields=)"""
+        parser = reqparse.RequestParser()
+        fields_argument(parser)
+        args = parser.parse_args()
+        try:
+            projection = fields_projection(args['fields'])
+        except ValueError as e:
+            return {"message": str(e)}, 400
+
         req_json = request.get_json(force=True)
 
         try: 
@@ -80,7 +142,9 @@ class RegisterNewBook(Resource):
         query = self.get_filled_fields(field_names, fields)
         try:
             mongo.db.kindle_metadata.insert_one(query)
-            return {"message": "Book registered", "body": json.loads(dumps(query))}, 200
+            catalog.upsert(query)
+            hot_cache.invalidate("/books?")
+            return {"message": "Book registered", "body": json.loads(dumps(trim_fields(query, projection)))}, 200
             
         except Exception as e:
             print(e)
@@ -97,9 +161,17 @@ class UpdateBookResource(Resource):
 
     def put(self, asin):
         """Updates book details
-            Parameters: asin
+            Parameters: asin, ?fields= of the updated book to return (all by default)
             Body: json(title, categories, imUrl, related?, price?, description)
             """
+        parser = reqparse.RequestParser()
+        fields_argument(parser)
+        args = parser.parse_args()
+        try:
+            projection = fields_projection(args['fields'])
+        except ValueError as e:
+            return {"message": str(e)}, 400
+
         json_request = request.get_json(force=True)
         _title = json_request.get('title')
         _imUrl = json_request.get('imUrl')
@@ -111,12 +183,20 @@ class UpdateBookResource(Resource):
         fields = [_title, _imUrl, _categories, _price, _description]
         to_be_updated = self.get_filled_fields(field_names, fields)
 
+        # the catalog fields are fetched too, to keep the catalog up to date
+        query_projection = None
+        if projection:
+            query_projection = dict(projection, _id=1, title=1, imUrl=1, categories=1)
+
         try:
-            cursor = mongo.db.kindle_metadata.update({"asin": asin}, {"$set": to_be_updated})
-            if cursor['updatedExisting']:
-                # return the updated book if update was successful
-                cursor = mongo.db.kindle_metadata.find_one({"asin": asin})
-                jsonstring = dumps(cursor, default=default)
+            # one round trip, returning the book as it is after the update
+            cursor = mongo.db.kindle_metadata.find_one_and_update({"asin": asin}, {"$set": to_be_updated},
+                projection=query_projection, return_document=ReturnDocument.AFTER)
+            if cursor is not None:
+                hot_cache.invalidate("/book/" + asin)
+                hot_cache.invalidate("/books?")
+                catalog.upsert(cursor)
+                jsonstring = dumps(trim_fields(cursor, projection), default=default)
                 updated_json_body = json.loads(jsonstring)
                 return {"message": "Book details updated", "body": updated_json_body}, 200
             raise Exception("Something went wrong during book update to Database")
@@ -1,9 +1,30 @@
+from flask import Response
 from flask_restful import Resource, reqparse
 from common.util import connect
+from common.write_queue import review_writer
+from common.warmup import hot_cache
 import json
 import time
 import datetime
 
+# ?sort= of the reviews of a book, each one is served by an (asin, column) index
+# (id breaks ties in the same direction, the secondary indexes end with the primary key)
+REVIEW_SORTS = {
+    "newest": "unixReviewTime DESC, id DESC",
+    "oldest": "unixReviewTime ASC, id ASC",
+    "helpful": "helpful_yes DESC, id DESC",
+    "rating_high": "overall DESC, id DESC",
+    "rating_low": "overall ASC, id ASC",
+}
+
+def reviews_query(sort):
+    """Returns the query of a page of reviews of a book, raises ValueError on an unknown sort"""
+    if not sort:
+        return "SELECT * FROM kindle_reviews where asin=%s LIMIT %s OFFSET %s"
+    if sort not in REVIEW_SORTS:
+        raise ValueError("sort must be one of {}".format(", ".join(REVIEW_SORTS)))
+    return "SELECT * FROM kindle_reviews where asin=%s ORDER BY {} LIMIT %s OFFSET %s".format(REVIEW_SORTS[sort])
+
 def dictfetchall(cursor):
     """Returns all rows from a cursor as a list of dicts"""
     desc = cursor.description
@@ -16,6 +37,7 @@ class ReviewsAPI(Resource):
 
         parser.add_argument('page', type=int, location='args')
         parser.add_argument('count', type=int, location='args')
+        parser.add_argument('sort', type=str, location='args', help="newest, oldest, helpful, rating_high or rating_low")
 
         args = parser.parse_args()
 
@@ -26,9 +48,14 @@ class ReviewsAPI(Resource):
             _limit = args['count']
             _offset = (args['page'] - 1) * args['count']
 
-        con, cursor = connect()
         try:
-            cursor.execute("SELECT * FROM kindle_reviews where asin=%s LIMIT %s OFFSET %s", (asin, _limit, _offset))
+            query = reviews_query(args['sort'])
+        except ValueError as e:
+            return {"message": str(e)}, 400
+
+        con, cursor = connect(read_only=True)
+        try:
+            cursor.execute(query, (asin, _limit, _offset))
             results = dictfetchall(cursor)
             return {"message": "Successfully retrieve all reviews","reviews": results}, 200
         except Exception as e:
@@ -57,27 +84,39 @@ class ReviewsAPI(Resource):
         _unixReviewTime = int(time.time())
         _reviewTime = datetime.datetime.utcfromtimestamp(_unixReviewTime).strftime('%m %d, %Y')
 
-        format_specifier_string = ('%s, '* 10).strip(', ')
-        sql = "INSERT INTO kindle_reviews (id, asin, helpful, overall, reviewText, reviewTime, reviewerID, reviewerName, summary, unixReviewTime) VALUES (%s)" % format_specifier_string
-        val = (None, asin, _helpful, _overall, _reviewText, _reviewTime, _reviewerID, _reviewerName, _summary, _unixReviewTime)
-        
-        con, cursor = connect()
+        row = {"asin": asin, "helpful": _helpful, "overall": _overall, "reviewText": _reviewText,
+               "reviewTime": _reviewTime, "reviewerID": _reviewerID, "reviewerName": _reviewerName,
+               "summary": _summary, "unixReviewTime": _unixReviewTime}
 
         try:
-            cursor.execute(sql, val)
-            con.commit()
-            return {"message": "Book review posted"}, 200
+            # committed together with the other reviews written at the same time
+            review_id = review_writer.insert(row).result()
+            invalidate_book_page(asin)
+            return {"message": "Book review posted", "id": review_id}, 200
         
         except Exception as e:
             print(e)
+            return {"message": "Something goes wrong"}, 500
 
-        finally:
-            con.close()
+def review_asin(id):
+    """asin of a review, read from the primary before it is edited or deleted"""
+    con, cursor = connect()
+    try:
+        cursor.execute("SELECT asin FROM kindle_reviews where id=%s", (id,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+    finally:
+        con.close()
+
+def invalidate_book_page(asin):
+    # the warmed book page holds the first reviews and the rating summary
+    if asin:
+        hot_cache.invalidate("/book/%s/page" % asin)
 
 class ReviewAPI(Resource):
     def get(self, id):
 
-        con, cursor = connect()
+        con, cursor = connect(read_only=True)
 
         try:
             cursor.execute("SELECT * FROM kindle_reviews where id=%s", (id,))
@@ -92,18 +131,15 @@ class ReviewAPI(Resource):
 
     def delete(self, id):
 
-        con, cursor = connect()
-
         try: 
-            cursor.execute("DELETE FROM kindle_reviews where id=%s", (id,))
-            con.commit()
+            asin = review_asin(id)
+            review_writer.delete(id).result()
+            invalidate_book_page(asin)
             return {'message': 'Book review with id {} was deleted'.format(id)}, 200
 
         except Exception as e:
             print(e)
-        
-        finally:
-            con.close()
+            return {"message": "Something goes wrong"}, 500
 
     def put(self, id):
 
@@ -120,32 +156,127 @@ class ReviewAPI(Resource):
         _unixReviewTime = int(time.time())
         _reviewTime = datetime.datetime.utcfromtimestamp(_unixReviewTime).strftime('%m %d, %Y')
 
-        con, cursor = connect()
-
         try:
-            cursor.execute("UPDATE kindle_reviews SET overall={}, reviewText='{}', summary='{}', reviewTime='{}', unixReviewTime={} WHERE id='{}'".format(_overall, _reviewText, _summary, _reviewTime, _unixReviewTime, id))
-            con.commit()
+            asin = review_asin(id)
+            review_writer.update(id, _overall, _reviewText, _summary, _reviewTime, _unixReviewTime).result()
+            invalidate_book_page(asin)
             response = {"message": "Book review with id {} was edited".format(id)}
             return response, 200
 
         except Exception as e:
             print(e)
+            return {"message": "Something goes wrong"}, 500
 
-        finally:
-             con.close()
+REVIEW_COLUMNS = ["id", "asin", "helpful", "overall", "reviewText", "reviewTime", "reviewerID",
+                  "reviewerName", "summary", "unixReviewTime", "helpful_yes", "helpful_total"]
+DEFAULT_USER_COUNT = 50
+MAX_USER_COUNT = 500
+EXPORT_BATCH = 1000
+
+def review_columns(fields):
+    """Returns the selected columns of ?fields=, id and unixReviewTime are always included
+    (the page cursor is made of them). Raises ValueError on unknown columns"""
+    if not fields:
+        return REVIEW_COLUMNS
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in REVIEW_COLUMNS]
+    if unknown:
+        raise ValueError("Unknown fields {}".format(", ".join(unknown)))
+    return ["id", "unixReviewTime"] + [name for name in names if name not in ("id", "unixReviewTime")]
+
+def parse_cursor(value):
+    """?cursor= is "<unixReviewTime>_<id>" of the last review of the previous page"""
+    try:
+        review_time, review_id = value.split("_")
+        return int(review_time), int(review_id)
+    except ValueError:
+        raise ValueError("Invalid cursor {}".format(value))
 
 class ReviewsByUserAPI(Resource):
+    """Reviews of a reviewer, newest first, one page at a time from the (reviewerID, unixReviewTime) index
+    ?export=1 streams every review instead, as one json object per line"""
     def get(self, reviewerID):
+        parser = reqparse.RequestParser()
+        parser.add_argument('count', type=int, location='args')
+        parser.add_argument('cursor', type=str, location='args')
+        parser.add_argument('fields', type=str, location='args', help="Comma separated columns to return")
+        parser.add_argument('export', type=int, location='args')
+        args = parser.parse_args()
+
+        try:
+            columns = review_columns(args['fields'])
+            after = parse_cursor(args['cursor']) if args['cursor'] else None
+        except ValueError as e:
+            return {"message": str(e)}, 400
 
-        con, cursor = connect()
+        select = "SELECT {} FROM kindle_reviews where reviewerID=%s".format(", ".join(columns))
+        order = " ORDER BY unixReviewTime DESC, id DESC"
+        if args['export']:
+            return Response(self.export(select + order, reviewerID), mimetype="application/x-ndjson",
+                            headers={"Content-Disposition": "attachment; filename={}.ndjson".format(reviewerID)})
+
+        _limit = min(args['count'] or DEFAULT_USER_COUNT, MAX_USER_COUNT)
+        params = [reviewerID]
+        if after:
+            select += " AND (unixReviewTime < %s OR (unixReviewTime = %s AND id < %s))"
+            params += [after[0], after[0], after[1]]
+
+        con, cursor = connect(read_only=True)
 
         try:
-            cursor.execute("SELECT * FROM kindle_reviews where reviewerID=%s", (reviewerID,))
+            # one extra row tells if there is a next page
+            cursor.execute(select + order + " LIMIT %s", params + [_limit + 1])
             results = dictfetchall(cursor)
-            return results
+            next_cursor = None
+            if len(results) > _limit:
+                results = results[:_limit]
+                next_cursor = "{}_{}".format(results[-1]["unixReviewTime"], results[-1]["id"])
+            return {"message": "Successfully retrieve reviews of {}".format(reviewerID),
+                    "reviews": results, "next_cursor": next_cursor}, 200
 
         except Exception as e:
             print(e)
+            return {"message": "Something goes wrong"}, 500
 
         finally:
              con.close()
+
+    def export(self, query, reviewerID):
+        """Yields the reviews as json lines, fetching them in batches from an unbuffered cursor"""
+        con, cursor = connect(read_only=True)
+        try:
+            cursor.execute(query, (reviewerID,))
+            names = [col[0] for col in cursor.description]
+            while True:
+                rows = cursor.fetchmany(EXPORT_BATCH)
+                if not rows:
+                    break
+                yield "".join(json.dumps(dict(zip(names, row))) + "\n" for row in rows)
+        finally:
+            # the client may have gone before the last row, the rest is discarded before pooling
+            con.consume_results()
+            con.close()
+
+class ReviewerSummaryAPI(Resource):
+    """Number of reviews, average rating and first/last review time of a reviewer
+    Answered from the (reviewerID, unixReviewTime, overall) index alone"""
+    def get(self, reviewerID):
+
+        con, cursor = connect(read_only=True)
+
+        try:
+            cursor.execute("SELECT COUNT(*), AVG(overall), MIN(unixReviewTime), MAX(unixReviewTime) "
+                           "FROM kindle_reviews where reviewerID=%s", (reviewerID,))
+            count, average, first, last = cursor.fetchone()
+            return {"reviewerID": reviewerID,
+                    "count": count,
+                    "average_rating": round(float(average), 2) if average is not None else None,
+                    "first_review_time": first,
+                    "last_review_time": last}, 200
+
+        except Exception as e:
+            print(e)
+            return {"message": "Something goes wrong"}, 500
+
+        finally:
+            con.close()
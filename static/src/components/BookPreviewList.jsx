@@ -29,6 +29,13 @@ const BookPreviewList = (props) => {
     const [totalPage, setTotalPage] = useState(0);
 
     useEffect(() => {
+        // page 1 is already in props.firstPage when the book page endpoint returned it
+        if (props.firstPage && activePage === 1) {
+            setTotalPage(parseInt(props.firstPage.count/6) + 1);
+            setBookList([...props.firstPage.body]);
+            setIsLoading(false);
+            return;
+        }
         const source = axios.CancelToken.source();
 
         const body = { "asinArray": bookProps };
@@ -43,7 +50,7 @@ const BookPreviewList = (props) => {
             setBookList([...res.data.body]);
             setIsLoading(false);
         });
-    }, [getBookPreviewUrl]);
+    }, [getBookPreviewUrl, props.firstPage]);
 
     const onPageChange = (e, pageInfo) => {
         setIsLoading(true);
@@ -46,6 +46,7 @@ class BookDetails extends Component {
         this.state = {
             bookIsLoading: true,
             reviewIsLoading: true,
+            reviewError: false,
 
             bookDetails: null,
             overallRating: {
@@ -69,12 +70,20 @@ class BookDetails extends Component {
 
     componentDidMount() {
         const {match: {params}} = this.props;
-        const bookUrl = `${process.env.API_URL}/book/${params.asin}`;
+        // book details, reviews and rating summary come back in one response
+        const bookPageUrl = `${process.env.API_URL}/book/${params.asin}/page`;
         axios.get(
-            bookUrl
+            bookPageUrl
         )
         .then(res => {
-            this.setState({ bookDetails: res.data });
+            // the first page of also bought previews comes with the book
+            this.setState({
+                bookDetails: res.data.book,
+                relatedPreviews: res.data.related,
+                overallRating: res.data.rating || this.state.overallRating,
+                reviewList: [...(res.data.reviews || [])].reverse(),
+                reviewIsLoading: false
+            });
         })
         .then(res => {
             axios.get(
@@ -85,20 +94,9 @@ class BookDetails extends Component {
                     this.setState({bookIsLoading: false});
             })
         })
-
-        const reviewUrl = `${process.env.API_URL}/reviews/${params.asin}`;
-        axios.get(
-            reviewUrl
-        )
-        .then(res => {
-            this.state.overallRating.total = res.data.reviews.length; 
-            res.data.reviews.map((review, index) => {
-                this.state.overallRating[review.overall]++ 
-            })
-            this.setState({
-                reviewList: [...res.data.reviews].reverse(),
-                reviewIsLoading: false
-            });
+        .catch(err => {
+            console.log(err);
+            this.setState({ reviewIsLoading: false, reviewError: true });
         })
     }
 
@@ -285,6 +283,8 @@ class BookDetails extends Component {
                                             {
                                                 this.state.reviewIsLoading
                                                 ? title_placeholder
+                                                : this.state.reviewError
+                                                ? <Comment content='Reviews could not be loaded, please try again later'/>
                                                 : !this.state.reviewList.length
                                                     ? <Comment content='Be the first one to leave a review!'/>
                                                     : this.state.reviewList.map((review, index) => {
@@ -398,7 +398,7 @@ class BookDetails extends Component {
                         ? <Comment content='This book is forever alone.'/>
                         : !this.state.bookDetails.related.also_bought
                             ? <Comment content='This book is forever alone.'/>
-                            : <BookPreviewList books={this.state.bookDetails.related.also_bought}/>
+                            : <BookPreviewList books={this.state.bookDetails.related.also_bought} firstPage={this.state.relatedPreviews}/>
                 }
                 </Container>
             </Fragment>